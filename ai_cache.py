@@ -0,0 +1,165 @@
+"""
+Process-wide cache for OpenAI completions.
+
+An answer is stored under a content hash of everything that determines it:
+the model, the name and version of the prompt template, and the normalized
+data the prompt is built from (floats rounded to cents, keys sorted,
+whitespace collapsed). Two users, or the same user twice, with the same
+spending summary therefore share one upstream call. Entries expire after
+AI_CACHE_TTL seconds and the least recently used are evicted beyond
+AI_CACHE_MAX_ENTRIES.
+
+Concurrent misses for the same key are coalesced: the first caller makes the
+upstream call and the others wait for its answer instead of sending their own.
+Only successful answers are cached; if the call raises, the waiting callers
+get the same exception and the next request tries again.
+
+Bump a template's version whenever its prompt text changes, so answers to the
+old prompt are not served for the new one.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = int(os.getenv('AI_CACHE_TTL', 6 * 3600))  # seconds
+DEFAULT_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', 2048))
+WAIT_TIMEOUT = 60  # seconds a coalesced caller waits for the in-flight call
+
+
+def normalize(value):
+    """``value`` with floats rounded to cents and strings' whitespace collapsed, recursively"""
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    return value
+
+
+def cache_key(model, template, version, data):
+    """Content hash of (model, prompt template and version, normalized prompt data)"""
+    raw = json.dumps([model, template, version, normalize(data)], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class _Flight:
+    """One upstream call in progress, shared by every caller waiting on its key"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class CompletionCache:
+    """TTL + LRU cache of completion text with per-key request coalescing"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._in_flight = {}  # key -> _Flight
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The cached value, or None if absent or expired. Does not touch the counters."""
+        with self._lock:
+            return self._lookup(key)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value)
+        return value
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """
+        The cached value for ``key``, or ``compute()``'s result, cached. If
+        another thread is already computing ``key`` this waits for its result.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not flight.done.wait(WAIT_TIMEOUT):
+                raise TimeoutError('Timed out waiting for an in-flight AI request')
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        else:
+            with self._lock:
+                self._store(key, flight.value)
+            return flight.value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'hit_rate': round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.coalesced = self.errors = 0
+
+
+completions = CompletionCache()
+
+
+def stats():
+    """Hit, miss and coalescing counters of the process-wide completion cache"""
+    return completions.stats()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Background queue for OpenAI requests.
+
+AI-backed endpoints enqueue a job and answer straight away with its id
+instead of holding a gunicorn worker for the seconds an upstream call takes.
+Jobs live in the ``ai_job`` table, so the queue needs nothing beyond the
+app's own database (SQLite in development). They are run by a small pool of
+worker threads, AI_JOB_WORKERS per web process, started the first time a job
+is enqueued. The threads spend their time waiting on the network, not
+holding the GIL, and they never take a request worker's slot. With
+AI_JOB_WORKERS=0 the web processes only enqueue, and a separate
+``python ai_jobs.py worker`` process runs the jobs.
+
+A job is claimed by a conditional UPDATE from queued to running, so several
+processes can share one queue. A user may have MAX_PENDING_PER_USER jobs
+queued or running (more are refused) and at most MAX_RUNNING_PER_USER
+running at once. Clients poll GET /api/ai/jobs/<id>, which answers at once
+(a long-poll would hold one of the few sync gunicorn workers for as long as
+the job runs), and can cancel a job. A cancelled job that is already
+running finishes its upstream call but its result is discarded. Jobs that
+stay running for longer than JOB_TIMEOUT (a dead worker) are failed, and
+finished jobs are deleted after RETENTION.
+
+Usage:
+    python ai_jobs.py worker [--workers N]   # run jobs in a dedicated process
+    python ai_jobs.py status                 # count jobs by status
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import func, update, delete
+from sqlalchemy.orm import aliased
+from extensions import db
+from models import AIJob, User
+
+WORKERS = int(os.getenv('AI_JOB_WORKERS', 2))
+MAX_PENDING_PER_USER = 5
+MAX_RUNNING_PER_USER = 1
+POLL_INTERVAL = 1.0  # seconds between queue checks when no job was enqueued in this process
+JOB_TIMEOUT = timedelta(minutes=5)
+RETENTION = timedelta(days=1)
+CLEANUP_INTERVAL = 600  # seconds between stale-job and retention sweeps
+
+PENDING = ('queued', 'running')
+FINISHED = ('done', 'failed', 'cancelled')
+
+HANDLERS = {}
+
+log = logging.getLogger(__name__)
+
+_start_lock = threading.Lock()
+_claim_lock = threading.Lock()
+_started_pid = None
+_last_cleanup = 0.0
+_wakeup = threading.Condition()  # notified when this process enqueues or finishes a job
+
+
+class QueueFull(Exception):
+    """The user already has MAX_PENDING_PER_USER jobs queued or running"""
+
+
+def handler(kind):
+    """Register the function that runs jobs of ``kind``: fn(user_id, params) -> JSON-able result"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+@handler('budget_advice')
+def _budget_advice(user_id, params):
+    from openai_integration import get_personalized_budget_advice
+    from ai_resilience import AIUnavailable
+    import budget_tips
+    category = params.get('category') or None
+    try:
+        advice = get_personalized_budget_advice(user_id, category)
+    except AIUnavailable:
+        return dict(budget_tips.static_tips(category), ai_unavailable=True)
+    return {
+        'category': category or 'general',
+        'ai_tip': advice,
+        'is_ai_generated': True
+    }
+
+
+def to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def enqueue(user_id, kind, params=None, app=None):
+    """
+    Queue a job and return it. An identical job (same kind and params) the
+    user already has pending is returned instead of a duplicate.
+    Raises QueueFull when the user has too many pending jobs.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown AI job kind: {kind}')
+    encoded = json.dumps(params or {}, sort_keys=True, separators=(',', ':'))
+    pending = AIJob.query.filter(AIJob.user_id == user_id, AIJob.status.in_(PENDING)).all()
+    for job in pending:
+        if job.kind == kind and job.params == encoded:
+            return job
+    if len(pending) >= MAX_PENDING_PER_USER:
+        raise QueueFull(f'You already have {len(pending)} AI requests in progress')
+
+    job = AIJob(id=uuid.uuid4().hex, user_id=user_id, kind=kind, params=encoded,
+                status='queued', created_at=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    if app is not None:
+        start(app)
+    with _wakeup:
+        _wakeup.notify()
+    return job
+
+
+def get(job_id, user_id):
+    """The user's job with a fresh status, or None"""
+    return AIJob.query.populate_existing().filter_by(id=job_id, user_id=user_id).first()
+
+
+def cancel(job_id, user_id):
+    """Cancel a queued or running job; returns the job (unchanged if it had already finished) or None"""
+    db.session.execute(
+        update(AIJob).where(AIJob.id == job_id, AIJob.user_id == user_id, AIJob.status.in_(PENDING))
+        .values(status='cancelled', finished_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return get(job_id, user_id)
+
+
+def _cleanup():
+    """Fail jobs whose worker died and delete finished jobs past RETENTION"""
+    global _last_cleanup
+    if time.monotonic() - _last_cleanup < CLEANUP_INTERVAL:
+        return
+    _last_cleanup = time.monotonic()
+    now = datetime.utcnow()
+    db.session.execute(
+        update(AIJob).where(AIJob.status == 'running', AIJob.started_at < now - JOB_TIMEOUT)
+        .values(status='failed', error='Timed out', finished_at=now)
+    )
+    db.session.execute(delete(AIJob).where(AIJob.status.in_(FINISHED), AIJob.finished_at < now - RETENTION))
+    db.session.commit()
+
+
+def claim():
+    """Move the oldest queued job whose user is below MAX_RUNNING_PER_USER to running; returns its id or None"""
+    with _claim_lock:
+        _cleanup()
+        busy_users = db.select(AIJob.user_id).where(AIJob.status == 'running').group_by(
+            AIJob.user_id).having(func.count() >= MAX_RUNNING_PER_USER)
+        candidates = db.session.query(AIJob.id, AIJob.user_id).filter(
+            AIJob.status == 'queued', AIJob.user_id.not_in(busy_users)
+        ).order_by(AIJob.created_at).limit(5).all()
+        running = aliased(AIJob)
+        for job_id, user_id in candidates:
+            # Another process may have claimed this job, a user cancelled it or one of the
+            # user's other jobs started since the SELECT, so the UPDATE checks all three.
+            # Locking the user's row makes a concurrent claim for the same user wait until
+            # this one commits (SQLite serialises writers anyway and ignores FOR UPDATE).
+            db.session.query(User.id).filter(User.id == user_id).with_for_update().first()
+            running_count = db.select(func.count()).select_from(running).where(
+                running.user_id == user_id, running.status == 'running').scalar_subquery()
+            claimed = db.session.execute(
+                update(AIJob).where(AIJob.id == job_id, AIJob.status == 'queued',
+                                    running_count < MAX_RUNNING_PER_USER)
+                .values(status='running', started_at=datetime.utcnow())
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return job_id
+        db.session.commit()
+        return None
+
+
+def run(job_id):
+    """Run a claimed job and record its outcome, unless it was cancelled meanwhile"""
+    job = db.session.get(AIJob, job_id)
+    try:
+        result = HANDLERS[job.kind](job.user_id, json.loads(job.params))
+        values = {'status': 'done', 'result': json.dumps(result)}
+    except Exception as e:
+        db.session.rollback()
+        log.exception("AI job failed", extra={'job_id': job_id, 'kind': job.kind})
+        values = {'status': 'failed', 'error': str(e)[:200]}
+    db.session.execute(
+        update(AIJob).where(AIJob.id == job_id, AIJob.status == 'running')
+        .values(finished_at=datetime.utcnow(), **values)
+    )
+    db.session.commit()
+    # The user may have queued jobs that were held back by MAX_RUNNING_PER_USER
+    with _wakeup:
+        _wakeup.notify_all()
+
+
+def _work(app):
+    while True:
+        try:
+            with app.app_context():
+                job_id = claim()
+                if job_id is not None:
+                    run(job_id)
+        except Exception as e:
+            log.exception("AI job worker error")
+            job_id = None
+        if job_id is None:
+            with _wakeup:
+                _wakeup.wait(POLL_INTERVAL)
+
+
+def start(app, workers=None):
+    """Start this process's worker threads once (again after a fork); a no-op with AI_JOB_WORKERS=0"""
+    global _started_pid
+    workers = WORKERS if workers is None else workers
+    if workers <= 0 or _started_pid == os.getpid():
+        return []
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return []
+        _started_pid = os.getpid()
+        threads = [threading.Thread(target=_work, args=(app,), name=f'ai-job-{i}', daemon=True)
+                   for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run or inspect the AI job queue')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    worker = subparsers.add_parser('worker', help='Run queued AI jobs in this process')
+    worker.add_argument('--workers', type=int, default=max(WORKERS, 1))
+    subparsers.add_parser('status', help='Count jobs by status')
+    args = parser.parse_args(argv)
+
+    from app import app
+
+    if args.command == 'status':
+        with app.app_context():
+            counts = db.session.query(AIJob.status, func.count()).group_by(AIJob.status).all()
+        for status, count in sorted(counts):
+            print(f"{status:<10} {count}")
+        return 0
+
+    print(f"Running AI jobs with {args.workers} worker threads")
+    for thread in start(app, args.workers):
+        thread.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Metering for upstream OpenAI calls.
+
+Every chat completion goes through ``call()``, which:
+
+* refuses the call with SpendLimitExceeded once the user has spent
+  AI_USER_DAILY_BUDGET dollars today, or all users together
+  AI_DAILY_BUDGET. Both default to 0, which turns the ceiling off; render.yaml
+  sets them for production. The check runs before the call,
+  so calls already in flight when the ceiling is reached still complete and
+  can overshoot it;
+* times the call into a per-template latency histogram;
+* reads prompt and completion tokens from the response's ``usage`` field and
+  prices them with PRICES;
+* adds the call to the user's row for the day in ``ai_usage`` and logs one
+  structured record per call (see app_logging).
+
+Cached answers (ai_cache) never reach call(), so they are free and do not
+count towards the ceiling. The histograms are per process; ``ai_usage`` is
+shared, and ``python ai_metering.py report`` prints it.
+
+Usage:
+    python ai_metering.py report [--days N]   # spend per day from ai_usage
+"""
+
+import argparse
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import case, func
+from extensions import db
+from models import AIUsage
+
+# USD per 1,000 (prompt, completion) tokens
+PRICES = {
+    'gpt-3.5-turbo': (0.0015, 0.002),
+    'gpt-4o-mini': (0.00015, 0.0006),
+    'gpt-4o': (0.005, 0.015),
+    'gpt-4': (0.03, 0.06),
+}
+DEFAULT_PRICE = PRICES['gpt-4']  # unknown models are priced high rather than free
+USER_DAILY_BUDGET = float(os.getenv('AI_USER_DAILY_BUDGET', 0))  # 0: no ceiling
+DAILY_BUDGET = float(os.getenv('AI_DAILY_BUDGET', 0))
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+NO_USER = 0  # ai_usage row for calls made outside any user's request
+
+log = logging.getLogger(__name__)
+
+
+class SpendLimitExceeded(Exception):
+    """Today's AI spend ceiling has been reached"""
+
+
+class Histogram:
+    """Call counts per latency bucket (the last bucket is everything above LATENCY_BUCKETS_MS)"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile (None if it is the open last bucket)"""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+
+class _Meter:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.refused = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+
+_meters = {}  # template -> _Meter
+_lock = threading.Lock()
+
+
+def cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = PRICES.get(model, DEFAULT_PRICE)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def _usage(response):
+    usage = getattr(response, 'usage', None) or {}
+    return int(usage.get('prompt_tokens', 0)), int(usage.get('completion_tokens', 0))
+
+
+def spent_today(user_id=None):
+    """Dollars spent today by ``user_id``, or by everyone if it is None"""
+    return _spent_today(user_id)[0 if user_id is not None else 1]
+
+
+def _spent_today(user_id):
+    """(dollars spent today by ``user_id``, by everyone) in one query"""
+    stmt = db.select(
+        func.coalesce(func.sum(case((AIUsage.user_id == user_id, AIUsage.cost), else_=0.0)), 0.0),
+        func.coalesce(func.sum(AIUsage.cost), 0.0),
+    ).where(AIUsage.day == datetime.utcnow().date())
+    # A short-lived connection of its own: metering must not hold one across the upstream call
+    with db.engine.connect() as conn:
+        return tuple(conn.execute(stmt).one())
+
+
+def check_budget(user_id):
+    """Raise SpendLimitExceeded if the user or the whole app is out of today's budget"""
+    check_user = USER_DAILY_BUDGET > 0 and user_id
+    if not check_user and DAILY_BUDGET <= 0:
+        return
+    user_spent, all_spent = _spent_today(user_id)
+    if check_user and user_spent >= USER_DAILY_BUDGET:
+        raise SpendLimitExceeded(f"Daily AI budget of ${USER_DAILY_BUDGET:.2f} reached for user {user_id}")
+    if DAILY_BUDGET > 0 and all_spent >= DAILY_BUDGET:
+        raise SpendLimitExceeded(f"Daily AI budget of ${DAILY_BUDGET:.2f} reached")
+
+
+def _upsert_statement(dialect_name):
+    table = AIUsage.__table__
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.user_id],
+        set_={column: table.c[column] + stmt.excluded[column]
+              for column in ('calls', 'errors', 'prompt_tokens', 'completion_tokens', 'cost')},
+    )
+
+
+def _store(user_id, errors, prompt_tokens, completion_tokens, dollars):
+    """Add one call to the user's row for today, on its own connection so the caller's session is untouched"""
+    values = {
+        'day': datetime.utcnow().date(), 'user_id': user_id or NO_USER, 'calls': 1, 'errors': errors,
+        'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'cost': dollars,
+    }
+    table = AIUsage.__table__
+    with db.engine.begin() as conn:
+        dialect_name = conn.dialect.name
+        if dialect_name in ('postgresql', 'sqlite'):
+            conn.execute(_upsert_statement(dialect_name), values)
+        else:
+            key = (table.c.day == values['day']) & (table.c.user_id == values['user_id'])
+            updated = conn.execute(table.update().where(key).values(
+                **{column: table.c[column] + values[column]
+                   for column in ('calls', 'errors', 'prompt_tokens', 'completion_tokens', 'cost')}
+            )).rowcount
+            if not updated:
+                conn.execute(table.insert().values(**values))
+
+
+def call(user_id, template, model, create):
+    """
+    Run ``create()`` (an upstream chat completion) metered and within budget;
+    returns its response. Raises SpendLimitExceeded without calling it when a
+    ceiling is reached, and re-raises whatever the call raises.
+    """
+    with _lock:
+        meter = _meters.setdefault(template, _Meter())
+    try:
+        check_budget(user_id)
+    except SpendLimitExceeded:
+        with _lock:
+            meter.refused += 1
+        raise
+
+    start = time.perf_counter()
+    try:
+        response = create()
+    except Exception as e:
+        ms = (time.perf_counter() - start) * 1000
+        with _lock:
+            meter.latency.add(ms)
+            meter.errors += 1
+        _store(user_id, 1, 0, 0, 0.0)
+        log.info("OpenAI call failed: %s", e, extra={
+            'template': template, 'user_id': user_id, 'model': model, 'ms': round(ms)})
+        raise
+
+    ms = (time.perf_counter() - start) * 1000
+    prompt_tokens, completion_tokens = _usage(response)
+    dollars = cost(model, prompt_tokens, completion_tokens)
+    with _lock:
+        meter.latency.add(ms)
+        meter.prompt_tokens += prompt_tokens
+        meter.completion_tokens += completion_tokens
+        meter.cost += dollars
+    _store(user_id, 0, prompt_tokens, completion_tokens, dollars)
+    log.info("OpenAI call", extra={
+        'template': template, 'user_id': user_id, 'model': model, 'ms': round(ms),
+        'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'cost': round(dollars, 6)})
+    return response
+
+
+def snapshot():
+    """Per-template latency histogram, token and cost totals for this process"""
+    with _lock:
+        return {
+            template: {
+                'calls': meter.latency.total,
+                'errors': meter.errors,
+                'refused': meter.refused,
+                'mean_ms': round(meter.latency.sum_ms / meter.latency.total, 1) if meter.latency.total else None,
+                'p50_ms': meter.latency.quantile(0.5),
+                'p95_ms': meter.latency.quantile(0.95),
+                'histogram': dict(zip([f'<={b}' for b in meter.latency.bounds] + ['>'], meter.latency.counts)),
+                'prompt_tokens': meter.prompt_tokens,
+                'completion_tokens': meter.completion_tokens,
+                'cost': round(meter.cost, 6),
+            }
+            for template, meter in _meters.items()
+        }
+
+
+def reset():
+    with _lock:
+        _meters.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report OpenAI usage and spend')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    report = subparsers.add_parser('report', help='Spend per day from ai_usage')
+    report.add_argument('--days', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    from app import app
+
+    with app.app_context():
+        since = datetime.utcnow().date() - timedelta(days=args.days - 1)
+        rows = db.session.query(
+            AIUsage.day, func.count(AIUsage.user_id), func.sum(AIUsage.calls), func.sum(AIUsage.errors),
+            func.sum(AIUsage.prompt_tokens), func.sum(AIUsage.completion_tokens), func.sum(AIUsage.cost)
+        ).filter(AIUsage.day >= since).group_by(AIUsage.day).order_by(AIUsage.day).all()
+    print(f"{'day':<11} {'users':>6} {'calls':>7} {'errors':>7} {'prompt tok':>11} {'compl. tok':>11} {'cost $':>9}")
+    for day, users, calls, errors, prompt_tokens, completion_tokens, dollars in rows:
+        print(f"{str(day):<11} {users:>6} {calls:>7} {errors:>7} {prompt_tokens:>11,} "
+              f"{completion_tokens:>11,} {dollars:>9.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Deadlines, retries and a circuit breaker for upstream OpenAI calls.
+
+``call(attempt)`` runs ``attempt(timeout)`` (one upstream request that must
+give up after ``timeout`` seconds) under three guards:
+
+* a deadline: the whole call, retries and backoff included, takes at most
+  AI_CALL_DEADLINE seconds, and each attempt at most ATTEMPT_TIMEOUT;
+* retries: timeouts, connection errors, rate limits and 5xx responses are
+  retried up to MAX_RETRIES times, with exponential backoff and full jitter.
+  Anything else, such as a bad request, a bad key or the spend ceiling, fails
+  at once;
+* a circuit breaker: after FAILURE_THRESHOLD consecutive calls fail on
+  retryable errors, the breaker opens. For RESET_TIMEOUT seconds every call
+  then fails immediately with CircuitOpen, without touching the network.
+  Then a single trial call is let through (half-open): success closes the
+  breaker, failure opens it again.
+
+Callers catch AIUnavailable (CircuitOpen, or retries exhausted) to fall back
+to non-AI content. The breaker is per process; its state is part of /health.
+"""
+
+import os
+import random
+import threading
+import time
+import openai
+
+DEADLINE = float(os.getenv('AI_CALL_DEADLINE', 20))  # seconds for a whole call, retries included
+ATTEMPT_TIMEOUT = float(os.getenv('AI_ATTEMPT_TIMEOUT', 10))  # seconds for one upstream request
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.5  # seconds before the first retry, doubled each time
+BACKOFF_MAX = 4.0
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30  # seconds the breaker stays open before a trial call
+
+RETRYABLE = (
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+class AIUnavailable(Exception):
+    """The upstream AI service cannot answer right now; fall back to non-AI content"""
+
+
+class CircuitOpen(AIUnavailable):
+    """The circuit breaker is open, so the call was not attempted"""
+
+
+def is_retryable(error):
+    if isinstance(error, RETRYABLE):
+        return True
+    # Generic API errors carry the HTTP status; only server-side failures are worth retrying
+    if isinstance(error, openai.error.APIError):
+        return error.http_status is None or error.http_status >= 500
+    return False
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial call"""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.opened_count = 0
+        self.short_circuited = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allows_requests(self):
+        """Whether a call would be attempted now (does not reserve the half-open trial)"""
+        with self._lock:
+            state = self._state()
+            return state == 'closed' or (state == 'half_open' and not self._trial_in_flight)
+
+    def before_call(self):
+        """Raise CircuitOpen unless the call may go ahead"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.short_circuited += 1
+        raise CircuitOpen('AI service temporarily unavailable')
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    self.opened_count += 1
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """A trial call ended without telling us about upstream health (e.g. a bad request)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def state(self):
+        """Breaker status for health output"""
+        with self._lock:
+            state = self._state()
+            return {
+                'state': state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.opened_count,
+                'short_circuited': self.short_circuited,
+                'retry_in': round(max(self.reset_timeout - (time.monotonic() - self.opened_at), 0), 1)
+                if state == 'open' else None,
+            }
+
+
+breaker = CircuitBreaker()
+
+
+def backoff(retry):
+    """Full-jitter exponential backoff before retry number ``retry`` (1-based)"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (retry - 1)))
+
+
+def call(attempt, deadline=None, attempt_timeout=None, max_retries=None, circuit=None):
+    """
+    ``attempt(timeout)``'s result, retried and guarded as described above
+    (the module settings and breaker unless given). Raises CircuitOpen,
+    AIUnavailable (wrapping the last retryable error), or a non-retryable
+    error unchanged.
+    """
+    deadline = DEADLINE if deadline is None else deadline
+    attempt_timeout = ATTEMPT_TIMEOUT if attempt_timeout is None else attempt_timeout
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    circuit = circuit or breaker
+    circuit.before_call()
+    give_up_at = time.monotonic() + deadline
+    retry = 0
+    while True:
+        remaining = give_up_at - time.monotonic()
+        try:
+            result = attempt(min(attempt_timeout, remaining))
+        except Exception as e:
+            if not is_retryable(e):
+                circuit.release_trial()
+                raise
+            retry += 1
+            pause = backoff(retry)
+            if retry > max_retries or time.monotonic() + pause >= give_up_at - 0.1:
+                circuit.record_failure()
+                raise AIUnavailable(f'AI service unavailable after {retry} attempt(s): {e}') from e
+            time.sleep(pause)
+        else:
+            circuit.record_success()
+            return result
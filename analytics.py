@@ -0,0 +1,136 @@
+"""
+Spending analysis for /api/expenses/analyze.
+
+Everything the endpoint returns (this month's and last month's totals, the
+per-category totals and counts, the six-month trend) comes out of one
+GROUP BY over the monthly spend rollups. Results are cached per user under
+their data version, and the route answers conditional requests with 304 when
+the ETag still matches, so a dashboard load that changes nothing costs a
+single version lookup.
+"""
+
+import hashlib
+from datetime import date, timedelta
+from sqlalchemy import func
+from extensions import db
+from models import Category, SpendRollup
+from data_version import VersionedCache
+
+TREND_MONTHS = 6
+
+_cache = VersionedCache()
+
+
+def add_months(month, count):
+    """First day of the month ``count`` months after (or before, if negative) ``month``"""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_end(month):
+    return add_months(month, 1) - timedelta(days=1)
+
+
+def etag_for(user_id, version, today):
+    # The payload depends on the current month, so the date is part of the tag
+    raw = f"analyze:{user_id}:{version}:{today.isoformat()}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _monthly_category_totals(user_id, first_month, last_month):
+    return db.session.query(
+        SpendRollup.period_start,
+        Category.name,
+        func.sum(SpendRollup.total),
+        func.sum(SpendRollup.count)
+    ).join(Category, Category.id == SpendRollup.category_id).filter(
+        SpendRollup.user_id == user_id,
+        SpendRollup.granularity == 'month',
+        SpendRollup.period_start.between(first_month, last_month)
+    ).group_by(SpendRollup.period_start, Category.name).all()
+
+
+def build_analysis(user_id, today):
+    """Compute the analysis payload from a single aggregate query"""
+    start_of_month = today.replace(day=1)
+    last_month_start = add_months(start_of_month, -1)
+    month_starts = [add_months(start_of_month, -i) for i in range(TREND_MONTHS)]
+
+    month_totals = {month: 0 for month in month_starts}
+    categories = {}
+    category_counts = {}
+    for period, name, total, count in _monthly_category_totals(user_id, month_starts[-1], start_of_month):
+        if isinstance(period, str):
+            period = date.fromisoformat(period)
+        month_totals[period] = month_totals.get(period, 0) + total
+        if period == start_of_month:
+            categories[name] = round(categories.get(name, 0) + total, 2)
+            category_counts[name] = category_counts.get(name, 0) + count
+
+    current_month_total = round(month_totals[start_of_month], 2)
+    last_month_total = round(month_totals[last_month_start], 2)
+
+    # Calculate percentage change only if both months have data, otherwise handle specially
+    if last_month_total > 0 and current_month_total > 0:
+        percent_change = ((current_month_total - last_month_total) / last_month_total) * 100
+    elif last_month_total == 0 and current_month_total > 0:
+        percent_change = 100  # Special case: no expenses last month, but we have expenses this month
+    elif last_month_total > 0 and current_month_total == 0:
+        percent_change = -100  # Special case: had expenses last month, but none this month
+    else:
+        percent_change = 0  # Special case: no expenses in either month
+
+    if categories:
+        highest_name, highest_amount = max(categories.items(), key=lambda x: x[1])
+        highest_percentage = round((highest_amount / current_month_total * 100), 1) if current_month_total else 0
+    else:
+        highest_name, highest_amount, highest_percentage = 'None', 0, 0
+
+    if category_counts:
+        most_frequent_name, most_frequent_count = max(category_counts.items(), key=lambda x: x[1])
+    else:
+        most_frequent_name, most_frequent_count = 'None', 0
+
+    # Oldest month first (better for charts)
+    monthly_trend = [
+        {'month': month.strftime('%b'), 'total': round(month_totals[month], 2)}
+        for month in reversed(month_starts)
+    ]
+
+    return {
+        'current_month_total': current_month_total,
+        'last_month_total': last_month_total,
+        'percent_change': round(percent_change, 1),
+        'highest_category': {
+            'name': highest_name,
+            'amount': highest_amount,
+            'percentage': highest_percentage
+        },
+        'most_frequent': {
+            'name': most_frequent_name,
+            'count': most_frequent_count
+        },
+        'categories': categories,
+        'monthly_trend': monthly_trend,
+        'period': {
+            'current_month': {
+                'start': start_of_month.strftime('%d-%m-%Y'),
+                'end': month_end(start_of_month).strftime('%d-%m-%Y'),
+                'name': start_of_month.strftime('%B %Y')
+            },
+            'last_month': {
+                'start': last_month_start.strftime('%d-%m-%Y'),
+                'end': month_end(last_month_start).strftime('%d-%m-%Y'),
+                'name': last_month_start.strftime('%B %Y')
+            }
+        }
+    }
+
+
+def cached_analysis(user_id, version, today):
+    """Analysis payload for the user, recomputed only when their data version changes"""
+    key = (user_id, today)
+    payload = _cache.get(key, version)
+    if payload is None:
+        payload = _cache.set(key, version, build_analysis(user_id, today))
+    return payload
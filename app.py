@@ -1,23 +1,44 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, Response, stream_with_context
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-import pandas as pd
-import io
+import json
+import logging
 import os
+import tempfile
 import openai
 import random
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
-import plotly.express as px
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import Table, TableStyle
-from reportlab.lib import colors
+from datetime import datetime
 from extensions import db, login_manager
-from models import User, Category, Expense
+from models import User, Expense
 from forms import LoginForm, RegisterForm, ExpenseForm, ExpenseFilterForm, SearchForm
+import migrations
+import rollups
+import category_registry
+import query_counter
+import data_version
+import analytics
+import pagination
+import search
+import exports
+import importer
+import expense_batch
+import finmate_parser
+import chat_state
+import user_identity
+import app_logging
+import pdf_report
+import expense_charts
+import chart
+import forecast
+import ai_jobs
+import ai_metering
+import ai_resilience
+import budget_tips
 import uuid
 from werkzeug.utils import secure_filename
+from itsdangerous import BadSignature
+from sqlalchemy import text
 
 # Load environment variables
 load_dotenv(dotenv_path="key.env")
@@ -30,6 +51,7 @@ else:
 # Define allowed file extensions and upload folder
 UPLOAD_FOLDER = 'static/uploads/receipts'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf'}
+VIEW_PAGE_SIZE = 50  # expense rows per page on /view_expenses
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'ZmNkZTQzY2YzMTg0YjEwYjA3Zjk1YjY0MzZlYjFlNmU=')
@@ -48,8 +70,8 @@ if os.getenv('RENDER'):
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
         print("Warning: DATABASE_URL not found or invalid. Using SQLite database as fallback.")
 else:
-    # Use SQLite for local development
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+    # Use SQLite for local development (the test suite points this at a scratch file)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///site.db')
     print("Using SQLite database for development")
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -58,9 +80,15 @@ app.config['PERMANENT_SESSION_LIFETIME'] = 1800  # 30 minutes
 app.config['SESSION_PERMANENT'] = True
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
+app.config['MAX_PAGE_SIZE'] = int(os.getenv('MAX_PAGE_SIZE', pagination.DEFAULT_MAX_PAGE_SIZE))
 
 db.init_app(app)
 login_manager.init_app(app)
+query_counter.init_app(app)
+app_logging.init_app(app)
+
+log = logging.getLogger('app')
+chat_log = logging.getLogger('app.finmate')  # per-turn debug records; enable with LOG_LEVELS=app.finmate=DEBUG
 
 # Create upload directory if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -73,32 +101,11 @@ def initialize_database():
     for attempt in range(max_retries):
         try:
             with app.app_context():
-                db.create_all()
-                
-                # Check if global categories already exist
-                if Category.query.filter_by(user_id=None).count() == 0:
-                    # Create default global categories
-                    default_categories = [
-                        "Food",
-                        "Transport",
-                        "Entertainment",
-                        "Bills",
-                        "Shopping",
-                        "Health",
-                        "Education",
-                        "Travel",
-                        "Housing",
-                        "Others"
-                    ]
-                    
-                    for category_name in default_categories:
-                        category = Category(name=category_name, user_id=None)
-                        db.session.add(category)
-                    
-                    db.session.commit()
-                    print(f"Added {len(default_categories)} default categories")
+                applied = migrations.upgrade()
+                if applied:
+                    print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
                 
-                print("Database tables created successfully")
+                print("Database schema is up to date")
                 return True
                 
         except Exception as e:
@@ -120,7 +127,8 @@ if not initialize_database():
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Id and username only, cached per worker; see user_identity.py
+    return user_identity.load(user_id)
 
 
 # Helper function to check if a file has allowed extension
@@ -137,30 +145,18 @@ def home():
 @login_required
 def dashboard():
     form = ExpenseForm()
-    user_categories = Category.query.filter_by(user_id=current_user.id).all()
-    global_categories = Category.query.filter_by(user_id=None).all()
-    
-    all_categories = []
-    for cat in user_categories:
-        all_categories.append((str(cat.id), cat.name))
-    for cat in global_categories:
-        all_categories.append((str(cat.id), cat.name))
-    
-    form.category.choices = all_categories
+    form.category.choices = category_registry.choices(current_user.id, as_str=True)
     
     today = datetime.now().date()
-    today_expenses = Expense.query.filter_by(user_id=current_user.id).filter(Expense.date == today).all()
-    today_total = sum(expense.amount for expense in today_expenses)
-    
-    month_start = datetime(today.year, today.month, 1).date()
-    month_end = (datetime(today.year, today.month+1, 1) - timedelta(days=1)).date() if today.month < 12 else datetime(today.year, 12, 31).date()
-    month_expenses = Expense.query.filter_by(user_id=current_user.id).filter(Expense.date.between(month_start, month_end)).all()
-    month_total = sum(expense.amount for expense in month_expenses)
+    today_total = rollups.period_total(current_user.id, 'day', today)
+    month_total = rollups.period_total(current_user.id, 'month', rollups.month_start(today))
     
     today_total = f"₹{today_total:,.2f}"
     month_total = f"₹{month_total:,.2f}"
     
-    expenses = Expense.query.filter_by(user_id=current_user.id).order_by(Expense.date.desc()).limit(5).all()
+    expenses = Expense.query.filter_by(user_id=current_user.id).options(
+        db.joinedload(Expense.expense_category)
+    ).order_by(Expense.date.desc()).limit(5).all()
     return render_template('dashboard.html', form=form, expenses=expenses, today_total=today_total, month_total=month_total)
 
 
@@ -168,26 +164,16 @@ def dashboard():
 @login_required
 def add_expense():
     form = ExpenseForm()
-    user_categories = Category.query.filter_by(user_id=current_user.id).all()
-    global_categories = Category.query.filter_by(user_id=None).all()
-    
-    all_categories = []
-    for cat in user_categories:
-        all_categories.append((str(cat.id), cat.name))
-    for cat in global_categories:
-        all_categories.append((str(cat.id), cat.name))
-    
-    form.category.choices = all_categories
+    form.category.choices = category_registry.choices(current_user.id, as_str=True)
     
     if form.validate_on_submit():
-        category_id = form.category.data
-        category = Category.query.get(int(category_id))
+        category_id = int(form.category.data)
+        category_name = category_registry.name_for(category_id, current_user.id)
         
         expense_date = form.date.data
         current_time = datetime.now().time()
         
         amount = form.amount.data
-        category_name = category.name
         auto_notes = generate_expense_notes(category_name, amount, expense_date)
 
         receipt_path = None
@@ -212,7 +198,7 @@ def add_expense():
             date=expense_date,
             time=current_time,
             notes=auto_notes,
-            category_id=category.id,
+            category_id=category_id,
             user_id=current_user.id,
             receipt_path=receipt_path
         )
@@ -223,7 +209,9 @@ def add_expense():
         flash('Expense added successfully!', 'success')
         return redirect(url_for('dashboard'))
 
-    expenses = Expense.query.filter_by(user_id=current_user.id).all()
+    expenses = Expense.query.filter_by(user_id=current_user.id).options(
+        db.joinedload(Expense.expense_category)
+    ).all()
     return render_template('dashboard.html', form=form, expenses=expenses)
 
 # Helper function to generate notes automatically
@@ -275,86 +263,109 @@ def generate_expense_notes(category, amount, date):
 def view_expenses():
     form = ExpenseFilterForm(request.args, meta={'csrf': False})
     
-    user_categories = Category.query.filter_by(user_id=current_user.id).all()
-    global_categories = Category.query.filter_by(user_id=None).all()
-    
-    all_categories = [(0, 'All')]
-    for cat in user_categories:
-        all_categories.append((cat.id, cat.name))
-    for cat in global_categories:
-        all_categories.append((cat.id, cat.name))
-    
-    form.category.choices = all_categories
+    form.category.choices = category_registry.choices(current_user.id, include_all=True)
 
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    category_id = int(request.args.get('category', 0))
+    category_id = request.args.get('category', 0, type=int)
+    page = request.args.get('page', 1, type=int)
 
-    query = Expense.query.filter_by(user_id=current_user.id)
-
-    if start_date and end_date:
-        try:
-            start = datetime.strptime(start_date, '%d-%m-%Y')
-            end = datetime.strptime(end_date, '%d-%m-%Y')
-            query = query.filter(Expense.date.between(start, end))
-        except ValueError:
-            flash('Invalid date range.', 'danger')
-            return redirect(url_for('view_expenses'))
-
-    if category_id > 0:
-        query = query.filter_by(category_id=category_id)
+    try:
+        start, end = exports.parse_date_range(start_date, end_date)
+    except ValueError:
+        flash('Invalid date range.', 'danger')
+        return redirect(url_for('view_expenses'))
 
-    expenses = query.order_by(Expense.date.desc()).all()
+    query = exports.filter_expenses(Expense.query, current_user.id, start, end, category_id)
+    # Only one page of rows is rendered; the charts cover the whole filter from the rollups
+    expense_page = query.options(db.joinedload(Expense.expense_category)).order_by(
+        Expense.date.desc(), Expense.id.desc()
+    ).paginate(page=page, per_page=VIEW_PAGE_SIZE, error_out=False)
 
-    if not expenses:
+    charts = expense_charts.cached_charts(
+        current_user.id, data_version.current(current_user.id), start, end, category_id
+    )
+    if charts is None:
         flash('No expenses found for the selected filters.', 'info')
 
-    data = []
-    for expense in expenses:
-        category_name = expense.expense_category.name if expense.expense_category else 'Uncategorized'
-        data.append({
-            'Amount': expense.amount,
-            'Category': category_name,
-            'Date': expense.date
-        })
-
-    df_expenses = pd.DataFrame(data)
-
-    if df_expenses.empty:
-        flash('No data entered for this category.', 'info')
-        return render_template(
-            'view_expenses.html',
-            expenses=expenses,
-            form=form,
-            start_date=start_date,
-            end_date=end_date,
-            categories=form.category.choices,
-            selected_category=category_id,
-            pie_chart_html=None,
-            bar_chart_html=None
-        )
-
-    df_expenses['Date'] = pd.to_datetime(df_expenses['Date'], errors='coerce')
-    df_expenses = df_expenses.dropna(subset=['Date'])
-
-    pie_chart = px.pie(df_expenses, names='Category', values='Amount', title="Expenses by Category")
-    bar_chart = px.bar(df_expenses, x='Date', y='Amount', title="", color='Category')
-
-    bar_chart_html = bar_chart.to_html(full_html=False)
-
     return render_template(
         'view_expenses.html',
-        expenses=expenses,
+        expenses=expense_page.items,
+        pagination=expense_page if expense_page.pages > 1 else None,
         form=form,
         start_date=start_date,
         end_date=end_date,
         categories=form.category.choices,
         selected_category=category_id,
-        pie_chart_html=pie_chart.to_html(full_html=False),
-        bar_chart_html=bar_chart_html
+        charts=charts,
+        plotly_js_version=expense_charts.plotly_js_version() if charts else None
     )
 
 
+@app.route('/vendor/plotly-<version>.min.js')
+def plotly_js(version):
+    """The bundled plotly.js, gzip-compressed once and cached by browsers for a year"""
+    if version != expense_charts.plotly_js_version():
+        return redirect(url_for('plotly_js', version=expense_charts.plotly_js_version()))
+    if 'gzip' not in request.accept_encodings:
+        return send_file(expense_charts.PLOTLY_JS_PATH, mimetype='application/javascript', max_age=31536000)
+    response = Response(expense_charts.plotly_js_gzip(), mimetype='application/javascript')
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.set_etag(version)
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
+
+
+@app.route('/charts/<kind>.png')
+def chart_image(kind):
+    """
+    A chart as a PNG. Logged-in users get their own expenses, filtered like
+    /view_expenses; a signed ``token`` (see chart_image_url) carries the user
+    and filter instead, so the image also loads where there is no session.
+    """
+    if kind not in chart.KINDS:
+        return jsonify({'success': False, 'error': 'Unknown chart'}), 404
+    if not chart.available():
+        return jsonify({'success': False, 'error': 'Chart images require the matplotlib package'}), 503
+
+    token = request.args.get('token')
+    if token:
+        try:
+            user_id, start_date, end_date, category_id = chart.load_params(app.config['SECRET_KEY'], token)
+        except BadSignature:
+            return jsonify({'success': False, 'error': 'Invalid or expired chart link'}), 403
+    elif current_user.is_authenticated:
+        user_id = current_user.id
+        start_date, end_date = request.args.get('start_date'), request.args.get('end_date')
+        category_id = request.args.get('category', 0, type=int)
+    else:
+        return login_manager.unauthorized()
+
+    try:
+        start, end = exports.parse_date_range(start_date, end_date)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid date range'}), 400
+
+    width, height = chart.clamp_size(request.args.get('width', type=int), request.args.get('height', type=int))
+    data = chart.chart_data(kind, expense_charts.summarize(user_id, start, end, category_id))
+    etag = chart.cache_key(kind, data, width, height)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        etag, png = chart.render_png(kind, data, width, height)
+        response = app.response_class(png, mimetype='image/png')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    return response
+
+
+def chart_image_url(user_id, kind, start_date=None, end_date=None, category_id=0):
+    """Absolute, signed URL of a chart image that works without logging in (for emails)"""
+    token = chart.sign_params(app.config['SECRET_KEY'], user_id, start_date, end_date, category_id)
+    return url_for('chart_image', kind=kind, token=token, _external=True)
+
+
 @app.route('/delete_expense/<int:expense_id>', methods=['POST'])
 @login_required
 def delete_expense(expense_id):
@@ -371,85 +382,59 @@ def delete_expense(expense_id):
 @app.route('/export_csv')
 @login_required
 def export_csv():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
+    try:
+        start, end = exports.parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+    except ValueError:
+        flash('Invalid date range.', 'danger')
+        return redirect(url_for('view_expenses'))
+    category_id = request.args.get('category', 0, type=int)
+    compress = request.args.get('gzip') == '1'
+
+    # Rows are fetched in batches and written out as they arrive
+    chunks = exports.csv_chunks(exports.expense_rows(current_user.id, start, end, category_id))
+    filename = 'expenses.csv'
+    mimetype = 'text/csv'
+    if compress:
+        chunks = exports.gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@app.route('/export_parquet', defaults={'export_format': 'parquet'})
+@app.route('/export_arrow', defaults={'export_format': 'arrow'})
+@login_required
+def export_columnar(export_format):
+    if not exports.columnar_available():
+        flash('Parquet and Arrow exports require the pyarrow package.', 'danger')
+        return redirect(url_for('view_expenses'))
+    try:
+        start, end = exports.parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+    except ValueError:
+        flash('Invalid date range.', 'danger')
+        return redirect(url_for('view_expenses'))
+    category_id = request.args.get('category', 0, type=int)
 
-    query = Expense.query.filter_by(user_id=current_user.id)
-    if start_date and end_date:
-        try:
-            start = datetime.strptime(start_date, '%d-%m-%Y')
-            end = datetime.strptime(end_date, '%d-%m-%Y')
-            query = query.filter(Expense.date.between(start, end))
-        except ValueError:
-            flash('Invalid date range.', 'danger')
-            return redirect(url_for('view_expenses'))
-
-    expenses = query.all()
-    data = [({
-        'Amount': e.amount,
-        'Date': e.date.strftime('%d-%m-%Y'),
-        'Category': e.expense_category.name,
-        'Notes': e.notes or '',
-        'Time': e.time.strftime('%H:%M:%S')
-    }) for e in expenses]
-
-    df = pd.DataFrame(data)
-    output = io.StringIO()
-    df.to_csv(output, index=False)
-    output.seek(0)
-    return send_file(io.BytesIO(output.read().encode()), mimetype='text/csv',
-                     as_attachment=True, download_name='expenses.csv')
+    filename, mimetype = exports.COLUMNAR_FORMATS[export_format]
+    buffer = tempfile.SpooledTemporaryFile(max_size=exports.SPOOL_MAX_SIZE)
+    exports.write_columnar(buffer, export_format, current_user.id, start, end, category_id)
+    buffer.seek(0)
+    return send_file(buffer, as_attachment=True, download_name=filename, mimetype=mimetype)
 
 
 @app.route('/export_pdf')
 @login_required
 def export_pdf():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    category_id = request.args.get('category')
-
-    query = Expense.query.filter_by(user_id=current_user.id)
-
-    if start_date and end_date:
-        try:
-            start = datetime.strptime(start_date, '%d-%m-%Y')
-            end = datetime.strptime(end_date, '%d-%m-%Y')
-            query = query.filter(Expense.date.between(start, end))
-        except ValueError:
-            flash('Invalid date range.', 'danger')
-            return redirect(url_for('view_expenses'))
-
-    expenses = query.all()
+    try:
+        start, end = exports.parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+    except ValueError:
+        flash('Invalid date range.', 'danger')
+        return redirect(url_for('view_expenses'))
+    category_id = request.args.get('category', 0, type=int)
 
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    c.drawString(100, 750, "Expense Report")
-    
-    data = []
-    for expense in expenses:
-        category_name = expense.expense_category.name if expense.expense_category else 'Uncategorized'
-        data.append([ 
-            expense.date.strftime('%d-%m-%Y'),
-            category_name,
-            f"{expense.amount:.2f}",
-            expense.notes
-        ])
-
-    table = Table([['Date', 'Category', 'Amount', 'Notes']] + data)
-    table.setStyle(TableStyle([ 
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-    ]))
-
-    table.wrapOn(c, 30, 600)
-    table.drawOn(c, 30, 500)
-
-    c.save()
+    buffer = tempfile.SpooledTemporaryFile(max_size=exports.SPOOL_MAX_SIZE)
+    pdf_report.build_report(buffer, current_user.id, start, end, category_id)
     buffer.seek(0)
     return send_file(buffer, as_attachment=True, download_name='expense_report.pdf', mimetype='application/pdf')
 
@@ -461,7 +446,7 @@ def login():
 
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
+        user = User.query.options(db.undefer(User.password)).filter_by(username=form.username.data).first()
         if user and check_password_hash(user.password, form.password.data):
             login_user(user, remember=form.remember.data)
             flash('Login successful!', 'success')
@@ -496,282 +481,144 @@ def register():
 
     return render_template('register.html', form=form)
 
+
+def add_chat_expenses(user_id, expenses):
+    """
+    Add the expenses parsed from one chat message in a single transaction
+    (through expense_batch, so rollups and the data version stay in step),
+    together with whatever the session already holds, such as the chat
+    state transition. Returns (amount, category, date, notes) per expense.
+    """
+    now = datetime.now().strftime('%H:%M:%S')
+    added = [(expense.amount, expense.category, expense.date,
+              generate_expense_notes(expense.category, expense.amount, expense.date)) for expense in expenses]
+    operations = [
+        {'op': 'create', 'amount': amount, 'date': date.strftime('%d-%m-%Y'), 'time': now,
+         'category': category, 'notes': notes}
+        for amount, category, date, notes in added
+    ]
+    results, applied = expense_batch.apply_operations(user_id, operations, atomic=True)
+    if not applied:
+        raise ValueError(next(result['error'] for result in results if not result['success']))
+    return added
+
+
 @app.route("/finmate", methods=["POST"])
 @login_required
 def finmate():
     user_input = request.json.get("input")
     
-    # Simple approach: Store each piece directly in the session
-    if 'conversation_state' not in session:
-        session['conversation_state'] = "initial"
-    
-    conversation_state = session['conversation_state']
-    print(f"Current state: {conversation_state}, Input: {user_input}")
-    print(f"Session data: amount={session.get('amount')}, category={session.get('category')}, date={session.get('date')}")
+    # The conversation lives server-side in chat_state, not in the session cookie
+    conversation = chat_state.load(current_user.id)
+    conversation_state = conversation.state
+    if chat_log.isEnabledFor(logging.DEBUG):
+        chat_log.debug("FinMate turn", extra={
+            'state': conversation_state, 'input': user_input,
+            'amount': conversation.amount, 'category': conversation.category,
+        })
 
-    # First, try to detect direct expense statements like "I spent ₹500 on food"
-    # or "₹200 for transport" before going into the conversation flow
-    import re
-    
-    # Patterns for expense detection
-    amount_pattern = r'₹?\s*(\d+(?:\.\d+)?)'  # Matches ₹500, 500, 500.50
-    category_words = ['food', 'groceries', 'transport', 'transportation', 'travel', 'bills', 'entertainment', 'health', 'shopping', 'others']
-    
-    # Multiple patterns to capture different ways of expressing expenses
-    spent_pattern = re.compile(fr'(?:spent|paid|bought|cost|costs|purchased|{amount_pattern}).*?{amount_pattern}.*?(?:on|for)?\s*(' + '|'.join(category_words) + ')', re.IGNORECASE)
-    category_first_pattern = re.compile(fr'(' + '|'.join(category_words) + r').*?(?:cost|costs|came to|for|is|was)?\s*{amount_pattern}', re.IGNORECASE)
-    
-    # Check if the user input matches direct expense patterns
-    spent_match = spent_pattern.search(user_input)
-    category_first_match = category_first_pattern.search(user_input)
-    only_amount_match = re.match(f'^{amount_pattern}$', user_input)
-    
-    if spent_match:
-        # Extract amount and category from "spent X on Y" pattern
-        amount = float(spent_match.group(2) or spent_match.group(1))
-        category = spent_match.group(3).capitalize()
-        
-        # Map similar categories
-        if category.lower() in ['groceries', 'grocery']:
-            category = 'Food'
-        elif category.lower() in ['transportation', 'travel']:
-            category = 'Transport'
-            
-        # Set values in session
-        session['amount'] = amount
-        session['category'] = category
-        session['date'] = datetime.now().strftime("%d-%m-%Y")  # Default to today
-        
-        # Jump directly to processing the expense
+    try:
+        return finmate_turn(conversation, user_input)
+    except chat_state.StaleConversation:
+        # Another message from this user was handled while this one was (e.g. a double submit)
+        return jsonify({"response": "Your previous message is still being handled. Please send this one again."})
+
+
+def finmate_turn(conversation, user_input):
+    """Reply to one chat message, moving ``conversation`` along"""
+    conversation_state = conversation.state
+
+    # First, pick out direct expense statements like "I spent ₹500 on food" or
+    # "₹200 food and ₹50 transport" before going into the conversation flow
+    expenses = finmate_parser.parse(user_input)
+    only_amount = finmate_parser.amount_only(user_input)
+
+    if any(expense.date is None for expense in expenses):
+        # The message has a date that does not exist ("31-02-2026"): never file it under today
+        if len(expenses) == 1:
+            amount, category_name, _ = expenses[0]
+            chat_state.advance(conversation, "waiting_for_date", amount=amount, category=category_name)
+            return jsonify({"response": f"That date doesn't exist. Please provide the date of the ₹{amount} {category_name} expense (DD-MM-YYYY)."})
+        return jsonify({"response": "A date in that message doesn't exist, so nothing was added. Please send it again with valid dates (DD-MM-YYYY)."})
+
+    if expenses:
+        # The reset commits with the expenses, so a message submitted twice at once adds them once
+        chat_state.reset(conversation, commit=False)
         try:
-            # Auto-generate notes
-            date = datetime.now().date()
-            auto_notes = generate_expense_notes(category, amount, date)
-            
-            # Find or create category
-            category_obj = Category.query.filter_by(name=category, user_id=current_user.id).first()
-            if not category_obj:
-                # Try global category
-                category_obj = Category.query.filter_by(name=category, user_id=None).first()
-                
-                if not category_obj:
-                    # Create new category
-                    category_obj = Category(name=category, user_id=current_user.id)
-                    db.session.add(category_obj)
-                    db.session.commit()  # Commit to ensure category has an ID
-            
-            # Create expense
-            expense = Expense(
-                amount=amount,
-                date=date,
-                time=datetime.now().time(),
-                notes=auto_notes,
-                category_id=category_obj.id,
-                user_id=current_user.id
-            )
-            db.session.add(expense)
-            db.session.commit()
-            
-            # Reset the session
-            session.pop('conversation_state', None)
-            session.pop('amount', None)
-            session.pop('category', None)
-            session.pop('date', None)
-            
-            return jsonify({
-                "response": f"Expense added successfully! Amount: ₹{amount}, Category: {category}, Date: {date.strftime('%d-%m-%Y')}, Notes: {auto_notes}"
-            })
-            
+            added = add_chat_expenses(current_user.id, expenses)
         except Exception as e:
-            print(f"Error adding expense: {str(e)}")
-            # Reset the session
-            session.pop('conversation_state', None)
-            session.pop('amount', None)
-            session.pop('category', None)
-            session.pop('date', None)
+            chat_log.exception("Error adding expense")
+            db.session.rollback()
+            chat_state.reset(conversation)
             return jsonify({"response": f"An error occurred: {str(e)}. Let's start over. Please enter the amount."})
-    
-    elif category_first_match:
-        # Extract from "Category cost X" pattern
-        category = category_first_match.group(1).capitalize()
-        amount = float(category_first_match.group(2))
-        
-        # Map similar categories
-        if category.lower() in ['groceries', 'grocery']:
-            category = 'Food'
-        elif category.lower() in ['transportation', 'travel']:
-            category = 'Transport'
-            
-        # Process exactly as above
-        session['amount'] = amount
-        session['category'] = category
-        session['date'] = datetime.now().strftime("%d-%m-%Y")  # Default to today
-        
-        try:
-            # Auto-generate notes
-            date = datetime.now().date()
-            auto_notes = generate_expense_notes(category, amount, date)
-            
-            # Find or create category
-            category_obj = Category.query.filter_by(name=category, user_id=current_user.id).first()
-            if not category_obj:
-                # Try global category
-                category_obj = Category.query.filter_by(name=category, user_id=None).first()
-                
-                if not category_obj:
-                    # Create new category
-                    category_obj = Category(name=category, user_id=current_user.id)
-                    db.session.add(category_obj)
-                    db.session.commit()  # Commit to ensure category has an ID
-            
-            # Create expense
-            expense = Expense(
-                amount=amount,
-                date=date,
-                time=datetime.now().time(),
-                notes=auto_notes,
-                category_id=category_obj.id,
-                user_id=current_user.id
-            )
-            db.session.add(expense)
-            db.session.commit()
-            
-            # Reset the session
-            session.pop('conversation_state', None)
-            session.pop('amount', None)
-            session.pop('category', None)
-            session.pop('date', None)
-            
+
+        if len(added) == 1:
+            amount, category, date, auto_notes = added[0]
             return jsonify({
                 "response": f"Expense added successfully! Amount: ₹{amount}, Category: {category}, Date: {date.strftime('%d-%m-%Y')}, Notes: {auto_notes}"
             })
-            
-        except Exception as e:
-            print(f"Error adding expense: {str(e)}")
-            # Reset the session
-            session.pop('conversation_state', None)
-            session.pop('amount', None)
-            session.pop('category', None)
-            session.pop('date', None)
-            return jsonify({"response": f"An error occurred: {str(e)}. Let's start over. Please enter the amount."})
-    
-    elif only_amount_match and conversation_state == "initial":
+        lines = [f"₹{amount} {category} on {date.strftime('%d-%m-%Y')}" for amount, category, date, _ in added]
+        return jsonify({"response": f"{len(added)} expenses added successfully! " + "; ".join(lines)})
+
+    elif only_amount is not None and conversation_state == "initial":
         # Just an amount was entered, assume it's the start of an expense addition
-        try:
-            amount = float(only_amount_match.group(1))
-            session['amount'] = amount
-            session['conversation_state'] = "waiting_for_category"
-            return jsonify({"response": f"Amount ₹{amount} recorded. Now, what's the category of this expense?"})
-        except ValueError:
-            return jsonify({"response": "Please enter a valid amount."})
+        chat_state.advance(conversation, "waiting_for_category", amount=only_amount)
+        return jsonify({"response": f"Amount ₹{only_amount} recorded. Now, what's the category of this expense?"})
 
     # Handle initial "add expense" commands to start the flow
     if conversation_state == "initial" and (
         user_input.lower().startswith("add an expense") or 
         user_input.lower().startswith("add expense")
     ):
-        session['conversation_state'] = "waiting_for_amount"
+        chat_state.advance(conversation, "waiting_for_amount")
         return jsonify({"response": "Let's add an expense. Please enter the amount."})
 
     # Regular flow handling
     if conversation_state == "waiting_for_amount":
-        try:
-            amount = float(user_input)
-            session['amount'] = amount
-            session['conversation_state'] = "waiting_for_category"
-            return jsonify({"response": f"Amount ₹{amount} recorded. Now, what's the category of this expense?"})
-        except ValueError:
+        if only_amount is None:
             return jsonify({"response": "Please enter a valid amount."})
+        chat_state.advance(conversation, "waiting_for_category", amount=only_amount)
+        return jsonify({"response": f"Amount ₹{only_amount} recorded. Now, what's the category of this expense?"})
     
     elif conversation_state == "waiting_for_category":
-        category_name = user_input.strip().capitalize()
+        category_name = user_input.strip()
+        category_name = finmate_parser.CATEGORY_SYNONYMS.get(category_name.lower(), category_name.capitalize())
         if not category_name:
             category_name = "Others"
         
-        session['category'] = category_name
-        session['conversation_state'] = "waiting_for_date"
+        chat_state.advance(conversation, "waiting_for_date", category=category_name)
         return jsonify({"response": f"Category: {category_name}. Now, please provide the date (DD-MM-YYYY)."})
     
     elif conversation_state == "waiting_for_date":
         try:
-            date_obj = datetime.strptime(user_input, "%d-%m-%Y").date()
-            session['date'] = user_input
-            
-            # Process the expense immediately instead of asking for notes
-            try:
-                # Get stored expense data
-                amount = session.get('amount')
-                category_name = session.get('category')
-                date_str = session.get('date')
-                
-                print(f"Final data: amount={amount}, category={category_name}, date={date_str}")
-                
-                if not amount or not category_name or not date_str:
-                    # Reset session
-                    session.pop('conversation_state', None)
-                    session.pop('amount', None)
-                    session.pop('category', None)
-                    session.pop('date', None)
-                    return jsonify({"response": "Missing some required data. Let's start over. Please enter the amount."})
-                
-                # Convert date string to date object
-                date = datetime.strptime(date_str, "%d-%m-%Y").date()
-                
-                # Auto-generate notes
-                auto_notes = generate_expense_notes(category_name, amount, date)
-                
-                # Find or create category
-                category = Category.query.filter_by(name=category_name, user_id=current_user.id).first()
-                if not category:
-                    # Try global category
-                    category = Category.query.filter_by(name=category_name, user_id=None).first()
-                    
-                    if not category:
-                        # Create new category
-                        category = Category(name=category_name, user_id=current_user.id)
-                        db.session.add(category)
-                        db.session.commit()  # Commit to ensure category has an ID
-                
-                # Create expense
-                expense = Expense(
-                    amount=amount,
-                    date=date,
-                    time=datetime.now().time(),
-                    notes=auto_notes,
-                    category_id=category.id,
-                    user_id=current_user.id
-                )
-                db.session.add(expense)
-                db.session.commit()
-                
-                # Reset the session
-                session.pop('conversation_state', None)
-                session.pop('amount', None)
-                session.pop('category', None)
-                session.pop('date', None)
-                
-                return jsonify({
-                    "response": f"Expense added successfully! Amount: ₹{amount}, Category: {category_name}, Date: {date_str}, Notes: {auto_notes}"
-                })
-                
-            except Exception as e:
-                print(f"Error adding expense: {str(e)}")
-                # Reset the session
-                session.pop('conversation_state', None)
-                session.pop('amount', None)
-                session.pop('category', None)
-                session.pop('date', None)
-                return jsonify({"response": f"An error occurred: {str(e)}. Let's start over. Please enter the amount."})
-                
+            date = datetime.strptime(user_input.strip(), "%d-%m-%Y").date()
         except ValueError:
             return jsonify({"response": "Please enter the date in DD-MM-YYYY format."})
+
+        amount, category_name = conversation.amount, conversation.category
+        chat_log.debug("FinMate expense complete", extra={'amount': amount, 'category': category_name, 'date': date})
+        if not amount or not category_name:
+            chat_state.reset(conversation)
+            return jsonify({"response": "Missing some required data. Let's start over. Please enter the amount."})
+
+        # Process the expense immediately instead of asking for notes
+        chat_state.reset(conversation, commit=False)
+        try:
+            added = add_chat_expenses(current_user.id, [finmate_parser.ParsedExpense(amount, category_name, date)])
+        except Exception as e:
+            chat_log.exception("Error adding expense")
+            db.session.rollback()
+            chat_state.reset(conversation)
+            return jsonify({"response": f"An error occurred: {str(e)}. Let's start over. Please enter the amount."})
+
+        auto_notes = added[0][3]
+        return jsonify({
+            "response": f"Expense added successfully! Amount: ₹{amount}, Category: {category_name}, Date: {date.strftime('%d-%m-%Y')}, Notes: {auto_notes}"
+        })
     
     else:
         # Initial state - start conversation
-        session['conversation_state'] = "waiting_for_amount"
-        session.pop('amount', None)
-        session.pop('category', None)
-        session.pop('date', None)
+        chat_state.advance(conversation, "waiting_for_amount", amount=None, category=None)
         return jsonify({"response": "Let's start by adding an expense. Please enter the amount."})
 
 
@@ -787,10 +634,14 @@ def get_expenses():
     """API endpoint to get user expenses"""
     try:
         # Get query parameters
-        limit = request.args.get('limit', default=5, type=int)
+        limit = pagination.clamp_limit(request.args.get('limit', default=5, type=int), app.config['MAX_PAGE_SIZE'])
+        cursor = request.args.get('cursor')
         
-        # Query expenses
-        expenses = Expense.query.filter_by(user_id=current_user.id).order_by(Expense.date.desc()).limit(limit).all()
+        # Query one page of expenses, newest first
+        query = Expense.query.filter_by(user_id=current_user.id).options(
+            db.joinedload(Expense.expense_category)
+        )
+        expenses, next_cursor = pagination.paginate(query, limit, cursor)
         
         # Format data
         result = []
@@ -806,9 +657,16 @@ def get_expenses():
         
         return jsonify({
             'success': True,
-            'data': result
+            'data': result,
+            'next_cursor': next_cursor
         })
     
+    except pagination.InvalidCursor as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
     except Exception as e:
         return jsonify({
             'success': False,
@@ -821,141 +679,23 @@ def get_expenses():
 def analyze_expenses():
     """API endpoint to analyze user expenses"""
     try:
-        # Get current month
-        today = datetime.today()
-        start_of_month = datetime(today.year, today.month, 1)
-        end_of_month = (datetime(today.year, today.month + 1, 1) if today.month < 12 
-                        else datetime(today.year + 1, 1, 1)) - timedelta(days=1)
+        today = datetime.today().date()
         
-        # Last month
-        if today.month == 1:
-            last_month_start = datetime(today.year - 1, 12, 1)
-            last_month_end = datetime(today.year, 1, 1) - timedelta(days=1)
+        # One cheap lookup decides whether anything changed since the client's copy
+        version = data_version.current(current_user.id)
+        etag = analytics.etag_for(current_user.id, version, today)
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
         else:
-            last_month_start = datetime(today.year, today.month - 1, 1)
-            last_month_end = start_of_month - timedelta(days=1)
-        
-        # Get expenses for the time periods with proper date filtering
-        current_month_expenses = Expense.query.filter_by(user_id=current_user.id).filter(
-            Expense.date >= start_of_month,
-            Expense.date <= end_of_month
-        ).all()
-        
-        last_month_expenses = Expense.query.filter_by(user_id=current_user.id).filter(
-            Expense.date >= last_month_start,
-            Expense.date <= last_month_end
-        ).all()
-        
-        # Calculate totals with proper handling of no expenses
-        current_month_total = sum(expense.amount for expense in current_month_expenses) if current_month_expenses else 0
-        last_month_total = sum(expense.amount for expense in last_month_expenses) if last_month_expenses else 0
-        
-        # Calculate percentage change only if both months have data, otherwise handle specially
-        if last_month_total > 0 and current_month_total > 0:
-            percent_change = ((current_month_total - last_month_total) / last_month_total) * 100
-        elif last_month_total == 0 and current_month_total > 0:
-            percent_change = 100  # Special case: no expenses last month, but we have expenses this month
-        elif last_month_total > 0 and current_month_total == 0:
-            percent_change = -100  # Special case: had expenses last month, but none this month
-        else:
-            percent_change = 0  # Special case: no expenses in either month
-        
-        # Get expense distribution by category
-        categories = {}
-        category_counts = {}
-        
-        # Process current month expenses for categories
-        for expense in current_month_expenses:
-            category_name = expense.expense_category.name if expense.expense_category else 'Uncategorized'
-            
-            # Update category totals
-            if category_name in categories:
-                categories[category_name] += expense.amount
-            else:
-                categories[category_name] = expense.amount
-            
-            # Update category counts
-            if category_name in category_counts:
-                category_counts[category_name] += 1
-            else:
-                category_counts[category_name] = 1
-        
-        # Find highest spending category with proper checks
-        if categories:
-            highest_category = max(categories.items(), key=lambda x: x[1])
-            highest_name, highest_amount = highest_category
-            highest_percentage = round((highest_amount / current_month_total * 100), 1) if current_month_total else 0
-        else:
-            highest_name, highest_amount, highest_percentage = 'None', 0, 0
-        
-        # Find most frequent category with proper checks
-        if category_counts:
-            most_frequent = max(category_counts.items(), key=lambda x: x[1])
-            most_frequent_name, most_frequent_count = most_frequent
-        else:
-            most_frequent_name, most_frequent_count = 'None', 0
-        
-        # Get prior months data for trends (last 6 months)
-        monthly_totals = []
-        for i in range(6):
-            if today.month - i <= 0:
-                month_num = today.month - i + 12
-                year_num = today.year - 1
-            else:
-                month_num = today.month - i
-                year_num = today.year
-                
-            month_start = datetime(year_num, month_num, 1)
-            month_end = (datetime(year_num, month_num + 1, 1) if month_num < 12 
-                        else datetime(year_num + 1, 1, 1)) - timedelta(days=1)
-                
-            month_expenses = Expense.query.filter_by(user_id=current_user.id).filter(
-                Expense.date >= month_start,
-                Expense.date <= month_end
-            ).all()
-            
-            month_total = sum(expense.amount for expense in month_expenses)
-            month_name = month_start.strftime('%b')  # Abbreviated month name
-            
-            monthly_totals.append({
-                'month': month_name,
-                'total': month_total
+            response = jsonify({
+                'success': True,
+                'data': analytics.cached_analysis(current_user.id, version, today)
             })
         
-        # Reverse so most recent month is last (better for charts)
-        monthly_totals.reverse()
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'current_month_total': current_month_total,
-                'last_month_total': last_month_total,
-                'percent_change': round(percent_change, 1),
-                'highest_category': {
-                    'name': highest_name,
-                    'amount': highest_amount,
-                    'percentage': highest_percentage
-                },
-                'most_frequent': {
-                    'name': most_frequent_name,
-                    'count': most_frequent_count
-                },
-                'categories': categories,
-                'monthly_trend': monthly_totals,
-                'period': {
-                    'current_month': {
-                        'start': start_of_month.strftime('%d-%m-%Y'),
-                        'end': end_of_month.strftime('%d-%m-%Y'),
-                        'name': start_of_month.strftime('%B %Y')
-                    },
-                    'last_month': {
-                        'start': last_month_start.strftime('%d-%m-%Y'),
-                        'end': last_month_end.strftime('%d-%m-%Y'),
-                        'name': last_month_start.strftime('%B %Y')
-                    }
-                }
-            }
-        })
+        response.set_etag(etag)
+        # Let the browser keep the body but revalidate it on every dashboard load
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     
     except Exception as e:
         app.logger.error(f"Error in analyze_expenses: {str(e)}")
@@ -965,6 +705,72 @@ def analyze_expenses():
         }), 500
 
 
+@app.route('/api/expenses/import', methods=['POST'])
+@login_required
+def import_expenses():
+    """API endpoint to bulk import expenses from an uploaded CSV or JSONL file (optionally .gz)"""
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({
+            'success': False,
+            'error': 'No file selected'
+        }), 400
+
+    file = request.files['file']
+    file_format = request.form.get('format') or importer.detect_format(file.filename)
+    if file_format not in ('csv', 'jsonl'):
+        return jsonify({
+            'success': False,
+            'error': 'Unsupported file type. Upload a .csv or .jsonl file, or pass format=csv|jsonl'
+        }), 400
+
+    user_id = current_user.id
+    text = importer.open_text(file.stream, file.filename)
+
+    # Clients that accept NDJSON get a progress line after every chunk, then the summary
+    if request.accept_mimetypes.best == 'application/x-ndjson':
+        def generate():
+            report = importer.ImportReport()
+            for report in importer.iter_import(user_id, text, file_format):
+                yield json.dumps({'processed': report.processed, 'imported': report.imported,
+                                  'duplicates': report.duplicates, 'error_count': report.error_count}) + '\n'
+            yield json.dumps({'success': True, 'done': True, **report.to_dict()}) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    report = importer.import_expenses(user_id, text, file_format)
+    return jsonify({'success': True, **report.to_dict()})
+
+
+@app.route('/api/expenses/batch', methods=['POST'])
+@login_required
+def batch_expenses():
+    """API endpoint to create, update and delete many expenses in one transaction"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    try:
+        results, applied = expense_batch.apply_operations(
+            current_user.id, data.get('operations'), atomic=bool(data.get('atomic', False))
+        )
+    except expense_batch.BatchError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+    return jsonify({
+        'success': applied,
+        'applied': sum(1 for result in results if result['success']),
+        'failed': sum(1 for result in results if not result['success']),
+        'results': results
+    }), 200 if applied else 400
+
+
 @app.route('/api/expenses/<int:expense_id>', methods=['PUT'])
 @login_required
 def update_expense(expense_id):
@@ -986,20 +792,7 @@ def update_expense(expense_id):
             expense.amount = data['amount']
         
         if 'category' in data:
-            category_name = data['category']
-            category = Category.query.filter_by(name=category_name, user_id=current_user.id).first()
-            
-            if not category:
-                # Try global category
-                category = Category.query.filter_by(name=category_name, user_id=None).first()
-                
-                if not category:
-                    # Create new category
-                    category = Category(name=category_name, user_id=current_user.id)
-                    db.session.add(category)
-                    db.session.commit()  # Commit to ensure category has an ID
-            
-            expense.category_id = category.id
+            expense.category_id = category_registry.get_or_create(data['category'], current_user.id)
         
         if 'date' in data:
             try:
@@ -1067,80 +860,33 @@ def get_budget_tips():
         category = request.args.get('category', '').lower()
         use_ai = request.args.get('use_ai', 'false').lower() == 'true'
         
-        # If AI is requested and there's an OpenAI API key, use AI for personalized advice
-        if use_ai and os.getenv("OPENAI_API_KEY"):
-            from openai_integration import get_personalized_budget_advice
-            
-            # Get personalized advice based on spending patterns
-            advice = get_personalized_budget_advice(current_user.id, category if category else None)
-            
+        # If AI is requested and there's an OpenAI API key, queue personalized advice;
+        # the OpenAI call runs on the AI job workers, not on this request worker.
+        # While the circuit breaker is open, answer with the predefined tips at once.
+        ai_requested = use_ai and bool(os.getenv("OPENAI_API_KEY"))
+        if ai_requested and ai_resilience.breaker.allows_requests():
+            try:
+                job = ai_jobs.enqueue(current_user.id, 'budget_advice', {'category': category}, app)
+            except ai_jobs.QueueFull as e:
+                return jsonify({'success': False, 'error': str(e)}), 429
+
             return jsonify({
                 'success': True,
                 'data': {
                     'category': category if category else 'general',
-                    'ai_tip': advice,
+                    'job': ai_jobs.to_dict(job),
+                    'poll_url': url_for('get_ai_job', job_id=job.id),
                     'is_ai_generated': True
                 }
-            })
+            }), 202
         
         # Otherwise, use predefined tips (saves API costs)
-        tips = {
-            'food': [
-                "Plan your meals for the week and make a grocery list",
-                "Cook in bulk and freeze leftovers",
-                "Use cashback apps for grocery shopping",
-                "Limit eating out to once a week",
-                "Bring lunch to work instead of buying"
-            ],
-            'transport': [
-                "Use public transportation when possible",
-                "Consider carpooling with colleagues",
-                "Maintain your vehicle regularly to prevent costly repairs",
-                "Compare gas prices using apps",
-                "Consider biking or walking for short distances"
-            ],
-            'entertainment': [
-                "Look for free events in your community",
-                "Use streaming services instead of cable",
-                "Take advantage of library resources",
-                "Look for happy hour deals and restaurant specials",
-                "Use discount apps for movie tickets and events"
-            ],
-            'bills': [
-                "Review subscriptions and cancel unused ones",
-                "Negotiate with service providers for better rates",
-                "Consider bundling services for discounts",
-                "Switch to energy-efficient appliances",
-                "Use programmable thermostats to reduce energy costs"
-            ],
-            'general': [
-                "Follow the 50/30/20 rule: 50% needs, 30% wants, 20% savings",
-                "Create and stick to a monthly budget",
-                "Set up automatic transfers to savings accounts",
-                "Use cash envelopes for discretionary spending",
-                "Review your budget regularly and adjust as needed"
-            ]
-        }
-        
-        # If category is specified and exists in tips
-        if category and category in tips:
-            return jsonify({
-                'success': True,
-                'data': {
-                    'category': category,
-                    'tips': tips[category],
-                    'is_ai_generated': False
-                }
-            })
-        
-        # Otherwise return general tips
+        data = budget_tips.static_tips(category)
+        if ai_requested:
+            data['ai_unavailable'] = True
         return jsonify({
             'success': True,
-            'data': {
-                'categories': list(tips.keys()),
-                'general_tips': tips['general'],
-                'is_ai_generated': False
-            }
+            'data': data
         })
     
     except Exception as e:
@@ -1150,6 +896,39 @@ def get_budget_tips():
         }), 500
 
 
+@app.route('/api/ai/usage', methods=['GET'])
+@login_required
+def get_ai_usage():
+    """Today's estimated OpenAI spend for the current user, against the daily ceiling"""
+    return jsonify({
+        'success': True,
+        'data': {
+            'spent_today': round(ai_metering.spent_today(current_user.id), 6),
+            'daily_budget': ai_metering.USER_DAILY_BUDGET
+        }
+    })
+
+
+@app.route('/api/ai/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_ai_job(job_id):
+    """Status and result of a queued AI job (answers at once; clients poll with a short backoff)"""
+    job = ai_jobs.get(job_id, current_user.id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'data': ai_jobs.to_dict(job)})
+
+
+@app.route('/api/ai/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_ai_job(job_id):
+    """Cancel a queued or running AI job"""
+    job = ai_jobs.cancel(job_id, current_user.id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'data': ai_jobs.to_dict(job)})
+
+
 @app.route('/api/expenses/search', methods=['GET'])
 @login_required
 def search_expenses():
@@ -1162,20 +941,19 @@ def search_expenses():
         end_date = request.args.get('end_date')
         min_amount = request.args.get('min_amount', type=float)
         max_amount = request.args.get('max_amount', type=float)
-        limit = request.args.get('limit', default=50, type=int)
+        limit = pagination.clamp_limit(request.args.get('limit', default=50, type=int), app.config['MAX_PAGE_SIZE'])
+        cursor = request.args.get('cursor')
+        # 'date' (default) pages newest first; 'relevance' ranks keyword matches
+        sort = request.args.get('sort', 'date')
         
         # Start with the base query
         query = Expense.query.filter_by(user_id=current_user.id)
+        rank = None
         
         # Apply filters if they exist
         if keyword:
-            # Full text search on notes field and case-insensitive category name
-            query = query.join(Category).filter(
-                db.or_(
-                    Expense.notes.ilike(f'%{keyword}%'),
-                    Category.name.ilike(f'%{keyword}%')
-                )
-            )
+            # Indexed prefix search on notes and category names
+            query, rank = search.apply_keyword(query, keyword, current_user.id, ranked=(sort == 'relevance'))
         
         if category_id:
             query = query.filter(Expense.category_id == category_id)
@@ -1197,8 +975,14 @@ def search_expenses():
         if max_amount is not None:
             query = query.filter(Expense.amount <= max_amount)
         
-        # Order by date (newest first) and apply limit
-        expenses = query.order_by(Expense.date.desc()).limit(limit).all()
+        query = query.options(db.joinedload(Expense.expense_category))
+        if sort == 'relevance' and rank is not None:
+            # Best matches first; relevance order is a single page without a cursor
+            expenses = query.order_by(rank.desc(), Expense.date.desc(), Expense.id.desc()).limit(limit).all()
+            next_cursor = None
+        else:
+            # Order by date (newest first) and fetch one page
+            expenses, next_cursor = pagination.paginate(query, limit, cursor)
         
         # Format the response
         result = []
@@ -1216,9 +1000,16 @@ def search_expenses():
         return jsonify({
             'success': True,
             'count': len(result),
-            'data': result
+            'data': result,
+            'next_cursor': next_cursor
         })
     
+    except pagination.InvalidCursor as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1274,7 +1065,7 @@ def upload_receipt(expense_id):
                     if os.path.exists(old_file_path):
                         os.remove(old_file_path)
                 except Exception as e:
-                    print(f"Error removing old receipt: {str(e)}")
+                    log.warning("Error removing old receipt: %s", e)
             
             # Save the file
             file_path = os.path.join(user_upload_dir, unique_filename)
@@ -1310,18 +1101,8 @@ def search_expenses_page():
     """Page for advanced search and filtering of expenses"""
     form = SearchForm(request.args, meta={'csrf': False})
     
-    # Get all categories for the user and global categories for the dropdown
-    user_categories = Category.query.filter_by(user_id=current_user.id).all()
-    global_categories = Category.query.filter_by(user_id=None).all()
-    
-    # Combine them for the dropdown, starting with 'All' option
-    all_categories = [(0, 'All')]
-    for cat in user_categories:
-        all_categories.append((cat.id, cat.name))
-    for cat in global_categories:
-        all_categories.append((cat.id, cat.name))
-    
-    form.category.choices = all_categories
+    # User categories followed by global ones, starting with 'All' option
+    form.category.choices = category_registry.choices(current_user.id, include_all=True)
 
     expenses = []
     search_performed = False
@@ -1331,15 +1112,11 @@ def search_expenses_page():
         search_performed = True
         # Start with base query
         query = Expense.query.filter_by(user_id=current_user.id)
+        rank = None
         
         # Apply filters
         if form.keyword.data:
-            query = query.join(Category).filter(
-                db.or_(
-                    Expense.notes.ilike(f'%{form.keyword.data}%'),
-                    Category.name.ilike(f'%{form.keyword.data}%')
-                )
-            )
+            query, rank = search.apply_keyword(query, form.keyword.data, current_user.id, ranked=True)
         
         if form.category.data and form.category.data > 0:
             query = query.filter(Expense.category_id == form.category.data)
@@ -1358,8 +1135,11 @@ def search_expenses_page():
         if form.max_amount.data is not None:
             query = query.filter(Expense.amount <= form.max_amount.data)
         
-        # Get results
-        expenses = query.order_by(Expense.date.desc()).all()
+        # Get results, best keyword matches first
+        ordering = [Expense.date.desc(), Expense.id.desc()]
+        if rank is not None:
+            ordering.insert(0, rank.desc())
+        expenses = query.options(db.joinedload(Expense.expense_category)).order_by(*ordering).all()
         
         if not expenses:
             flash('No expenses found matching your search criteria.', 'info')
@@ -1441,23 +1221,18 @@ def predict_expenses():
         elif months > 12:
             months = 12
             
-        # Get the user's expense count
-        expense_count = Expense.query.filter_by(user_id=current_user.id).count()
-        
-        # If there are too few expenses, return an informative error
-        if expense_count < 5:
+        method = request.args.get('method', default='auto')
+        if method not in forecast.METHODS:
             return jsonify({
                 'success': False,
-                'message': f"Not enough expense data to make accurate predictions. You currently have {expense_count} expenses, but at least 5 are needed."
-            })
-            
-        # Import the prediction function
-        from openai_integration import predict_future_expenses
-        
-        # Generate predictions
-        result = predict_future_expenses(current_user.id, months)
-        
-        return jsonify(result)
+                'message': f"Unknown method. Use one of: {', '.join(forecast.METHODS)}"
+            }), 400
+
+        # Too little history comes back as success=False with the user's expense count
+        if method == 'auto':
+            # Precomputed nightly by forecast_job.py; recomputed here only if the data changed since
+            return jsonify(forecast.stored_predict(current_user.id, months))
+        return jsonify(forecast.predict(current_user.id, months, method))
     
     except Exception as e:
         app.logger.error(f"Error in predict_expenses: {str(e)}")
@@ -1487,17 +1262,19 @@ def health_check():
     """Health check endpoint to verify database connectivity"""
     try:
         # Test database connection
-        db.session.execute('SELECT 1')
+        db.session.execute(text('SELECT 1'))
         db.session.commit()
         return jsonify({
             'status': 'healthy',
             'database': 'connected',
+            'ai_circuit': ai_resilience.breaker.state(),
             'timestamp': datetime.now().isoformat()
         }), 200
     except Exception as e:
         return jsonify({
             'status': 'unhealthy',
             'database': 'disconnected',
+            'ai_circuit': ai_resilience.breaker.state(),
             'error': str(e),
             'timestamp': datetime.now().isoformat()
         }), 500
@@ -0,0 +1,186 @@
+"""
+Structured, non-blocking logging.
+
+``configure()`` routes every logger through one QueueHandler on the root
+logger. The request thread only checks the level, applies sampling, merges
+the message arguments and tags the record with the current request id. A
+background listener thread formats each record as one JSON line and writes
+it to LOG_FILE (default app.log; ``-`` for stderr). A request therefore
+never waits on the disk, and a call below the logger's level costs a level
+check and nothing else.
+
+Settings (environment):
+
+    LOG_LEVEL          root level, default INFO
+    LOG_LEVELS         per-logger levels, e.g. "app.finmate=DEBUG,ai_metering=WARNING"
+    LOG_DEBUG_SAMPLE   share of DEBUG records kept (0-1, default 1): 0.1 keeps every
+                       tenth record of each logger, for high-volume debug events
+    LOG_FILE           where the JSON lines go
+
+``init_app(app)`` gives every request an id, taken from the X-Request-ID
+header or generated. The id is added to each record logged while handling
+the request and echoed back in the response's X-Request-ID header.
+
+A record looks like:
+    {"ts": "2026-03-13T10:15:02.114Z", "level": "INFO", "logger": "ai_metering",
+     "msg": "OpenAI call", "request_id": "5f0c...", "template": "chat", "ms": 812, ...}
+Anything passed as ``extra=`` becomes a field of its own.
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from flask import g, has_request_context, request
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+MAX_REQUEST_ID_LENGTH = 64
+
+# Attributes every LogRecord has; anything else on a record came from ``extra=``
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'request_id'}
+
+_lock = threading.Lock()
+_listener = None
+_listener_pid = None
+
+
+def parse_levels(spec):
+    """{'logger.name': level} from "name=LEVEL,other=LEVEL" (invalid entries are skipped)"""
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        level = logging.getLevelName(level.strip().upper())
+        if name.strip() and isinstance(level, int):
+            levels[name.strip()] = level
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds')
+            .replace('+00:00', 'Z'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """Keep one in every ``1 / rate`` DEBUG (and lower) records of each logger; higher levels always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._counters = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        if not self.every:
+            return False
+        counter = self._counters.get(record.name)
+        if counter is None:
+            counter = self._counters.setdefault(record.name, itertools.count())
+        # itertools.count is atomic under the GIL, so no lock is needed on this path
+        return next(counter) % self.every == 0
+
+
+class RequestQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread, doing as little as possible on the caller's"""
+
+    def prepare(self, record):
+        # Merge the arguments now (they may change after this call returns) and leave the
+        # JSON formatting to the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = g.get('request_id') if has_request_context() else None
+        return record
+
+
+def _target():
+    path = os.getenv('LOG_FILE', 'app.log')
+    handler = logging.StreamHandler(sys.stderr) if path == '-' else logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def configure(level=None, levels=None, debug_sample=None):
+    """
+    Install the queue handler and start the listener thread (once per process;
+    arguments override the environment). Safe to call repeatedly, and after a
+    fork, where it starts a new listener for the child.
+    """
+    global _listener, _listener_pid
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+        root = logging.getLogger()
+        for handler in [h for h in root.handlers if isinstance(h, RequestQueueHandler)]:
+            root.removeHandler(handler)
+
+        records = queue.SimpleQueue()
+        handler = RequestQueueHandler(records)
+        sample = float(os.getenv('LOG_DEBUG_SAMPLE', 1)) if debug_sample is None else debug_sample
+        if sample < 1:
+            handler.addFilter(DebugSampler(sample))
+        root.addHandler(handler)
+        root.setLevel(level or os.getenv('LOG_LEVEL', 'INFO').upper())
+        for name, logger_level in (parse_levels(os.getenv('LOG_LEVELS')) if levels is None else levels).items():
+            logging.getLogger(name).setLevel(logger_level)
+
+        _listener = logging.handlers.QueueListener(records, _target(), respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def flush():
+    """Stop the listener after it has written everything queued so far (also run at exit)"""
+    global _listener
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener = None
+
+
+atexit.register(flush)
+
+
+def init_app(app):
+    configure()
+
+    @app.before_request
+    def _assign_request_id():
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = incoming[:MAX_REQUEST_ID_LENGTH] if incoming else uuid.uuid4().hex
+
+    @app.after_request
+    def _echo_request_id(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        return response
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark the OpenAI completion cache.
+
+The upstream API is replaced by a fake ChatCompletion.create that sleeps for
+``--latency`` seconds and counts its calls, so no key or network is needed.
+For a user seeded with ``--rows`` expenses this measures budget advice
+requests that are cold, warm (cache hits), and ``--threads`` identical
+requests arriving at once (coalesced into one upstream call).
+
+    python benchmarks/bench_ai_cache.py --rows 100000 --latency 1.5
+"""
+
+import argparse
+import threading
+import time
+from types import SimpleNamespace
+
+import openai
+
+from common import make_app, seed
+from extensions import db
+import ai_cache
+import openai_integration
+import rollups
+
+
+class FakeCompletion:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        message = SimpleNamespace(content='1. Spend less on Category 0.')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def timed_advice(user_id, category=None):
+    start = time.perf_counter()
+    openai_integration.get_personalized_budget_advice(user_id, category)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--latency', type=float, default=1.5)
+    parser.add_argument('--threads', type=int, default=20)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    fake = FakeCompletion(args.latency)
+    openai.ChatCompletion.create = fake.create
+    bench_app = make_app(args.database_url)
+    with bench_app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_id = seed(args.rows, users=1)[0]
+        rollups.rebuild(user_id)
+
+    def in_context(fn, *fn_args):
+        with bench_app.app_context():
+            return fn(*fn_args)
+
+    cold = in_context(timed_advice, user_id)
+    warm = min(in_context(timed_advice, user_id) for _ in range(20))
+    print(f"{'request':<28} {'ms':>9} {'upstream calls':>15}")
+    print(f"{'cold (miss)':<28} {cold:>9.1f} {1:>15}")
+    print(f"{'warm (hit, summary only)':<28} {warm:>9.1f} {0:>15}")
+
+    calls_before = fake.calls
+    threads = [threading.Thread(target=in_context, args=(timed_advice, user_id, 'category 3'))
+               for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{f'{args.threads} concurrent, one key':<28} {elapsed:>9.1f} {fake.calls - calls_before:>15}")
+    print()
+    print(ai_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark the background AI job queue.
+
+The upstream API is replaced by a fake ChatCompletion.create that sleeps for
+``--latency`` seconds. ``--users`` users each request budget advice for
+``--per-user`` categories at once. The script reports how long the
+request-side enqueue takes, compared with the inline call it replaces, and
+how long the job workers need to drain the queue. It also records the most
+jobs any one user had running at the same time, to check the per-user limit.
+
+    python benchmarks/bench_ai_jobs.py --users 10 --per-user 3 --latency 1.0
+"""
+
+import argparse
+import time
+from types import SimpleNamespace
+
+import openai
+
+from common import make_app, seed
+from extensions import db
+from models import AIJob
+import ai_cache
+import ai_jobs
+import openai_integration
+import rollups
+
+
+class FakeCompletion:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        message = SimpleNamespace(content='1. Spend less.')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--per-user', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=ai_jobs.WORKERS)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    openai.ChatCompletion.create = FakeCompletion(args.latency).create
+    bench_app = make_app(args.database_url)
+    with bench_app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_ids = seed(20_000, users=args.users)
+        rollups.rebuild()
+        categories = [f'category {i}' for i in range(args.per_user)]
+
+        start = time.perf_counter()
+        openai_integration.get_personalized_budget_advice(user_ids[0], 'category 9')
+        inline_ms = (time.perf_counter() - start) * 1000
+        ai_cache.completions.clear()
+
+        ai_jobs.start(bench_app, args.workers)
+        timings = []
+        start = time.perf_counter()
+        for user_id in user_ids:
+            for category in categories:
+                begin = time.perf_counter()
+                ai_jobs.enqueue(user_id, 'budget_advice', {'category': category})
+                timings.append((time.perf_counter() - begin) * 1000)
+
+        peak_per_user = 0
+        while True:
+            db.session.expire_all()
+            running = db.session.query(AIJob.user_id, db.func.count()).filter(
+                AIJob.status == 'running').group_by(AIJob.user_id).all()
+            peak_per_user = max([peak_per_user] + [count for _, count in running])
+            if not AIJob.query.filter(AIJob.status.in_(ai_jobs.PENDING)).count():
+                break
+            time.sleep(0.05)
+        drain = time.perf_counter() - start
+        statuses = dict(db.session.query(AIJob.status, db.func.count()).group_by(AIJob.status).all())
+
+    jobs = len(timings)
+    # Bounded by the workers, or by each user's jobs running one after another
+    ideal = max(jobs / args.workers, args.per_user / ai_jobs.MAX_RUNNING_PER_USER) * args.latency
+    print(f"inline advice call (blocks a request worker): {inline_ms:8.1f} ms")
+    print(f"enqueue (request worker time), mean / max:    {sum(timings) / jobs:8.1f} / {max(timings):.1f} ms")
+    print(f"{jobs} jobs drained by {args.workers} workers in {drain:.2f}s "
+          f"(ideal {ideal:.2f}s), statuses {statuses}")
+    print(f"most jobs running at once for one user: {peak_per_user} (limit {ai_jobs.MAX_RUNNING_PER_USER})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Load-test the AI paths offline against openai_stub.py.
+
+Starts the stub server in this process, points the openai client at it and
+sends ``--requests`` distinct prompts (so ai_cache cannot answer them) from
+``--users`` users on ``--concurrency`` threads, through the real
+get_ai_response() with metering. Prints the per-call latency histogram,
+tokens and estimated cost from ai_metering, the ai_usage rows it wrote, and
+how many calls the per-user spend ceiling refused.
+
+    python benchmarks/bench_ai_stub.py --requests 200 --concurrency 20 --error-rate 0.05
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+from common import make_app, seed
+from extensions import db
+from models import AIUsage
+import ai_metering
+import openai_integration
+import openai_stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--user-budget', type=float, default=0.002, help='per-user daily ceiling in USD for the run')
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    stub = openai_stub.make_server(openai_stub.parse_args([
+        '--port', '0', '--latency', str(args.latency), '--jitter', str(args.jitter),
+        '--error-rate', str(args.error_rate),
+    ]))
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    openai.api_base = f'http://127.0.0.1:{stub.server_address[1]}/v1'
+    openai.api_key = openai_integration.openai.api_key = 'stub'
+    ai_metering.USER_DAILY_BUDGET = args.user_budget
+    ai_metering.DAILY_BUDGET = 0
+
+    bench_app = make_app(args.database_url)
+    with bench_app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_ids = seed(0, users=args.users)
+
+    answers = {}
+
+    def ask(i):
+        with bench_app.app_context():
+            answer = openai_integration.get_ai_response(f"Request {i}: how can I spend less on food?",
+                                                        user_id=user_ids[i % len(user_ids)])
+        answers[answer] = answers.get(answer, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(ask, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.requests} requests on {args.concurrency} threads in {elapsed:.2f}s "
+          f"({args.requests / elapsed:.1f} req/s); stub counters {stub.counters}")
+    for template, meter in ai_metering.snapshot().items():
+        print(f"\n{template}: {meter['calls']} calls, {meter['errors']} errors, {meter['refused']} refused by the ceiling")
+        print(f"  latency mean {meter['mean_ms']} ms, p50 <= {meter['p50_ms']} ms, p95 <= {meter['p95_ms']} ms")
+        print(f"  histogram {meter['histogram']}")
+        print(f"  tokens {meter['prompt_tokens']} + {meter['completion_tokens']}, cost ${meter['cost']:.4f}")
+    with bench_app.app_context():
+        rows = AIUsage.query.order_by(AIUsage.user_id).all()
+        print(f"\nai_usage: {len(rows)} rows, "
+              f"{sum(r.calls for r in rows)} calls, ${sum(r.cost for r in rows):.4f}; "
+              f"max per user ${max(r.cost for r in rows):.5f} (ceiling ${args.user_budget})")
+    print(f"answers: " + ", ".join(f"{count} x {answer[:40]!r}" for answer, count in answers.items()))
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Per-request cost of loading the logged-in user.
+
+A scratch app gets one JSON route that only reads ``current_user.id`` (like
+/api/expenses) and the same route without login. Each user loader is timed
+over ``--requests`` test-client requests:
+
+    full       User.query.get with every column, as load_user used to do
+    lean       user_identity with the cache off: one two-column SELECT
+    cached     user_identity with its per-worker cache (the default)
+
+It prints the median time per request, the overhead over the route without
+login, and the SQL statements each request runs.
+
+    python benchmarks/bench_auth.py --requests 3000
+"""
+
+import argparse
+import statistics
+import time
+
+from flask import jsonify
+from flask_login import LoginManager, current_user, login_required
+from sqlalchemy import event
+
+from common import make_app, seed
+from extensions import db
+from models import User
+import user_identity
+
+statements = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    bench_app = make_app(args.database_url)
+    logins = LoginManager(bench_app)
+    mode = {'loader': None}
+
+    def full(user_id):
+        return db.session.get(User, int(user_id), options=[db.undefer(User.password)])
+
+    @logins.user_loader
+    def load_user(user_id):
+        return mode['loader'](user_id)
+
+    @bench_app.route('/api/open')
+    def open_route():
+        return jsonify({'success': True})
+
+    @bench_app.route('/api/me')
+    @login_required
+    def me():
+        return jsonify({'success': True, 'user_id': current_user.id})
+
+    @bench_app.teardown_appcontext
+    def remove_session(exception=None):
+        db.session.remove()
+
+    with bench_app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_id = seed(100, users=50)[0]
+
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count(*_):
+            global statements
+            statements += 1
+
+    client = bench_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    def run(path):
+        global statements
+        client.get(path)  # warm-up
+        samples = []
+        statements = 0
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = client.get(path)
+            samples.append((time.perf_counter() - start) * 1_000_000)
+            assert response.status_code == 200, response.status_code
+        return statistics.median(samples), statements / args.requests
+
+    baseline, _ = run('/api/open')
+    print(f"{'loader':<8} {'us/request':>11} {'auth overhead us':>17} {'SQL/request':>12}")
+    print(f"{'none':<8} {baseline:>11.0f} {'-':>17} {0:>12.1f}")
+    for name, loader in (('full', full), ('lean', user_identity.load), ('cached', user_identity.load)):
+        mode['loader'] = loader
+        user_identity.CACHE_TTL = 30 if name == 'cached' else 0
+        user_identity.invalidate()
+        median, per_request = run('/api/me')
+        print(f"{name:<8} {median:>11.0f} {median - baseline:>17.0f} {per_request:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
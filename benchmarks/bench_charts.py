@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark the /view_expenses charts: the old per-expense plotly.express
+figures against the rollup-based figures in expense_charts.py.
+
+For each size a fresh scratch database is seeded with that many expenses for a
+single user and the rollups are rebuilt. The legacy column is the time and the
+HTML size of px.pie + px.bar over every expense rendered with to_html, as the
+page used to embed them (plotly.js included twice); it is skipped above
+--legacy-max rows. The new columns are the uncached build time, the cached
+lookup time and the size of the figure JSON, which should stay flat.
+
+    python benchmarks/bench_charts.py --sizes 1000 10000 100000 1000000
+"""
+
+import argparse
+import json
+
+import pandas as pd
+import plotly.express as px
+
+from common import make_app, seed, timed
+from extensions import db
+from models import Expense
+import expense_charts
+import rollups
+
+
+def legacy_charts(user_id):
+    """The charts as they were: ORM rows -> DataFrame -> two figures with plotly.js inlined"""
+    expenses = Expense.query.filter_by(user_id=user_id).options(db.joinedload(Expense.expense_category)).all()
+    df = pd.DataFrame([{'Amount': e.amount, 'Category': e.expense_category.name, 'Date': e.date} for e in expenses])
+    df['Date'] = pd.to_datetime(df['Date'])
+    pie = px.pie(df, names='Category', values='Amount', title="Expenses by Category")
+    bar = px.bar(df, x='Date', y='Amount', title="", color='Category')
+    return len(pie.to_html(full_html=False)) + len(bar.to_html(full_html=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-max', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy ms':>10} {'legacy KB':>10} {'build ms':>9} {'cached ms':>10} "
+          f"{'json KB':>8} {'bucket':>7}")
+    for size in args.sizes:
+        bench_app = make_app(args.database_url)
+        with bench_app.app_context():
+            db.drop_all()
+            db.create_all()
+            user_id = seed(size, users=1)[0]
+            rollups.rebuild(user_id)
+
+            legacy_ms, legacy_kb = float('nan'), float('nan')
+            if size <= args.legacy_max:
+                sizes = []
+                legacy_ms = timed(lambda: sizes.append(legacy_charts(user_id)), 1)
+                legacy_kb = sizes[0] / 1024
+                db.session.expunge_all()
+
+            charts = expense_charts.build_charts(user_id)
+            build_ms = timed(lambda: expense_charts.build_charts(user_id), args.repeat)
+            expense_charts.cached_charts(user_id, 1)
+            cached_ms = timed(lambda: expense_charts.cached_charts(user_id, 1), args.repeat)
+            json_kb = len(json.dumps(charts)) / 1024
+            print(f"{size:>10,} {legacy_ms:>10.0f} {legacy_kb:>10,.0f} {build_ms:>9.1f} {cached_ms:>10.3f} "
+                  f"{json_kb:>8.1f} {charts['bucket']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Cost and safety of the server-side FinMate conversation store (chat_state.py).
+
+Prints:
+
+* the size of the signed session cookie with the conversation in it (as
+  /finmate used to keep it) and without;
+* the median time of a chat turn's state handling (load, then advance);
+* a race: ``--threads`` threads load the same conversation and all try to
+  advance it, ``--rounds`` times. Compare-and-set must let exactly one win
+  per round.
+
+    python benchmarks/bench_chat_state.py --threads 8 --rounds 50
+"""
+
+import argparse
+import sys
+import threading
+from datetime import datetime
+
+from flask.sessions import SecureCookieSessionInterface
+
+from common import make_app, seed, timed
+from extensions import db
+from models import ChatState
+import chat_state
+
+
+def cookie_bytes(bench_app, data):
+    return len(SecureCookieSessionInterface().get_signing_serializer(bench_app).dumps(data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--turns', type=int, default=500)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    bench_app = make_app(args.database_url)
+    with bench_app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_ids = seed(100, users=2)
+
+    login = {'_user_id': str(user_ids[0]), '_fresh': True, '_id': 'f' * 128}
+    old = dict(login, conversation_state='waiting_for_date', amount=1234.5,
+               category='Entertainment', date=datetime.now().strftime('%d-%m-%Y'))
+    print(f"session cookie: {cookie_bytes(bench_app, old)} bytes with the conversation, "
+          f"{cookie_bytes(bench_app, login)} without\n")
+
+    states = ['waiting_for_amount', 'waiting_for_category', 'waiting_for_date', chat_state.INITIAL]
+    with bench_app.app_context():
+        turn = iter(range(10 ** 9))
+
+        def one_turn():
+            conversation = chat_state.load(user_ids[0])
+            chat_state.advance(conversation, states[next(turn) % len(states)], amount=250.0)
+
+        ms = timed(one_turn, args.turns)
+    print(f"chat turn (load + advance, one commit): {ms:.2f} ms median over {args.turns}\n")
+
+    user_id = user_ids[1]
+    barrier = threading.Barrier(args.threads)
+    wins, stale = [], []
+
+    def contender(round_number):
+        with bench_app.app_context():
+            conversation = chat_state.load(user_id)
+            barrier.wait()
+            try:
+                chat_state.advance(conversation, f'round_{round_number}')
+                wins.append(round_number)
+            except chat_state.StaleConversation:
+                stale.append(round_number)
+            finally:
+                db.session.remove()
+
+    for round_number in range(args.rounds):
+        threads = [threading.Thread(target=contender, args=(round_number,)) for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    per_round = [wins.count(r) for r in range(args.rounds)]
+    with bench_app.app_context():
+        version = db.session.get(ChatState, user_id).version
+    print(f"race: {args.rounds} rounds x {args.threads} threads -> {len(wins)} transitions applied, "
+          f"{len(stale)} refused as stale; winners per round min {min(per_round)} max {max(per_round)}; "
+          f"final version {version}")
+    return 0 if set(per_round) == {1} and version == args.rounds else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark the columnar exports against CSV: file size, export time and how long
+pandas takes to load the result.
+
+For each size a fresh scratch database is seeded with that many expenses for a
+single user and exported as CSV, Parquet and Arrow. The CSV load parses dates
+and uses a categorical dtype so every format ends up with the same frame.
+
+    python benchmarks/bench_columnar.py --sizes 100000 1000000
+"""
+
+import argparse
+import io
+import time
+
+import pandas as pd
+
+from common import make_app, seed, timed
+from extensions import db
+import exports
+
+
+def export_csv(user_id):
+    return b''.join(exports.csv_chunks(exports.expense_rows(user_id)))
+
+
+def export_columnar(user_id, export_format):
+    return exports.write_columnar(io.BytesIO(), export_format, user_id).getvalue()
+
+
+LOADERS = {
+    'csv': lambda data: pd.read_csv(io.BytesIO(data), parse_dates=['Date'], dayfirst=True,
+                                    dtype={'Category': 'category'}),
+    'parquet': lambda data: pd.read_parquet(io.BytesIO(data)),
+    'arrow': lambda data: pd.read_feather(io.BytesIO(data)),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    if not exports.columnar_available():
+        print("pyarrow is not installed; nothing to compare")
+        return
+
+    print(f"{'rows':>10} {'format':<8} {'size MB':>8} {'vs csv':>7} {'export s':>9} {'load ms':>9}")
+    for size in args.sizes:
+        bench_app = make_app(args.database_url)
+        with bench_app.app_context():
+            db.drop_all()
+            db.create_all()
+            user_id = seed(size, users=1)[0]
+
+            csv_size = None
+            for export_format in ('csv', 'parquet', 'arrow'):
+                db.session.expunge_all()
+                start = time.perf_counter()
+                data = export_csv(user_id) if export_format == 'csv' else export_columnar(user_id, export_format)
+                elapsed = time.perf_counter() - start
+                csv_size = csv_size or len(data)
+                load = timed(lambda: LOADERS[export_format](data), args.repeat)
+                print(f"{size:>10,} {export_format:<8} {len(data) / (1024 * 1024):>8.1f} "
+                      f"{len(data) / csv_size:>6.0%} {elapsed:>9.2f} {load:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark CSV export memory: the old load-everything export against the
+streamed one in exports.py.
+
+For each size a fresh scratch database is seeded with that many expenses for a
+single user, then both exports are consumed end to end while tracemalloc
+records the peak Python memory. The streamed export should stay flat as the
+row count grows.
+
+    python benchmarks/bench_export.py --sizes 100 100000 1000000
+"""
+
+import argparse
+import io
+import time
+import tracemalloc
+
+import pandas as pd
+
+from common import make_app, seed
+from extensions import db
+from models import Expense
+import exports
+
+
+def legacy_export(user_id):
+    """The export as it was before streaming: ORM objects -> dicts -> DataFrame -> bytes"""
+    expenses = Expense.query.filter_by(user_id=user_id).options(db.joinedload(Expense.expense_category)).all()
+    data = [({
+        'Amount': e.amount,
+        'Date': e.date.strftime('%d-%m-%Y'),
+        'Category': e.expense_category.name,
+        'Notes': e.notes or '',
+        'Time': e.time.strftime('%H:%M:%S')
+    }) for e in expenses]
+    output = io.StringIO()
+    pd.DataFrame(data).to_csv(output, index=False)
+    output.seek(0)
+    return io.BytesIO(output.read().encode()).getbuffer().nbytes
+
+
+def streamed_export(user_id, compress=False):
+    chunks = exports.csv_chunks(exports.expense_rows(user_id))
+    if compress:
+        chunks = exports.gzip_chunks(chunks)
+    return sum(len(chunk) for chunk in chunks)
+
+
+def measure(func):
+    """Run ``func`` and return (bytes produced, seconds, peak traced MB)"""
+    db.session.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 100_000, 1_000_000])
+    parser.add_argument('--skip-legacy', action='store_true', help='only measure the streamed export')
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'export':<10} {'output MB':>10} {'seconds':>8} {'peak MB':>8}")
+    for size in args.sizes:
+        bench_app = make_app(args.database_url)
+        with bench_app.app_context():
+            db.drop_all()
+            db.create_all()
+            user_id = seed(size, users=1)[0]
+
+            variants = [('streamed', lambda: streamed_export(user_id)),
+                        ('gzip', lambda: streamed_export(user_id, compress=True))]
+            if not args.skip_legacy:
+                variants.insert(0, ('legacy', lambda: legacy_export(user_id)))
+            for label, func in variants:
+                output, elapsed, peak = measure(func)
+                print(f"{size:>10,} {label:<10} {output / (1024 * 1024):>10.1f} {elapsed:>8.2f} {peak:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
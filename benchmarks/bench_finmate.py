@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Accuracy and speed of the FinMate expense parser on a corpus of chat messages.
+
+finmate_corpus.jsonl (next to this script) holds one utterance per line with
+the expenses it should produce, dated as if today were FRIDAY 2026-03-13:
+
+    {"text": "₹200 food and ₹50 transport", "expenses": [[200.0, "Food", "2026-03-13"], [50.0, "Transport", "2026-03-13"]]}
+
+Every utterance is run through finmate_parser.parse() and through the
+regexes /finmate used before (rebuilt on every call, one expense at most,
+always dated today). The script prints how many utterances each gets exactly
+right and the median time to parse the whole corpus, lists the utterances
+the parser gets wrong, and exits non-zero if there are any.
+
+    python benchmarks/bench_finmate.py [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import date
+
+from common import timed
+import finmate_parser
+
+TODAY = date(2026, 3, 13)
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'finmate_corpus.jsonl')
+
+
+def legacy_parse(user_input):
+    """The expense detection /finmate ran before finmate_parser, reduced to its result"""
+    import re
+
+    amount_pattern = r'₹?\s*(\d+(?:\.\d+)?)'
+    category_words = ['food', 'groceries', 'transport', 'transportation', 'travel', 'bills', 'entertainment', 'health', 'shopping', 'others']
+    spent_pattern = re.compile(fr'(?:spent|paid|bought|cost|costs|purchased|{amount_pattern}).*?{amount_pattern}.*?(?:on|for)?\s*(' + '|'.join(category_words) + ')', re.IGNORECASE)
+    category_first_pattern = re.compile(fr'(' + '|'.join(category_words) + r').*?(?:cost|costs|came to|for|is|was)?\s*{amount_pattern}', re.IGNORECASE)
+
+    spent_match = spent_pattern.search(user_input)
+    category_first_match = category_first_pattern.search(user_input)
+    if spent_match:
+        amount, category = float(spent_match.group(2) or spent_match.group(1)), spent_match.group(3).capitalize()
+    elif category_first_match:
+        amount, category = float(category_first_match.group(2)), category_first_match.group(1).capitalize()
+    else:
+        return []
+    if category.lower() in ['groceries', 'grocery']:
+        category = 'Food'
+    elif category.lower() in ['transportation', 'travel']:
+        category = 'Transport'
+    return [[amount, category, TODAY.isoformat()]]
+
+
+def new_parse(user_input):
+    return [[expense.amount, expense.category, expense.date and expense.date.isoformat()]
+            for expense in finmate_parser.parse(user_input, TODAY)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with open(CORPUS, encoding='utf-8') as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    expenses = sum(len(entry['expenses']) for entry in corpus)
+    multi = sum(len(entry['expenses']) > 1 for entry in corpus)
+    print(f"{len(corpus)} utterances, {expenses} expenses ({multi} messages with more than one)\n")
+
+    print(f"{'parser':<8} {'exact':>7} {'expenses found':>15} {'corpus ms':>10} {'us/msg':>8}")
+    failures = []
+    for name, parse in (('legacy', legacy_parse), ('new', new_parse)):
+        exact = found = 0
+        for entry in corpus:
+            result = parse(entry['text'])
+            found += sum(item in entry['expenses'] for item in result)
+            if result == entry['expenses']:
+                exact += 1
+            elif name == 'new':
+                failures.append((entry, result))
+        ms = timed(lambda: [parse(entry['text']) for entry in corpus], args.repeat)
+        print(f"{name:<8} {exact:>7} {found:>15} {ms:>10.2f} {ms * 1000 / len(corpus):>8.1f}")
+
+    for entry, result in failures:
+        print(f"\nMISMATCH {entry['text']!r}\n  expected {entry['expenses']}\n  got      {result}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark the forecasting engine.
+
+First the NumPy fit alone, on synthetic category x month matrices up to ten
+years by fifty categories, for each method. Then the end-to-end
+forecast.predict() against the old per-row pandas predictor, on a scratch
+database seeded with ``--rows`` expenses for one user.
+
+    python benchmarks/bench_forecast.py --rows 100000
+"""
+
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from common import make_app, seed, timed
+from extensions import db
+from models import Category, Expense
+import forecast
+import rollups
+
+
+def legacy_predict(user_id, months=3):
+    """The core of the old openai_integration.predict_future_expenses"""
+    expenses = db.session.query(
+        Expense.amount, db.func.coalesce(Category.name, 'Uncategorized').label('category'), Expense.date
+    ).outerjoin(Category, Category.id == Expense.category_id).filter(Expense.user_id == user_id).all()
+    df = pd.DataFrame([{'amount': e.amount, 'category': e.category, 'date': e.date} for e in expenses])
+    df['month_year'] = df['date'].apply(lambda x: x.strftime('%Y-%m'))
+    totals = df.groupby(['month_year', 'category'])['amount'].sum().reset_index()
+    recent = totals[totals['month_year'].isin(sorted(df['month_year'].unique())[-3:])]
+    predictions = {}
+    for i in range(1, months + 1):
+        month = (datetime.now() + timedelta(days=30 * i)).strftime('%Y-%m')
+        predictions[month] = {}
+        for category in df['category'].unique():
+            amounts = recent[recent['category'] == category]['amount'].values[-3:]
+            predicted = np.sum(amounts * [0.2, 0.3, 0.5]) if len(amounts) == 3 else amounts.mean() * 1.05
+            predictions[month][category] = round(predicted * np.random.uniform(0.9, 1.1), 2)
+    return predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(3)
+    print(f"{'months':>7} {'categories':>11} {'method':<9} {'used':<9} {'fit ms':>7}")
+    for months, categories in ((12, 10), (36, 20), (120, 50)):
+        history = rng.gamma(2.0, 100.0, size=(categories, months))
+        steps = np.arange(1, 13)
+        for method in ('wma', 'linear', 'seasonal'):
+            used = forecast.fit(history, steps, method)[0]  # seasonal needs two years
+            ms = timed(lambda: forecast.fit(history, steps, method), 50)
+            print(f"{months:>7} {categories:>11} {method:<9} {used:<9} {ms:>7.3f}")
+
+    bench_app = make_app(args.database_url)
+    with bench_app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_id = seed(args.rows, users=1)[0]
+        rollups.rebuild(user_id)
+        db.session.expunge_all()
+        print()
+        print(f"{'rows':>10} {'legacy ms':>10} {'predict ms':>11}")
+        legacy = timed(lambda: legacy_predict(user_id), 3)
+        new = timed(lambda: forecast.predict(user_id, 3), 10)
+        print(f"{args.rows:>10,} {legacy:>10.1f} {new:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Benchmark the nightly forecast job's throughput in users per second.
+
+Seeds a scratch database with ``--rows`` expenses spread over ``--users``
+users, rebuilds the rollups, then runs forecast_job.run() once per
+``--processes`` value (the job prints its own load time and users/s).
+
+    python benchmarks/bench_forecast_job.py --users 5000 --rows 1000000 --processes 1 2 4
+"""
+
+import argparse
+
+from common import make_app, seed
+from extensions import db
+import forecast_job
+import rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=5_000)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--shard-size', type=int, default=500)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    bench_app = make_app(args.database_url)
+    with bench_app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(args.rows, users=args.users)
+        rollups.rebuild()
+        for processes in args.processes:
+            print(f"--- {processes} process(es)")
+            forecast_job.run(processes, args.shard_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark the bulk importer.
+
+Writes a synthetic CSV with ``--rows`` expenses, imports it into a fresh
+scratch database for one user, then imports it again (every row a duplicate).
+Alongside the total time it reports how long the first chunk took (which
+includes reading the fingerprints of existing expenses, in short pages) and
+the longest stretch between two later chunk commits.
+
+    python benchmarks/bench_import.py --rows 500000
+"""
+
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from common import NOTES, VOCABULARY, make_app, seed
+from extensions import db
+import importer
+import search
+
+CATEGORIES = ['Food', 'Transport', 'Bills', 'Shopping', 'Travel', 'Health', 'Gifts', 'Books']
+
+
+def write_csv(path, rows, seed_value=7):
+    rng = random.Random(seed_value)
+    today = date.today()
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Amount', 'Date', 'Category', 'Notes', 'Time'])
+        for _ in range(rows):
+            writer.writerow([
+                round(rng.uniform(10, 5000), 2),
+                (today - timedelta(days=rng.randrange(3 * 365))).strftime('%d-%m-%Y'),
+                rng.choice(CATEGORIES),
+                f"{rng.choice(NOTES)} {rng.choice(VOCABULARY)}",
+                f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:00",
+            ])
+
+
+def timed_import(user_id, path):
+    """
+    Run one import. Returns (report, total seconds, seconds until the first
+    chunk was committed, longest gap between later chunk commits).
+    """
+    marks = [time.perf_counter()]
+    with open(path, 'rb') as binary:
+        report = importer.import_expenses(user_id, importer.open_text(binary, path), 'csv',
+                                          progress=lambda _: marks.append(time.perf_counter()))
+    gaps = [later - earlier for earlier, later in zip(marks[1:], marks[2:])]
+    return report, marks[-1] - marks[0], marks[1] - marks[0], max(gaps, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    handle, path = tempfile.mkstemp(prefix='bench_import_', suffix='.csv')
+    os.close(handle)
+    try:
+        write_csv(path, args.rows)
+        bench_app = make_app(args.database_url)
+        with bench_app.app_context():
+            db.drop_all()
+            db.create_all()
+            search.install()  # imports pay for the search index triggers, as in production
+            user_id = seed(0, users=1)[0]
+
+            print(f"{'run':<10} {'imported':>9} {'duplicates':>11} {'seconds':>8} {'rows/s':>9} "
+                  f"{'first chunk s':>14} {'max gap s':>10}")
+            for label in ('fresh', 'reimport'):
+                report, elapsed, first, gap = timed_import(user_id, path)
+                print(f"{label:<10} {report.imported:>9,} {report.duplicates:>11,} {elapsed:>8.1f} "
+                      f"{report.processed / elapsed:>9,.0f} {first:>14.2f} {gap:>10.2f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark the hot expense queries before and after the composite indexes.
+
+Seeds a scratch database (about 1M rows by default), drops the lookup indexes,
+records the query plan and median latency of each query, then rebuilds the
+indexes through the migration helpers and measures again.
+
+    python benchmarks/bench_indexes.py --rows 1000000
+    python benchmarks/bench_indexes.py --database-url postgresql://... --rows 1000000
+"""
+
+import argparse
+import json
+from datetime import date, timedelta
+from sqlalchemy import text
+
+from common import make_app, seed, timed
+from extensions import db
+import migrations
+
+INDEXES = ['ix_expense_user_date', 'ix_expense_user_date_id', 'ix_expense_user_category_date', 'ix_category_user_name',
+           'uq_category_user_name']
+
+QUERIES = {
+    'dashboard_recent': (
+        "SELECT * FROM expense WHERE user_id = :user_id ORDER BY date DESC LIMIT 5"
+    ),
+    'month_total': (
+        "SELECT SUM(amount) FROM expense WHERE user_id = :user_id AND date BETWEEN :month_start AND :today"
+    ),
+    'view_by_category': (
+        "SELECT * FROM expense WHERE user_id = :user_id AND category_id = :category_id ORDER BY date DESC"
+    ),
+    'keyset_page': (
+        "SELECT * FROM expense WHERE user_id = :user_id AND (date < :range_start OR "
+        "(date = :range_start AND id < :after_id)) ORDER BY date DESC, id DESC LIMIT 50"
+    ),
+    'date_range': (
+        "SELECT * FROM expense WHERE user_id = :user_id AND date BETWEEN :range_start AND :today ORDER BY date DESC"
+    ),
+}
+
+
+def explain(sql, params):
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.execute(text(prefix + sql), params).fetchall()
+    return [' '.join(str(col) for col in row) for row in rows]
+
+
+def measure(params, repeat):
+    results = {}
+    for name, sql in QUERIES.items():
+        results[name] = {
+            'plan': explain(sql, params),
+            'median_ms': round(timed(lambda: db.session.execute(text(sql), params).fetchall(), repeat), 3),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url')
+    parser.add_argument('--output', help="Write the full report as JSON to this file")
+    args = parser.parse_args()
+
+    bench_app = make_app(args.database_url)
+    with bench_app.app_context():
+        db.create_all()
+        print(f"Seeding {args.rows:,} expenses for {args.users} users...")
+        user_ids = seed(args.rows, users=args.users)
+
+        today = date.today()
+        category_id = db.session.execute(text("SELECT MIN(id) FROM category")).scalar()
+        params = {
+            'user_id': user_ids[0],
+            'category_id': category_id,
+            'today': today,
+            'month_start': today.replace(day=1),
+            'range_start': today - timedelta(days=30),
+            'after_id': args.rows,
+        }
+
+        for name in INDEXES:
+            migrations.drop_index(name)
+        db.session.execute(text('ANALYZE'))
+        before = measure(params, args.repeat)
+
+        migrations.add_lookup_indexes()
+        migrations.add_keyset_index()
+        db.session.execute(text('ANALYZE'))
+        after = measure(params, args.repeat)
+
+    print(f"\n{'query':<20} {'before ms':>12} {'after ms':>12} {'speed-up':>10}")
+    for name in QUERIES:
+        b, a = before[name]['median_ms'], after[name]['median_ms']
+        print(f"{name:<20} {b:>12.3f} {a:>12.3f} {b / a if a else float('inf'):>9.1f}x")
+    for label, report in (('before', before), ('after', after)):
+        print(f"\nQuery plans {label}:")
+        for name, result in report.items():
+            print(f"  {name}:")
+            for line in result['plan']:
+                print(f"    {line}")
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump({'rows': args.rows, 'before': before, 'after': after}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
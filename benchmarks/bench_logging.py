@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Cost of logging on the calling (request) thread.
+
+Logs ``--records`` INFO records, each with a few structured fields, from
+``--threads`` threads, three ways:
+
+    sync       a FileHandler on the calling thread, as logging.basicConfig(filename='app.log') set up
+    queue      app_logging's queue handler; JSON formatting and the write happen on the listener thread
+    debug off  logger.debug() below the configured level
+
+It runs once against a plain file and once against a file whose every write
+takes ``--slow-ms`` extra (a busy or network disk). For each it prints the
+median and 99th percentile cost per call on the caller, and for the queue how
+long the listener took to drain. It then configures app_logging itself with
+LOG_DEBUG_SAMPLE=0.1 and checks how many DEBUG records of a burst reach the
+file, and that every line is JSON with the request id set in a request.
+
+    python benchmarks/bench_logging.py --records 20000 --threads 4
+"""
+
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import statistics
+import tempfile
+import threading
+import time
+
+from flask import Flask
+
+import common  # puts the project root on sys.path
+import app_logging
+
+
+class SlowFileHandler(logging.FileHandler):
+    def __init__(self, path, delay_ms):
+        super().__init__(path, encoding='utf-8')
+        self.delay = delay_ms / 1000
+
+    def emit(self, record):
+        if self.delay:
+            time.sleep(self.delay)
+        super().emit(record)
+
+
+def timed_calls(logger, level, records, threads):
+    samples = []
+    lock = threading.Lock()
+
+    def worker(count):
+        local = []
+        for i in range(count):
+            start = time.perf_counter()
+            logger.log(level, "OpenAI call", extra={'template': 'chat', 'user_id': i % 50, 'ms': 812, 'cost': 0.00042})
+            local.append((time.perf_counter() - start) * 1_000_000)
+        with lock:
+            samples.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(records // threads,)) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99)]
+
+
+def run(name, records, threads, slow_ms, directory):
+    path = os.path.join(directory, f'{name} {slow_ms}.log')
+    logger = logging.getLogger(f'bench.{name}.{slow_ms}')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    target = SlowFileHandler(path, slow_ms)
+    listener = None
+    if name == 'sync':
+        target.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+        logger.addHandler(target)
+    else:
+        target.setFormatter(app_logging.JsonFormatter())
+        records_queue = queue.SimpleQueue()
+        logger.addHandler(app_logging.RequestQueueHandler(records_queue))
+        listener = logging.handlers.QueueListener(records_queue, target)
+        listener.start()
+
+    level = logging.DEBUG if name == 'debug off' else logging.INFO
+    median, p99 = timed_calls(logger, level, records, threads)
+    start = time.perf_counter()
+    if listener:
+        listener.stop()
+    drain = time.perf_counter() - start
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    target.close()
+    with open(path, encoding='utf-8') as f:
+        written = sum(1 for _ in f)
+    return median, p99, drain, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--slow-ms', type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for disk, slow_ms in (('local file', 0), (f'+{args.slow_ms} ms per write', args.slow_ms)):
+            records = args.records if not slow_ms else args.records // 10
+            print(f"{disk}, {records} records from {args.threads} threads")
+            print(f"  {'handler':<10} {'median us':>10} {'p99 us':>8} {'drain s':>8} {'written':>8}")
+            for name in ('sync', 'queue', 'debug off'):
+                median, p99, drain, written = run(name, records, args.threads, slow_ms, directory)
+                drain_text = f"{drain:.2f}" if name == 'queue' else '-'
+                print(f"  {name:<10} {median:>10.1f} {p99:>8.1f} {drain_text:>8} {written:>8}")
+            print()
+
+        path = os.path.join(directory, 'configured.log')
+        os.environ['LOG_FILE'] = path
+        app_logging.configure(level='DEBUG', debug_sample=0.1)
+        web = Flask('bench')
+        app_logging.init_app(web)
+        with web.test_request_context('/', headers={'X-Request-ID': 'bench-request-1'}):
+            web.preprocess_request()
+            burst = logging.getLogger('bench.sampled')
+            for i in range(1000):
+                burst.debug("cache probe %d", i, extra={'key': i})
+            burst.info("done")
+        app_logging.flush()
+        with open(path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        debug = [line for line in lines if line['level'] == 'DEBUG']
+        tagged = all(line['request_id'] == 'bench-request-1' for line in lines)
+        print(f"LOG_DEBUG_SAMPLE=0.1: {len(debug)} of 1000 DEBUG records written, "
+              f"{len(lines) - len(debug)} INFO; all JSON, request id on every record: {tagged}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark PDF report generation time and memory.
+
+For each size a fresh scratch database is seeded with that many expenses for a
+single user and the full report is built into a spooled temporary file, as
+/export_pdf does, once timed and once under tracemalloc for the peak Python
+memory. Expense rows are never held beyond the current page, but ReportLab
+keeps every page's content stream until the file is written, so memory still
+grows by roughly 14 KB per page.
+
+    python benchmarks/bench_pdf.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+from common import make_app, seed
+from extensions import db
+import exports
+import pdf_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'pages':>7} {'output MB':>10} {'seconds':>8} {'peak MB':>8}")
+    for size in args.sizes:
+        bench_app = make_app(args.database_url)
+        with bench_app.app_context():
+            db.drop_all()
+            db.create_all()
+            user_id = seed(size, users=1)[0]
+            db.session.expunge_all()
+
+            # Tracing slows the build down, so time it and measure its memory in separate runs
+            with tempfile.SpooledTemporaryFile(max_size=exports.SPOOL_MAX_SIZE) as output:
+                start = time.perf_counter()
+                pdf_report.build_report(output, user_id)
+                elapsed = time.perf_counter() - start
+                output.seek(0)
+                data = output.read()
+            db.session.expunge_all()
+            with tempfile.SpooledTemporaryFile(max_size=exports.SPOOL_MAX_SIZE) as output:
+                tracemalloc.start()
+                pdf_report.build_report(output, user_id)
+                peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                tracemalloc.stop()
+            pages = data.count(b'/Type /Page\n')
+            print(f"{size:>10,} {pages:>7,} {len(data) / (1024 * 1024):>10.1f} {elapsed:>8.2f} {peak:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
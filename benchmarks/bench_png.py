@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark PNG chart rendering: the old pyplot functions against chart.py.
+
+Renders ``--renders`` pie and line charts with the original pyplot code (which
+leaves every figure open in pyplot's registry) and then with chart.py's
+explicit Agg figures, recording the resident set size before and after each.
+A final pass requests charts that were already rendered to time cache hits.
+Each variant runs in its own process so their memory does not mix.
+
+    python benchmarks/bench_png.py --renders 200
+"""
+
+import argparse
+import io
+import multiprocessing
+import time
+from datetime import date, timedelta
+
+from common import peak_rss_mb
+import chart
+
+PIE = [['Food', 1200.0], ['Transport', 450.5], ['Bills', 900.0], ['Shopping', 300.25], ['Health', 120.0]]
+LINE = [[(date(2026, 1, 1) + timedelta(days=7 * i)).isoformat(), 100.0 + 13 * i] for i in range(40)]
+CACHE_HITS = 1000
+
+
+def legacy_render(kind, data):
+    """The charts as chart.py drew them before: pyplot global state, figures never closed"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    if kind == 'pie':
+        ax.pie([v for _, v in data], labels=[n for n, _ in data], autopct='%1.1f%%')
+    else:
+        ax.plot([date.fromisoformat(d) for d, _ in data], [v for _, v in data])
+    img_stream = io.BytesIO()
+    plt.savefig(img_stream, format='png')
+    return img_stream.getvalue()
+
+
+def variant(name, renders, queue):
+    render = legacy_render if name == 'legacy' else lambda kind, data: chart._render(kind, data, 640, 480)
+    render('pie', PIE)  # import matplotlib and load fonts outside the measurement
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    for i in range(renders):
+        # Vary the data so nothing could be served from a cache
+        if i % 2:
+            render('line', [[d, v + i] for d, v in LINE])
+        else:
+            render('pie', [[n, v + i] for n, v in PIE])
+    elapsed = time.perf_counter() - start
+
+    cached_ms = float('nan')
+    if name == 'chart.py':
+        chart.render_png('pie', PIE, 640, 480)
+        start = time.perf_counter()
+        for _ in range(CACHE_HITS):
+            chart.render_png('pie', PIE, 640, 480)
+        cached_ms = (time.perf_counter() - start) * 1000 / CACHE_HITS
+    queue.put((name, elapsed / renders * 1000, peak_rss_mb() - before, cached_ms))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--renders', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'variant':<10} {'ms/render':>10} {'RSS growth MB':>14} {'cache hit ms':>13}")
+    queue = multiprocessing.Queue()
+    for name in ('legacy', 'chart.py'):
+        process = multiprocessing.Process(target=variant, args=(name, args.renders, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        print(f"{result[0]:<10} {result[1]:>10.1f} {result[2]:>14.1f} {result[3]:>13.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Prompt sizes for representative users: the old dict-repr budget advice
+prompt against prompt_builder's budgeted table.
+
+The profiles are the synthetic spending summaries of
+tests/test_prompt_builder.py, which pins their token estimates. The script
+prints the estimated prompt tokens both ways and the time to build the new
+prompt.
+
+    python benchmarks/bench_prompts.py [--show NAME]
+"""
+
+import argparse
+
+from common import timed
+import prompt_builder
+from tests.test_prompt_builder import PROFILES
+
+LEGACY_SYSTEM = "You are a helpful financial advisor providing personalized budget advice based on spending patterns."
+
+
+def legacy_messages(summary):
+    """The prompt get_personalized_budget_advice used to send: a dict repr of the top three categories"""
+    top = summary['categories'][:3]
+    user_data = {
+        "total_spent": float(summary['total']),
+        "avg_per_expense": float(summary['total'] / summary['count']),
+        "top_categories": [{"category": name, "amount": float(amount)} for name, amount, _ in top],
+        "num_expenses": summary['count'],
+        "time_period": f"{summary['first']:%Y-%m-%d} to {summary['last']:%Y-%m-%d}",
+    }
+    prompt = "Based on the following spending data for a user, provide personalized budget advice"
+    if summary.get('focus'):
+        prompt += f" specifically for their {summary['focus']} expenses"
+        user_data["category_specific"] = {
+            "category": summary['focus'].lower(), "total_spent": user_data["total_spent"],
+            "avg_per_expense": user_data["avg_per_expense"], "num_expenses": summary['count'],
+            "percentage_of_total": 100.0,
+        }
+    prompt += f":\n\n{user_data}\n\nProvide 3-5 specific, actionable tips to help the user manage their expenses better."
+    return [{"role": "system", "content": LEGACY_SYSTEM}, {"role": "user", "content": prompt}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--show', help='print the rendered prompt of one profile')
+    args = parser.parse_args()
+
+    print(f"{'profile':<16} {'categories':>10} {'legacy tok':>11} {'new tok':>8} {'build ms':>9}")
+    for name, summary in PROFILES.items():
+        legacy = prompt_builder.estimate_messages(legacy_messages(summary))
+        messages, tokens = prompt_builder.budget_advice(summary)
+        ms = timed(lambda: prompt_builder.budget_advice(summary), 200)
+        print(f"{name:<16} {len(summary['categories']):>10} {legacy:>11} {tokens:>8} {ms:>9.3f}")
+        if args.show == name:
+            print(messages[1]['content'])
+
+if __name__ == "__main__":
+    main()
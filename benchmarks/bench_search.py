@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark keyword search latency: the old ILIKE scan against the full-text index.
+
+For each size a fresh scratch database is seeded, the LIKE query is timed, the
+search index is installed (as migration 6 does) and the indexed query is timed.
+
+    python benchmarks/bench_search.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+
+from common import make_app, seed, timed
+from extensions import db
+from models import Category, Expense
+import search
+
+# A rare word (~1 in 1,700 rows), a prefix shared by ~1 in 12 rows, and a common word
+KEYWORDS = ['kalomi', 'ze', 'office', 'gym membership']
+
+
+def like_query(user_id, keyword, limit=50):
+    return Expense.query.filter_by(user_id=user_id).join(Category, Category.id == Expense.category_id).filter(
+        db.or_(Expense.notes.ilike(f'%{keyword}%'), Category.name.ilike(f'%{keyword}%'))
+    ).order_by(Expense.date.desc()).limit(limit)
+
+
+def indexed_query(user_id, keyword, limit=50):
+    # The API pages by date; the search page (every match) orders by relevance
+    query, rank = search.apply_keyword(Expense.query.filter_by(user_id=user_id), keyword, user_id,
+                                       ranked=limit is None)
+    ordering = [rank.desc()] if rank is not None else []
+    return query.order_by(*ordering, Expense.date.desc()).limit(limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    # "page" is the API's first 50 results by date; "all" is the search page, which lists every match
+    print(f"{'rows':>10} {'keyword':<16} {'query':<6} {'like ms':>10} {'indexed ms':>11} {'speed-up':>9}")
+    for size in args.sizes:
+        bench_app = make_app(args.database_url)
+        with bench_app.app_context():
+            db.drop_all()
+            db.create_all()
+            user_id = seed(size, users=args.users)[0]
+
+            like_times = {
+                (kw, label): timed(lambda: like_query(user_id, kw, limit).all(), args.repeat)
+                for kw in KEYWORDS for label, limit in (('page', 50), ('all', None))
+            }
+            search.install()
+            if not search.available():
+                print("Full-text index unavailable on this database; nothing to compare")
+                return
+            for keyword in KEYWORDS:
+                for label, limit in (('page', 50), ('all', None)):
+                    indexed = timed(lambda: indexed_query(user_id, keyword, limit).all(), args.repeat)
+                    like = like_times[(keyword, label)]
+                    print(f"{size:>10,} {keyword:<16} {label:<6} {like:>10.2f} {indexed:>11.2f} {like / indexed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Benchmarks never touch the development database: each one builds a throwaway
+Flask app bound to its own database (a temporary SQLite file unless a
+``--database-url`` is given) and seeds it with synthetic expenses.
+"""
+
+import os
+import sys
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import insert
+from extensions import db
+from models import User, Category, Expense
+
+NOTES = [
+    "Weekly groceries", "Uber to office", "Movie night", "Electricity bill",
+    "Lunch with team", "Pharmacy", "Online course", "Flight tickets",
+    "Rent", "Coffee", "Birthday gift", "Gym membership", "Petrol", "Books",
+]
+
+
+# Pronounceable filler words so searches for specific terms are selective, like real notes
+_SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'to', 'vi', 'ze', 'po', 'da', 'fe']
+VOCABULARY = [a + b + c for a in _SYLLABLES for b in _SYLLABLES for c in _SYLLABLES]
+
+
+def make_app(database_url=None):
+    """Create a minimal Flask app bound to a scratch database"""
+    if not database_url:
+        handle, path = tempfile.mkstemp(prefix='bench_', suffix='.db')
+        os.close(handle)
+        database_url = f'sqlite:///{path}'
+    bench_app = Flask('benchmark')
+    bench_app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    bench_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    bench_app.config['SECRET_KEY'] = 'benchmark'
+    db.init_app(bench_app)
+    return bench_app
+
+
+def seed(rows, users=20, categories=10, days=3 * 365, batch=50_000, seed_value=42):
+    """
+    Insert ``rows`` synthetic expenses spread over ``users`` and ``days``.
+    Returns the list of user ids. Must run inside an app context.
+    """
+    rng = random.Random(seed_value)
+    db.session.execute(insert(User), [
+        {'username': f'bench{u}', 'email': f'bench{u}@example.com', 'password': 'x'}
+        for u in range(users)
+    ])
+    db.session.execute(insert(Category), [
+        {'name': f'Category {c}', 'user_id': None} for c in range(categories)
+    ])
+    db.session.commit()
+    user_ids = [u.id for u in User.query.all()]
+    category_ids = [c.id for c in Category.query.all()]
+
+    today = date.today()
+    remaining = rows
+    while remaining > 0:
+        size = min(batch, remaining)
+        db.session.execute(insert(Expense), [
+            {
+                'amount': round(rng.uniform(10, 5000), 2),
+                'date': today - timedelta(days=rng.randrange(days)),
+                'time': dtime(rng.randrange(24), rng.randrange(60)),
+                'notes': f"{rng.choice(NOTES)} {rng.choice(VOCABULARY)}",
+                'category_id': rng.choice(category_ids),
+                'user_id': rng.choice(user_ids),
+            }
+            for _ in range(size)
+        ])
+        db.session.commit()
+        remaining -= size
+    return user_ids
+
+
+def timed(func, repeat=5):
+    """Run ``func`` ``repeat`` times and return the median wall time in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in megabytes (Unix only)"""
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
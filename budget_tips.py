@@ -0,0 +1,57 @@
+"""
+Predefined budget tips, served when AI advice is not requested or the AI
+service is unavailable (see ai_resilience).
+"""
+
+TIPS = {
+    'food': [
+        "Plan your meals for the week and make a grocery list",
+        "Cook in bulk and freeze leftovers",
+        "Use cashback apps for grocery shopping",
+        "Limit eating out to once a week",
+        "Bring lunch to work instead of buying"
+    ],
+    'transport': [
+        "Use public transportation when possible",
+        "Consider carpooling with colleagues",
+        "Maintain your vehicle regularly to prevent costly repairs",
+        "Compare gas prices using apps",
+        "Consider biking or walking for short distances"
+    ],
+    'entertainment': [
+        "Look for free events in your community",
+        "Use streaming services instead of cable",
+        "Take advantage of library resources",
+        "Look for happy hour deals and restaurant specials",
+        "Use discount apps for movie tickets and events"
+    ],
+    'bills': [
+        "Review subscriptions and cancel unused ones",
+        "Negotiate with service providers for better rates",
+        "Consider bundling services for discounts",
+        "Switch to energy-efficient appliances",
+        "Use programmable thermostats to reduce energy costs"
+    ],
+    'general': [
+        "Follow the 50/30/20 rule: 50% needs, 30% wants, 20% savings",
+        "Create and stick to a monthly budget",
+        "Set up automatic transfers to savings accounts",
+        "Use cash envelopes for discretionary spending",
+        "Review your budget regularly and adjust as needed"
+    ]
+}
+
+
+def static_tips(category=None):
+    """The /api/budget/tips data for ``category``, or the general tips if there are none for it"""
+    if category and category in TIPS:
+        return {
+            'category': category,
+            'tips': TIPS[category],
+            'is_ai_generated': False
+        }
+    return {
+        'categories': list(TIPS.keys()),
+        'general_tips': TIPS['general'],
+        'is_ai_generated': False
+    }
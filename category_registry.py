@@ -0,0 +1,204 @@
+"""
+Process-wide category registry.
+
+Resolves category names to ids and builds form choice lists from an in-memory
+cache so warm requests do not query the category table at all. Global
+categories (user_id is NULL) are loaded once per worker; per-user categories
+live in a bounded LRU keyed by user id, each entry stamped with the user's
+version number. Creating a category anywhere through the ORM bumps the version
+(see the session hooks below), so stale entries are never served by the worker
+that made the change. Entries also expire after ENTRY_TTL seconds so categories
+created by another gunicorn worker show up without a restart. A cache miss
+is therefore not proof that a category is missing: creating one goes
+through an insert that skips rows the unique (user_id, name) index already
+has, and the ids are then read back from the table.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Category
+
+MAX_CACHED_USERS = 1024
+ENTRY_TTL = 60  # seconds
+
+_lock = threading.RLock()
+_global_categories = None   # list of (id, name), loaded lazily once per worker
+_user_entries = OrderedDict()  # user_id -> (version, loaded_at, [(id, name)], {name: id})
+_versions = {}  # user_id -> version stamp, bumped on invalidation
+
+
+def _load_user(user_id):
+    rows = db.session.query(Category.id, Category.name).filter(Category.user_id == user_id).all()
+    categories = [(row.id, row.name) for row in rows]
+    # First match wins, as with Category.query.filter_by(...).first()
+    by_name = {}
+    for category_id, name in categories:
+        by_name.setdefault(name, category_id)
+    return categories, by_name
+
+
+def global_categories():
+    """List of (id, name) for global categories"""
+    global _global_categories
+    with _lock:
+        if _global_categories is None:
+            rows = db.session.query(Category.id, Category.name).filter(Category.user_id == None).all()
+            _global_categories = [(row.id, row.name) for row in rows]
+        return _global_categories
+
+
+def _user_entry(user_id):
+    with _lock:
+        version = _versions.get(user_id, 0)
+        entry = _user_entries.get(user_id)
+        if entry and entry[0] == version and time.monotonic() - entry[1] < ENTRY_TTL:
+            _user_entries.move_to_end(user_id)
+            return entry
+
+    categories, by_name = _load_user(user_id)
+    entry = (version, time.monotonic(), categories, by_name)
+    with _lock:
+        # Only cache if nobody invalidated the user while we were loading
+        if _versions.get(user_id, 0) == version:
+            _user_entries[user_id] = entry
+            _user_entries.move_to_end(user_id)
+            while len(_user_entries) > MAX_CACHED_USERS:
+                _user_entries.popitem(last=False)
+    return entry
+
+
+def user_categories(user_id):
+    """List of (id, name) for categories owned by the user"""
+    return _user_entry(user_id)[2]
+
+
+def choices(user_id, include_all=False, as_str=False):
+    """
+    Choice list for a category SelectField: the user's categories followed by the
+    global ones, optionally preceded by an (0, 'All') entry.
+    """
+    result = [(0, 'All')] if include_all else []
+    for category_id, name in user_categories(user_id) + global_categories():
+        result.append((str(category_id) if as_str else category_id, name))
+    return result
+
+
+def resolve(name, user_id):
+    """Id of the user's category with this name, else the global one, else None"""
+    category_id = _user_entry(user_id)[3].get(name)
+    if category_id is not None:
+        return category_id
+    for global_id, global_name in global_categories():
+        if global_name == name:
+            return global_id
+    return None
+
+
+def _insert_missing(names, user_id):
+    """
+    Create the user's categories called ``names`` unless they exist, and return
+    {name: id} for all of them. Another worker may have created one since this
+    worker's cache was loaded, so rows that already exist are left alone (the
+    unique (user_id, name) index makes the insert a no-op) and every id is read
+    back from the table. Runs in the caller's transaction.
+    """
+    table = Category.__table__
+    rows = [{'name': name, 'user_id': user_id} for name in names]
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name in ('postgresql', 'sqlite'):
+        if dialect_name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table).on_conflict_do_nothing(index_elements=[table.c.user_id, table.c.name])
+        db.session.execute(stmt, rows)
+    else:
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(**row))
+            except IntegrityError:
+                pass
+    # Core inserts bypass the ORM hooks below, so record the owner for them by hand
+    db.session.info.setdefault('category_owners', set()).add(user_id)
+    invalidate(user_id)
+    found = db.session.execute(
+        db.select(Category.name, Category.id).where(Category.user_id == user_id, Category.name.in_(names))
+    ).all()
+    return {name: category_id for name, category_id in found}
+
+
+def get_or_create(name, user_id):
+    """Resolve a category name for the user, creating a user category if none exists"""
+    category_id = resolve(name, user_id)
+    if category_id is None:
+        category_id = _insert_missing([name], user_id)[name]
+        db.session.commit()
+    return category_id
+
+
+def get_or_create_many(names, user_id):
+    """
+    Map several category names to ids for the user, creating any unknown ones
+    as user categories in one statement. Unlike get_or_create this does not
+    commit; the new categories belong to the caller's transaction.
+    """
+    ids = {name: resolve(name, user_id) for name in names}
+    missing = sorted(name for name, category_id in ids.items() if category_id is None)
+    if missing:
+        ids.update(_insert_missing(missing, user_id))
+    return ids
+
+
+def name_for(category_id, user_id):
+    """Name of a category visible to the user (own or global), or None"""
+    for known_id, name in user_categories(user_id) + global_categories():
+        if known_id == category_id:
+            return name
+    return None
+
+
+def invalidate(user_id=None):
+    """Drop cached categories for one user, or for everyone including globals"""
+    global _global_categories
+    with _lock:
+        if user_id is None:
+            _global_categories = None
+            _user_entries.clear()
+            for key in list(_versions):
+                _versions[key] += 1
+        else:
+            _versions[user_id] = _versions.get(user_id, 0) + 1
+            _user_entries.pop(user_id, None)
+
+
+def _invalidate_owners(owners):
+    for owner in owners:
+        if owner is None:
+            invalidate()
+            return
+    for owner in owners:
+        invalidate(owner)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_new_categories(session, flush_context):
+    owners = {obj.user_id for obj in session.new if isinstance(obj, Category)}
+    if owners:
+        session.info.setdefault('category_owners', set()).update(owners)
+        # Invalidate right away so a reload inside this transaction sees the new row...
+        _invalidate_owners(owners)
+
+
+@event.listens_for(db.session, 'after_commit')
+@event.listens_for(db.session, 'after_soft_rollback')
+def _settle_new_categories(session, *args):
+    # ...and again once the transaction ends, dropping anything cached in between
+    # (which would hold a phantom id if the transaction rolled back)
+    owners = session.info.pop('category_owners', None)
+    if owners:
+        _invalidate_owners(owners)
@@ -1,27 +1,189 @@
-import plotly.express as px
-import matplotlib.pyplot as plt
-from io import BytesIO
-from models import Expense, Category
-
-
-def create_pie_chart(expenses):
-    categories = [expense.expense_category.name for expense in expenses]
-    amounts = [expense.amount for expense in expenses]
-    fig, ax = plt.subplots()
-    ax.pie(amounts, labels=categories, autopct='%1.1f%%')
-    img_stream = BytesIO()
-    plt.savefig(img_stream, format='png')
-    img_stream.seek(0)
-    return img_stream.getvalue()
-
-
-def create_line_chart(expenses):
-    dates = [expense.date for expense in expenses]
-    amounts = [expense.amount for expense in expenses]
-    fig, ax = plt.subplots()
-    ax.plot(dates, amounts)
-    img_stream = BytesIO()
-    plt.savefig(img_stream, format='png')
-    img_stream.seek(0)
-    return img_stream.getvalue()
+"""
+Server-side PNG charts, for places that cannot run plotly.js (emails, the PDF
+report).
 
+Charts are drawn on explicit matplotlib Figure objects with the Agg canvas and
+never go through pyplot, so there is no global figure registry to leak into:
+a figure lives only as long as the render call that made it. PNG bytes are
+cached in an LRU bounded by total size, keyed by a hash of the aggregated data
+the chart is drawn from (plus its kind and size), so an unchanged chart is
+rendered once per worker however often it is requested.
+
+Rendering is CPU-bound and holds the GIL. With CHART_PROCESSES set it runs in
+a small pool of worker processes instead of on the request thread. The
+workers only import this module and matplotlib.
+
+matplotlib is optional and only imported when a chart is rendered.
+"""
+
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from itsdangerous import URLSafeTimedSerializer
+
+KINDS = ('pie', 'line')
+DPI = 100
+DEFAULT_SIZE = (640, 400)
+MIN_SIZE, MAX_SIZE = 200, 1600
+MAX_PIE_SLICES = 8
+CACHE_BYTES = int(os.getenv('CHART_CACHE_BYTES', 16 * 1024 * 1024))
+PROCESSES = int(os.getenv('CHART_PROCESSES', 0))
+RENDER_TIMEOUT = 30  # seconds to wait for a pool worker
+TOKEN_MAX_AGE = 30 * 24 * 3600  # signed image links (e.g. in emails) stay valid for 30 days
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def available():
+    return importlib.util.find_spec('matplotlib') is not None
+
+
+class PngCache:
+    """LRU of PNG bytes that evicts the least recently used charts once ``max_bytes`` is exceeded"""
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+            return png
+
+    def set(self, key, png):
+        if len(png) > self.max_bytes:
+            return png
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = png
+            self.size += len(png)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return png
+
+
+_cache = PngCache()
+
+
+def pie_data(category_totals):
+    """[[name, total], ...] largest first, with the tail folded into 'Other'"""
+    ranked = sorted(category_totals.items(), key=lambda item: item[1], reverse=True)
+    if len(ranked) > MAX_PIE_SLICES:
+        rest = sum(total for _, total in ranked[MAX_PIE_SLICES - 1:])
+        ranked = ranked[:MAX_PIE_SLICES - 1] + [('Other', rest)]
+    return [[name, round(total, 2)] for name, total in ranked if total > 0]
+
+
+def line_data(series):
+    """[[bucket start (ISO date), total across categories], ...] in date order"""
+    totals = {}
+    for _, points in series:
+        for period, total in points.items():
+            totals[period] = totals.get(period, 0) + total
+    return [[period.isoformat(), round(totals[period], 2)] for period in sorted(totals)]
+
+
+def chart_data(kind, summary):
+    """The data a chart of ``kind`` is drawn from, given an expense_charts.summarize() result"""
+    if summary is None:
+        return []
+    _, category_totals, series = summary
+    return pie_data(category_totals) if kind == 'pie' else line_data(series)
+
+
+def clamp_size(width, height):
+    width = min(max(width or DEFAULT_SIZE[0], MIN_SIZE), MAX_SIZE)
+    height = min(max(height or DEFAULT_SIZE[1], MIN_SIZE), MAX_SIZE)
+    return width, height
+
+
+def cache_key(kind, data, width, height):
+    raw = json.dumps([kind, width, height, data], separators=(',', ':'))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _render(kind, data, width, height):
+    """Draw one chart and return its PNG bytes. Runs on the request thread or in a pool worker."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=(width / DPI, height / DPI), dpi=DPI)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    if not data:
+        axes.text(0.5, 0.5, 'No expenses', ha='center', va='center', fontsize=14, color='grey')
+        axes.set_axis_off()
+    elif kind == 'pie':
+        labels, values = zip(*data)
+        axes.pie(values, labels=labels, autopct='%1.1f%%', startangle=90, counterclock=False)
+        axes.set_aspect('equal')
+    else:
+        dates = [date.fromisoformat(period) for period, _ in data]
+        axes.plot(dates, [total for _, total in data], marker='o', markersize=3)
+        axes.set_ylabel('Amount')
+        axes.grid(alpha=0.3)
+        figure.autofmt_xdate()
+        # Fixed margins: tight_layout would double the render time
+        figure.subplots_adjust(left=0.12, right=0.97, top=0.95)
+
+    output = io.BytesIO()
+    figure.savefig(output, format='png')
+    return output.getvalue()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn rather than fork: forking a threaded web worker can copy held locks
+            _executor = ProcessPoolExecutor(max_workers=PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def render_png(kind, data, width=None, height=None):
+    """
+    PNG bytes for a chart of ``kind`` drawn from ``data`` (see chart_data),
+    from the cache when an identical chart was rendered before.
+    Returns (cache key, png); the key doubles as an ETag.
+    """
+    if kind not in KINDS:
+        raise ValueError(f'Unknown chart kind: {kind}')
+    width, height = clamp_size(width, height)
+    key = cache_key(kind, data, width, height)
+    png = _cache.get(key)
+    if png is None:
+        if PROCESSES > 0:
+            png = _pool().submit(_render, kind, data, width, height).result(timeout=RENDER_TIMEOUT)
+        else:
+            png = _render(kind, data, width, height)
+        _cache.set(key, png)
+    return key, png
+
+
+def _serializer(secret_key):
+    return URLSafeTimedSerializer(secret_key, salt='chart-image')
+
+
+def sign_params(secret_key, user_id, start_date=None, end_date=None, category_id=0):
+    """A token that lets a chart image be fetched without a session, e.g. from an email"""
+    return _serializer(secret_key).dumps([user_id, start_date, end_date, category_id])
+
+
+def load_params(secret_key, token, max_age=TOKEN_MAX_AGE):
+    """(user_id, start_date, end_date, category_id) from a token; raises itsdangerous.BadSignature"""
+    return tuple(_serializer(secret_key).loads(token, max_age=max_age))
@@ -0,0 +1,136 @@
+"""
+Server-side conversation state for the FinMate chat.
+
+Where a user is in the add-an-expense conversation (the state, plus the
+amount and category collected so far) lives in one small ``chat_state``
+row per user. It used to live in the signed session cookie, which every
+request then carried. A row expires FINMATE_STATE_TTL seconds (default 15
+minutes) after its last transition. An expired row reads as a fresh
+conversation, and long-expired rows are deleted now and then by whichever
+process writes next.
+
+Transitions are compare-and-set. ``load()`` returns the conversation with
+its version, and ``advance()`` writes the next state only if the version is
+still the one loaded: an UPDATE ... WHERE version = :loaded, or an INSERT
+that does nothing on conflict for a user without a row. If another chat turn
+moved the conversation in between (a double-submitted message, two open
+tabs), advance() raises StaleConversation and writes nothing. Because
+advance() can leave the commit to the caller, a turn that adds expenses
+commits the transition and the expenses together, so two copies of a
+message handled at the same time add its expenses once.
+"""
+
+import os
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import ChatState
+
+TTL = int(os.getenv('FINMATE_STATE_TTL', 15 * 60))  # seconds
+PURGE_INTERVAL = 10 * 60  # seconds between deletes of expired rows, per process
+INITIAL = 'initial'
+FIELDS = ('amount', 'category')
+
+Conversation = namedtuple('Conversation', 'user_id state amount category version')
+
+_last_purge = 0.0
+
+
+class StaleConversation(Exception):
+    """Another chat turn changed the conversation since it was loaded"""
+
+
+def load(user_id, now=None):
+    """The user's conversation; a fresh one if there is none or it has expired"""
+    now = now or datetime.utcnow()
+    table = ChatState.__table__
+    row = db.session.execute(
+        db.select(table.c.state, table.c.amount, table.c.category, table.c.version, table.c.expires_at).where(table.c.user_id == user_id)
+    ).first()
+    if row is None:
+        return Conversation(user_id, INITIAL, None, None, 0)
+    if row.expires_at <= now:
+        # Keep the version, so the next transition still compare-and-sets against this row
+        return Conversation(user_id, INITIAL, None, None, row.version)
+    return Conversation(user_id, row.state, row.amount, row.category, row.version)
+
+
+def _insert_if_absent(values):
+    table = ChatState.__table__
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name in ('postgresql', 'sqlite'):
+        if dialect_name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table).on_conflict_do_nothing(index_elements=[table.c.user_id])
+        return db.session.execute(stmt, values).rowcount
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(**values))
+        return 1
+    except IntegrityError:
+        return 0
+
+
+def advance(conversation, state, commit=True, now=None, **fields):
+    """
+    Move ``conversation`` to ``state``, setting the given fields (amount,
+    category) and keeping the others; moving to INITIAL clears them.
+    Returns the new Conversation. Raises StaleConversation if the stored
+    conversation is no longer the one that was loaded. With ``commit=False``
+    the write joins the session's transaction.
+    """
+    unknown = set(fields) - set(FIELDS)
+    if unknown:
+        raise TypeError(f"Unknown conversation fields: {', '.join(sorted(unknown))}")
+    now = now or datetime.utcnow()
+    if state == INITIAL:
+        values = dict.fromkeys(FIELDS)
+    else:
+        values = {name: getattr(conversation, name) for name in FIELDS}
+    values.update(fields)
+    values.update(state=state, version=conversation.version + 1, expires_at=now + timedelta(seconds=TTL))
+
+    table = ChatState.__table__
+    if conversation.version == 0:
+        written = _insert_if_absent(dict(values, user_id=conversation.user_id))
+    else:
+        written = db.session.execute(
+            table.update().where(table.c.user_id == conversation.user_id,
+                                 table.c.version == conversation.version).values(**values)
+        ).rowcount
+    if not written:
+        db.session.rollback()
+        raise StaleConversation(f"Conversation of user {conversation.user_id} changed concurrently")
+
+    _maybe_purge(now)
+    if commit:
+        db.session.commit()
+    return Conversation(conversation.user_id, state, values['amount'], values['category'], values['version'])
+
+
+def reset(conversation, commit=True):
+    """Back to the start of the conversation"""
+    return advance(conversation, INITIAL, commit=commit)
+
+
+def purge_expired(now=None):
+    """
+    Delete conversations that expired more than TTL ago, within the session's
+    transaction; returns how many. Recently expired rows are kept so a turn
+    that has just loaded one still finds it.
+    """
+    table = ChatState.__table__
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=TTL)
+    return db.session.execute(table.delete().where(table.c.expires_at <= cutoff)).rowcount
+
+
+def _maybe_purge(now):
+    global _last_purge
+    if time.monotonic() - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = time.monotonic()
+    purge_expired(now)
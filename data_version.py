@@ -0,0 +1,91 @@
+"""
+Per-user data version counter.
+
+``user_data_version.version`` is bumped in the same transaction as every write
+to a user's expenses, so anything computed from those expenses can be cached
+under (user, version) and revalidated with a single primary-key lookup. The
+bump happens in an ``after_flush`` hook for ORM writes; Core bulk writes must
+call ``bump`` themselves, as they do for rollups.
+"""
+
+import threading
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from extensions import db
+from models import DataVersion, Expense
+
+
+def current(user_id):
+    """The user's current data version (0 if they never wrote anything)"""
+    version = db.session.query(DataVersion.version).filter(DataVersion.user_id == user_id).scalar()
+    return version or 0
+
+
+def bump(session, user_ids):
+    """Increment the data version of each user in ``user_ids`` within the session's transaction"""
+    user_ids = sorted({uid for uid in user_ids if uid is not None})
+    if not user_ids:
+        return
+    table = DataVersion.__table__
+    dialect_name = session.get_bind().dialect.name
+    if dialect_name in ('postgresql', 'sqlite'):
+        if dialect_name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={'version': table.c.version + 1},
+        )
+        session.execute(stmt, [{'user_id': uid, 'version': 1} for uid in user_ids])
+    else:
+        for uid in user_ids:
+            result = session.execute(
+                table.update().where(table.c.user_id == uid).values(version=table.c.version + 1)
+            )
+            if result.rowcount == 0:
+                session.execute(table.insert().values(user_id=uid, version=1))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_on_expense_writes(session, flush_context):
+    user_ids = set()
+    for obj in session.new | session.deleted:
+        if isinstance(obj, Expense):
+            user_ids.add(obj.user_id)
+    for obj in session.dirty:
+        if isinstance(obj, Expense) and session.is_modified(obj):
+            user_ids.add(obj.user_id)
+            history = inspect(obj).attrs.user_id.history
+            user_ids.update(history.deleted)
+    if user_ids:
+        bump(session, user_ids)
+
+
+class VersionedCache:
+    """
+    Bounded LRU of values derived from a user's data. An entry is only returned
+    while the version it was stored under is still the user's current version.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
@@ -0,0 +1,175 @@
+"""
+Batch create / update / delete of expenses for /api/expenses/batch.
+
+A batch is validated as a whole before anything is written: the referenced
+expenses are loaded with one query, category names are resolved once, and
+each operation gets a result. The valid operations are then applied in one
+transaction with one executemany INSERT, one executemany UPDATE and one
+DELETE ... WHERE id IN (...), and a single commit. These statements bypass
+the ORM unit of work, so rollup deltas and the data version bump are applied
+here explicitly.
+
+Operations look like:
+    {"op": "create", "amount": 120, "date": "05-03-2026", "category": "Food", "notes": "...", "time": "13:05"}
+    {"op": "update", "id": 42, "amount": 99.5}          (only the given fields change)
+    {"op": "delete", "id": 43}
+
+With ``atomic`` a single invalid operation rejects the whole batch; otherwise
+invalid operations are reported and skipped.
+"""
+
+from sqlalchemy import bindparam
+from extensions import db
+from models import Expense
+import category_registry
+import data_version
+import importer
+import rollups
+
+MAX_OPERATIONS = 500
+OPERATIONS = ('create', 'update', 'delete')
+UPDATE_FIELDS = {
+    'amount': importer.clean_amount,
+    'date': importer.clean_date,
+    'time': importer.clean_time,
+    'category': importer.clean_category,
+    'notes': importer.clean_notes,
+}
+
+
+class BatchError(ValueError):
+    """The request as a whole is malformed (not a list, too many operations)"""
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _validate(operation, existing, referenced):
+    """Check one operation; returns its cleaned fields or raises ValueError"""
+    if not isinstance(operation, dict):
+        raise ValueError('Operation must be an object')
+    op = operation.get('op')
+    if op not in OPERATIONS:
+        raise ValueError("op must be 'create', 'update' or 'delete'")
+
+    if op == 'create':
+        amount, expense_date, expense_time, category, notes = importer.parse_record(operation)
+        return {'amount': amount, 'date': expense_date, 'time': expense_time, 'category': category, 'notes': notes}
+
+    expense_id = operation.get('id')
+    if not _is_id(expense_id) or expense_id not in existing:
+        raise ValueError('Expense not found')
+    if expense_id in referenced:
+        raise ValueError('Expense appears more than once in this batch')
+    referenced.add(expense_id)
+    if op == 'delete':
+        return {}
+
+    fields = {name: clean(operation[name]) for name, clean in UPDATE_FIELDS.items() if name in operation}
+    if not fields:
+        raise ValueError('Nothing to update')
+    return fields
+
+
+def _load_existing(user_id, operations):
+    ids = {op.get('id') for op in operations
+           if isinstance(op, dict) and op.get('op') in ('update', 'delete') and _is_id(op.get('id'))}
+    if not ids:
+        return {}
+    expense = Expense.__table__.c
+    rows = db.session.execute(
+        db.select(expense.id, expense.amount, expense.date, expense.time, expense.category_id, expense.notes)
+        .where(expense.user_id == user_id, expense.id.in_(ids))
+    ).all()
+    return {row.id: row._asdict() for row in rows}
+
+
+def apply_operations(user_id, operations, atomic=False):
+    """
+    Validate and apply a list of operations for the user.
+    Returns (results, applied) where results has one entry per operation and
+    applied is False when nothing was written.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise BatchError('operations must be a non-empty list')
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError(f'At most {MAX_OPERATIONS} operations per batch')
+
+    existing = _load_existing(user_id, operations)
+    referenced = set()
+    results = []
+    valid = []
+    for index, operation in enumerate(operations):
+        try:
+            fields = _validate(operation, existing, referenced)
+        except ValueError as e:
+            results.append({'index': index, 'success': False, 'error': str(e)})
+            continue
+        results.append({'index': index, 'success': True, 'op': operation['op']})
+        valid.append((index, operation, fields))
+
+    if not valid or (atomic and len(valid) < len(operations)):
+        if atomic:
+            for result in results:
+                if result['success']:
+                    result.update(success=False, error='Not applied: another operation in the batch is invalid')
+        return results, False
+
+    category_ids = category_registry.get_or_create_many(
+        {fields['category'] for _, _, fields in valid if 'category' in fields}, user_id
+    )
+    deltas = rollups.new_deltas()
+    creates, updates, deletes = [], [], []
+    for index, operation, fields in valid:
+        if 'category' in fields:
+            fields['category_id'] = category_ids[fields.pop('category')]
+        if 'notes' in fields:
+            fields['notes'] = fields['notes'] or None
+
+        if operation['op'] == 'create':
+            creates.append((index, dict(fields, user_id=user_id)))
+            rollups.add_delta(deltas, user_id, fields['date'], fields['category_id'], fields['amount'])
+            continue
+
+        old = existing[operation['id']]
+        rollups.add_delta(deltas, user_id, old['date'], old['category_id'], old['amount'], sign=-1)
+        if operation['op'] == 'delete':
+            deletes.append(operation['id'])
+            continue
+        # Every row in the executemany sets every column, unchanged ones to their current value
+        new = dict(old, **fields)
+        updates.append(dict(new, expense_id=operation['id']))
+        rollups.add_delta(deltas, user_id, new['date'], new['category_id'], new['amount'])
+
+    table = Expense.__table__
+    if creates:
+        rows = [row for _, row in creates]
+        if db.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+            new_ids = db.session.execute(
+                table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+            ).scalars().all()
+        else:
+            new_ids = [db.session.execute(table.insert().values(**row)).inserted_primary_key[0] for row in rows]
+        for (index, _), new_id in zip(creates, new_ids):
+            results[index]['id'] = new_id
+    if updates:
+        # Bound parameters may not share the column names they set, hence the new_ prefix
+        columns = ('amount', 'date', 'time', 'category_id', 'notes')
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('expense_id')).values(
+                {column: bindparam(f'new_{column}') for column in columns}
+            ),
+            [dict({f'new_{column}': row[column] for column in columns}, expense_id=row['expense_id'])
+             for row in updates]
+        )
+    if deletes:
+        db.session.execute(table.delete().where(table.c.user_id == user_id, table.c.id.in_(deletes)))
+    for index, operation, _ in valid:
+        if operation['op'] != 'create':
+            results[index]['id'] = operation['id']
+
+    rollups.apply_deltas(db.session, deltas)
+    data_version.bump(db.session, [user_id])
+    db.session.commit()
+    return results, True
@@ -0,0 +1,217 @@
+"""
+Chart data for /view_expenses.
+
+Both charts are built from the spend rollups rather than from expense rows:
+the pie is the per-category total and the bar chart stacks per-category totals
+in day, week or month buckets, whichever keeps the number of bars under
+MAX_BARS for the filtered date range. The figures are compact Plotly JSON
+(a few numbers per bar) that the page hands to plotly.js, so page size and
+render time depend on the number of buckets and categories, not on how many
+expenses the user has. Figures are cached per (user, filter) under the user's
+data version.
+
+plotly.js itself is served once, from the copy bundled with the plotly
+package, under a URL that changes with its content so browsers can cache it
+for good.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+from datetime import timedelta
+from sqlalchemy import func
+import plotly
+from extensions import db
+from models import SpendRollup
+from data_version import VersionedCache
+import category_registry
+import rollups
+
+MAX_BARS = 60
+PLOTLY_JS_PATH = os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js')
+
+# Bar widths for plotly's xperiod, so every bar spans its whole bucket
+BUCKET_PERIODS = {'day': 86_400_000, 'week': 7 * 86_400_000, 'month': 'M1'}
+
+_cache = VersionedCache()
+_plotly_js = None  # (content hash, gzip-compressed bytes), loaded on first use
+_plotly_js_lock = threading.Lock()
+
+
+def bucket_size(first, last):
+    """'day', 'week' or 'month': the smallest bucket giving at most MAX_BARS bars"""
+    days = (last - first).days + 1
+    if days <= MAX_BARS:
+        return 'day'
+    if days <= MAX_BARS * 7:
+        return 'week'
+    return 'month'
+
+
+def bucket_start(value, bucket):
+    if bucket == 'week':
+        return value - timedelta(days=value.weekday())
+    if bucket == 'month':
+        return rollups.month_start(value)
+    return value
+
+
+def _filtered(stmt, user_id, granularity, first, last, category_id):
+    stmt = stmt.where(
+        SpendRollup.user_id == user_id,
+        SpendRollup.granularity == granularity,
+        SpendRollup.period_start.between(first, last)
+    )
+    if category_id:
+        stmt = stmt.where(SpendRollup.category_id == category_id)
+    return stmt
+
+
+def _extent(user_id, start, end, category_id):
+    """First and last day with expenses, within the filter if one is given"""
+    stmt = db.select(func.min(SpendRollup.period_start), func.max(SpendRollup.period_start))
+    if start is None:
+        stmt = stmt.where(SpendRollup.user_id == user_id, SpendRollup.granularity == 'day')
+        if category_id:
+            stmt = stmt.where(SpendRollup.category_id == category_id)
+    else:
+        stmt = _filtered(stmt, user_id, 'day', start, end, category_id)
+    first, last = db.session.execute(stmt).one()
+    if first is None:
+        return None, None
+    return rollups._as_date(first), rollups._as_date(last)
+
+
+def _rollup_totals(user_id, granularity, first, last, category_id):
+    stmt = db.select(SpendRollup.period_start, SpendRollup.category_id, SpendRollup.total)
+    return db.session.execute(_filtered(stmt, user_id, granularity, first, last, category_id)).all()
+
+
+def bucket_totals(user_id, first, last, bucket, category_id=0):
+    """
+    {(bucket start, category id): total} between two dates. Month buckets read
+    the monthly rollups for whole months and daily ones only for the partial
+    months at either end; day and week buckets read at most MAX_BARS * 7 days.
+    """
+    rows = []
+    if bucket == 'month':
+        whole_first = first if first.day == 1 else rollups.month_start(first.replace(day=28) + timedelta(days=4))
+        whole_last = rollups.month_start(last + timedelta(days=1)) - timedelta(days=1)
+        if whole_first <= whole_last:
+            rows += _rollup_totals(user_id, 'month', whole_first, rollups.month_start(whole_last), category_id)
+            if first < whole_first:
+                rows += _rollup_totals(user_id, 'day', first, whole_first - timedelta(days=1), category_id)
+            if whole_last < last:
+                rows += _rollup_totals(user_id, 'day', whole_last + timedelta(days=1), last, category_id)
+        else:
+            rows = _rollup_totals(user_id, 'day', first, last, category_id)
+    else:
+        rows = _rollup_totals(user_id, 'day', first, last, category_id)
+
+    totals = {}
+    for period, row_category_id, total in rows:
+        key = (bucket_start(rollups._as_date(period), bucket), row_category_id)
+        totals[key] = totals.get(key, 0) + total
+    return totals
+
+
+def pie_figure(category_totals):
+    names = sorted(category_totals, key=category_totals.get, reverse=True)
+    return {
+        'data': [{
+            'type': 'pie',
+            'labels': names,
+            'values': [round(category_totals[name], 2) for name in names],
+            'sort': False,
+        }],
+        'layout': {'margin': {'t': 20, 'b': 20, 'l': 20, 'r': 20}},
+    }
+
+
+def bar_figure(series, bucket):
+    """One stacked bar trace per category; ``series`` is a list of (name, {bucket start: total})"""
+    traces = []
+    for name, points in series:
+        buckets = sorted(points)
+        traces.append({
+            'type': 'bar',
+            'name': name,
+            'x': [b.isoformat() for b in buckets],
+            'y': [round(points[b], 2) for b in buckets],
+            'xperiod': BUCKET_PERIODS[bucket],
+            'xperiodalignment': 'start',
+        })
+    return {
+        'data': traces,
+        'layout': {
+            'barmode': 'stack',
+            'margin': {'t': 20, 'b': 40, 'l': 50, 'r': 20},
+            'xaxis': {'type': 'date', 'title': {'text': bucket.capitalize()}},
+            'yaxis': {'title': {'text': 'Amount'}},
+        },
+    }
+
+
+def summarize(user_id, start=None, end=None, category_id=0):
+    """
+    The aggregated data both charts are drawn from, or None when nothing
+    matches: (bucket, {category name: total}, [(category name, {bucket start: total})])
+    with categories largest first.
+    """
+    first, last = _extent(user_id, start, end, category_id)
+    if first is None:
+        return None
+    bucket = bucket_size(first, last)
+
+    # Categories are grouped by name, as the charts show them
+    by_name = {}
+    for (period, row_category_id), total in bucket_totals(user_id, first, last, bucket, category_id).items():
+        name = category_registry.name_for(row_category_id, user_id) or 'Uncategorized'
+        points = by_name.setdefault(name, {})
+        points[period] = points.get(period, 0) + total
+
+    category_totals = {name: sum(points.values()) for name, points in by_name.items()}
+    ordered = sorted(by_name.items(), key=lambda item: category_totals[item[0]], reverse=True)
+    return bucket, category_totals, ordered
+
+
+def build_charts(user_id, start=None, end=None, category_id=0):
+    """The pie and bar figures for the filter, or None when nothing matches"""
+    summary = summarize(user_id, start, end, category_id)
+    if summary is None:
+        return None
+    bucket, category_totals, ordered = summary
+    return {
+        'bucket': bucket,
+        'pie': pie_figure(category_totals),
+        'bar': bar_figure(ordered, bucket),
+    }
+
+
+def cached_charts(user_id, version, start=None, end=None, category_id=0):
+    key = (user_id, start, end, category_id)
+    charts = _cache.get(key, version)
+    if charts is None:
+        charts = _cache.set(key, version, build_charts(user_id, start, end, category_id))
+    return charts
+
+
+def _load_plotly_js():
+    global _plotly_js
+    with _plotly_js_lock:
+        if _plotly_js is None:
+            with open(PLOTLY_JS_PATH, 'rb') as f:
+                source = f.read()
+            _plotly_js = (hashlib.sha1(source).hexdigest()[:12], gzip.compress(source, 9))
+    return _plotly_js
+
+
+def plotly_js_version():
+    """Content hash of the bundled plotly.js, used in its URL"""
+    return _load_plotly_js()[0]
+
+
+def plotly_js_gzip():
+    """The bundled plotly.js, compressed once per worker"""
+    return _load_plotly_js()[1]
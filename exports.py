@@ -0,0 +1,177 @@
+"""
+Streaming expense exports.
+
+Rows are read with a Core select using ``yield_per`` (a server-side cursor on
+PostgreSQL) and turned into CSV a batch at a time, so the memory an export
+needs does not depend on how many expenses it contains. Optionally the CSV is
+gzip-compressed on the fly.
+
+The columnar exports (Parquet and the Arrow IPC file format) go from each
+fetched batch of rows straight to an Arrow record batch of typed columns:
+date32 days, float64 amounts and dictionary-encoded category names. They need
+the optional ``pyarrow`` package, which is only imported when one is requested.
+"""
+
+import csv
+import importlib.util
+import io
+import zlib
+from datetime import datetime
+import numpy as np
+from extensions import db
+from models import Category, Expense
+
+BATCH_SIZE = 1000
+CSV_HEADER = ['Amount', 'Date', 'Category', 'Notes', 'Time']
+# Finished files (PDF, Parquet, Arrow) stay in memory up to this size, then spill to disk
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+# Columnar exports write one Parquet row group / Arrow record batch per fetch
+COLUMNAR_BATCH_SIZE = 65_536
+COLUMNAR_FORMATS = {
+    'parquet': ('expenses.parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('expenses.arrow', 'application/vnd.apache.arrow.file'),
+}
+
+
+def parse_date_range(start_date, end_date):
+    """
+    Parse the dd-mm-yyyy ``start_date``/``end_date`` request arguments.
+    Returns (start, end), or (None, None) unless both are given. Raises ValueError
+    on a malformed date.
+    """
+    if not (start_date and end_date):
+        return None, None
+    # Dates, not datetimes: SQLite compares them as text and '2026-03-01' < '2026-03-01 00:00:00'
+    return datetime.strptime(start_date, '%d-%m-%Y').date(), datetime.strptime(end_date, '%d-%m-%Y').date()
+
+
+def filter_expenses(stmt, user_id, start=None, end=None, category_id=None):
+    """Restrict a select over Expense to one user's rows, a date range and a category"""
+    stmt = stmt.where(Expense.user_id == user_id)
+    if start and end:
+        stmt = stmt.where(Expense.date.between(start, end))
+    if category_id:
+        stmt = stmt.where(Expense.category_id == category_id)
+    return stmt
+
+
+def expense_rows(user_id, start=None, end=None, category_id=None, batch_size=BATCH_SIZE):
+    """
+    Yield (amount, date, category name, notes, time) tuples for a user's expenses,
+    oldest first, fetched from the database ``batch_size`` rows at a time.
+    """
+    stmt = db.select(
+        Expense.amount, Expense.date, Category.name, Expense.notes, Expense.time
+    ).outerjoin(Category, Category.id == Expense.category_id)
+    stmt = filter_expenses(stmt, user_id, start, end, category_id)
+    stmt = stmt.order_by(Expense.date, Expense.id).execution_options(yield_per=batch_size)
+    for partition in db.session.execute(stmt).partitions():
+        yield from partition
+
+
+def csv_chunks(rows, batch_size=BATCH_SIZE):
+    """Encode rows as CSV, yielding one chunk of bytes per ``batch_size`` lines"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(CSV_HEADER)
+    pending = 0
+    for amount, expense_date, category, notes, expense_time in rows:
+        writer.writerow([
+            amount,
+            expense_date.strftime('%d-%m-%Y'),
+            category or 'Uncategorized',
+            notes or '',
+            expense_time.strftime('%H:%M:%S') if expense_time else ''
+        ])
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of byte chunks into a single gzip member"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def columnar_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def arrow_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.date32()),
+        ('time', pa.time64('us')),
+        ('amount', pa.float64()),
+        ('category', pa.dictionary(pa.int32(), pa.string())),
+        ('notes', pa.string()),
+    ])
+
+
+def record_batches(user_id, start=None, end=None, category_id=None, batch_size=COLUMNAR_BATCH_SIZE):
+    """
+    Return (schema, iterator of pyarrow RecordBatches) for a user's expenses, oldest first.
+
+    Categories share one dictionary across every batch (the IPC file format
+    cannot replace a dictionary mid-file), built from the categories the
+    filtered expenses actually use.
+    """
+    import pyarrow as pa
+
+    used = db.select(Category.id, Category.name).where(
+        Category.id.in_(filter_expenses(db.select(Expense.category_id), user_id, start, end, category_id))
+    ).order_by(Category.name)
+    categories = db.session.execute(used).all()
+    dictionary = pa.array([name for _, name in categories], pa.string())
+    # Lookup table from category id to dictionary index
+    index_of = np.zeros(max((cid for cid, _ in categories), default=0) + 1, dtype=np.int32)
+    index_of[[cid for cid, _ in categories]] = np.arange(len(categories), dtype=np.int32)
+    schema = arrow_schema()
+
+    stmt = db.select(Expense.id, Expense.date, Expense.time, Expense.amount, Expense.category_id, Expense.notes)
+    stmt = filter_expenses(stmt, user_id, start, end, category_id)
+    stmt = stmt.order_by(Expense.date, Expense.id).execution_options(yield_per=batch_size)
+
+    def batches():
+        for partition in db.session.execute(stmt).partitions():
+            ids, dates, times, amounts, category_ids, notes = zip(*partition)
+            categories_column = pa.DictionaryArray.from_arrays(
+                pa.array(index_of[np.fromiter(category_ids, dtype=np.int64, count=len(category_ids))]),
+                dictionary
+            )
+            yield pa.RecordBatch.from_arrays([
+                pa.array(ids, pa.int64()),
+                pa.array(dates, pa.date32()),
+                pa.array(times, pa.time64('us')),
+                pa.array(amounts, pa.float64()),
+                categories_column,
+                pa.array(notes, pa.string()),
+            ], schema=schema)
+
+    return schema, batches()
+
+
+def write_columnar(output, export_format, user_id, start=None, end=None, category_id=None):
+    """Write a user's expenses to the binary file-like ``output`` as 'parquet' or 'arrow'"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema, batches = record_batches(user_id, start, end, category_id)
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(output, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(output, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    with writer:
+        for batch in batches:
+            writer.write_batch(batch)
+    return output
@@ -0,0 +1,197 @@
+"""
+Expense parsing for the FinMate chat (/finmate).
+
+``parse(text)`` pulls every expense out of a message such as "I spent ₹200
+on food and ₹50 on transport yesterday". The message is read in a single
+pass of one precompiled tokenizer, which yields amounts, category words,
+relative or explicit dates and clause separators. The tokens are then paired
+up:
+
+* an amount pairs with the category word next to it, before or after
+  ("₹200 food", "food ₹200", "groceries cost 120");
+* messages are split into clauses by "and", commas and the like. An amount
+  is explicit if it has a currency marker (₹, Rs, INR, rupees) or follows
+  "cost", "paid", "spent" and similar. When a clause has an explicit amount,
+  the bare numbers in that clause are quantities, not prices, so "₹600
+  dinner for 3 people" and "lunch for 2 cost 400" are one expense each (600
+  and 400), while "₹200 food and 50 transport" is still two;
+* a clause with no explicit amount but several numbers has one price among
+  them: the last one after "for", "at", "bought" or "purchased", else the
+  last one ("bought 3 movie tickets for 600", "5 movies 1000");
+* an expense takes the date mentioned in its own clause, else the first
+  date in the message, else today. A date that does not exist ("31-02-2026")
+  leaves the expense's date None, for the chat to ask for it.
+
+Questions (anything with a "?") are never read as expenses.
+"""
+
+import re
+from collections import namedtuple
+from datetime import date, timedelta
+
+ParsedExpense = namedtuple('ParsedExpense', 'amount category date')
+
+# How sure the parser is that an amount is a price, lowest first
+BARE, WEAK, EXPLICIT = range(3)
+
+# Category words the chat understands, and the category each one is filed under
+CATEGORY_SYNONYMS = {
+    'food': 'Food', 'groceries': 'Food', 'grocery': 'Food', 'lunch': 'Food', 'dinner': 'Food',
+    'breakfast': 'Food', 'snacks': 'Food', 'restaurant': 'Food',
+    'transport': 'Transport', 'transportation': 'Transport', 'travel': 'Transport', 'taxi': 'Transport',
+    'cab': 'Transport', 'bus': 'Transport', 'train': 'Transport', 'fuel': 'Transport', 'petrol': 'Transport',
+    'bills': 'Bills', 'bill': 'Bills', 'rent': 'Bills', 'electricity': 'Bills', 'utilities': 'Bills',
+    'entertainment': 'Entertainment', 'movie': 'Entertainment', 'movies': 'Entertainment',
+    'health': 'Health', 'medicine': 'Health', 'medicines': 'Health', 'doctor': 'Health', 'pharmacy': 'Health',
+    'shopping': 'Shopping', 'clothes': 'Shopping',
+    'others': 'Others', 'other': 'Others', 'misc': 'Others', 'miscellaneous': 'Others',
+}
+
+WEEKDAYS = {name: index for index, name in enumerate(
+    ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'))}
+WEEKDAYS.update({name[:3]: index for name, index in list(WEEKDAYS.items())})
+
+_COUNTS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7}
+
+# Words after which a number is a price ("cost 400", "paid me 250")
+_PRICE_WORDS = {'cost', 'costs', 'costing', 'paid', 'pay', 'spent', 'spend', 'spending', 'total', 'came', 'was', 'is'}
+# Words after which a number is more likely a price than one without, but may
+# still be a count ("bought 3 tickets for 600", "movie for 2 at 500")
+_WEAK_PRICE_WORDS = {'for', 'at', 'bought', 'purchased'}
+_FILLER_WORDS = {'me', 'us', 'to', 'about', 'around', 'only', 'just'}
+
+_AMOUNT = (r'(?:(?P<currency>₹|\b(?:rs|inr)(?![a-z])\.?)\s*)?'
+           r'(?P<number>\d+(?:,\d{2,3})*(?:\.\d+)?|\.\d+)'
+           r'(?P<suffix>k\b|\s*(?:rupees?|rs|inr)\b)?')
+
+# One alternation, tried left to right at each position: the date forms come
+# before the amount so the digits in "12-03-2026" or "3 days ago" are not amounts
+_TOKENS = re.compile(rf"""
+    (?P<sep>\b(?:and|also|plus|then)\b|[,;&+\n])
+  | (?P<date>\b\d{{1,2}}[-/.]\d{{1,2}}[-/.]\d{{4}}\b|\b\d{{4}}-\d{{2}}-\d{{2}}\b)
+  | (?P<ago>\b(?P<count>\d+|{'|'.join(_COUNTS)})\s+(?P<unit>days?|weeks?)\s+ago\b)
+  | (?P<clock>\b\d{{1,2}}(?::\d{{2}})?\s*(?:am|pm)\b)
+  | (?P<amount>{_AMOUNT})
+  | (?P<word>[a-z]+)
+""", re.IGNORECASE | re.VERBOSE)
+
+_AMOUNT_ONLY = re.compile(rf'\s*{_AMOUNT}\s*', re.IGNORECASE)
+
+
+def _number(match):
+    value = float(match.group('number').replace(',', ''))
+    if (match.group('suffix') or '').lower() == 'k':
+        value *= 1000
+    return value
+
+
+def _explicit_date(value):
+    parts = re.split(r'[-/.]', value)
+    day, month, year = parts[::-1] if len(parts[0]) == 4 else parts
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def amount_only(text):
+    """The amount if ``text`` is nothing but an amount ("₹500", "1,200", "2k"), else None"""
+    match = _AMOUNT_ONLY.fullmatch(text)
+    return _number(match) if match else None
+
+
+def tokenize(text, today=None):
+    """
+    ``text`` as a list of (kind, value) tuples: ('amount', (value, rank)),
+    ('category', name), ('date', date) and ('sep', None). An amount's rank is
+    EXPLICIT when it has a currency marker or follows a price word, WEAK when
+    it follows a weak price word, else BARE. A date that does not exist is
+    ('date', None). Other words and symbols are dropped.
+    """
+    today = today or date.today()
+    tokens = []
+    previous = second_previous = None
+    for match in _TOKENS.finditer(text):
+        kind = match.lastgroup
+        if kind == 'sep':
+            tokens.append(('sep', None))
+        elif kind == 'date':
+            tokens.append(('date', _explicit_date(match.group('date'))))
+        elif kind == 'ago':
+            count = match.group('count').lower()
+            days = int(count) if count.isdigit() else _COUNTS[count]
+            if match.group('unit').lower().startswith('week'):
+                days *= 7
+            tokens.append(('date', today - timedelta(days=days)))
+        elif kind == 'amount':
+            marked = bool(match.group('currency') or (match.group('suffix') or '').strip().lower() not in ('', 'k'))
+            priced = previous in _PRICE_WORDS or (previous in _FILLER_WORDS and second_previous in _PRICE_WORDS)
+            rank = EXPLICIT if marked or priced else WEAK if previous in _WEAK_PRICE_WORDS else BARE
+            tokens.append(('amount', (_number(match), rank)))
+        elif kind == 'word':
+            word = match.group('word').lower()
+            if word in CATEGORY_SYNONYMS:
+                tokens.append(('category', CATEGORY_SYNONYMS[word]))
+            elif word == 'today' or word == 'tonight':
+                tokens.append(('date', today))
+            elif word == 'yesterday':
+                before = previous == 'before' and second_previous == 'day'
+                tokens.append(('date', today - timedelta(days=2 if before else 1)))
+            elif word in WEEKDAYS:
+                days = (today.weekday() - WEEKDAYS[word]) % 7
+                if days == 0 and previous == 'last':
+                    days = 7
+                tokens.append(('date', today - timedelta(days=days)))
+            elif word == 'week' and previous == 'last':
+                tokens.append(('date', today - timedelta(days=7)))
+            second_previous, previous = previous, word
+            continue
+        second_previous = previous = None
+    return tokens
+
+
+def parse(text, today=None):
+    """Every expense in ``text`` as a list of ParsedExpense, in the order they appear"""
+    if not text or '?' in text:
+        return []
+    today = today or date.today()
+    tokens = tokenize(text, today)
+    clauses = []
+    best_rank = {}  # clause -> highest amount rank in it
+    last_best = {}  # clause -> index of its last amount of that rank
+    clause = 0
+    for index, (kind, value) in enumerate(tokens):
+        clause += kind == 'sep'
+        clauses.append(clause)
+        if kind == 'amount' and value[1] >= best_rank.get(clause, BARE):
+            best_rank[clause] = value[1]
+            last_best[clause] = index
+
+    found = []  # (amount, category, clause)
+    clause_dates = {}
+    dates = []
+    pending_amount = pending_category = None
+    for index, ((kind, value), clause) in enumerate(zip(tokens, clauses)):
+        if kind == 'date':
+            clause_dates.setdefault(clause, value)
+            dates.append(value)
+        elif kind == 'amount':
+            amount, rank = value
+            if rank < best_rank[clause] or (rank < EXPLICIT and index != last_best[clause]):
+                continue
+            if pending_category is not None:
+                found.append((amount, pending_category, clause))
+                pending_category = None
+            else:
+                pending_amount = amount
+        elif kind == 'category':
+            if pending_amount is not None:
+                found.append((pending_amount, value, clause))
+                pending_amount = None
+            else:
+                pending_category = value
+
+    return [
+        ParsedExpense(round(amount, 2), category, clause_dates.get(clause, dates[0] if dates else today))
+        for amount, category, clause in found if amount > 0
+    ]
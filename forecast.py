@@ -0,0 +1,270 @@
+"""
+Expense forecasting for /api/expenses/predict.
+
+The history is a category x month matrix of totals, read from the monthly
+spend rollups with one GROUP BY, and every category is fitted at once with
+NumPy array operations:
+
+    wma       weighted moving average of the last three months (a flat forecast)
+    linear    least-squares trend over the history
+    seasonal  linear trend plus each calendar month's average deviation from it
+              (needs two years of history)
+
+``auto`` picks the richest method the history supports. Forecasts are
+deterministic and come with a confidence band built from each category's
+in-sample residuals. The month in progress is left out of the fit, since its
+total is still growing, unless it is the only month there is.
+
+Default-method forecasts are precomputed for every user by forecast_job.py
+and stored in expense_forecast; stored_predict() serves them while they are
+still current.
+"""
+
+import json
+from datetime import date, datetime
+import numpy as np
+from sqlalchemy import func
+from extensions import db
+from models import Category, SpendRollup, ExpenseForecast
+from analytics import add_months
+import data_version
+import rollups
+
+METHODS = ('auto', 'wma', 'linear', 'seasonal')
+MIN_MONTHS = {'wma': 1, 'linear': 6, 'seasonal': 24}
+WMA_WEIGHTS = np.array([0.2, 0.3, 0.5])  # oldest to newest
+HISTORY_MONTHS = 36
+STORED_MONTHS = 12  # the longest forecast /api/expenses/predict serves
+MIN_EXPENSES = 5
+CONFIDENCE = 0.8
+Z_SCORE = 1.2816  # two-sided 80% normal quantile
+
+
+def month_index(month):
+    """Months since year 0, so consecutive calendar months are consecutive integers"""
+    return month.year * 12 + month.month - 1
+
+
+def history_query(today, history_months=HISTORY_MONTHS):
+    """(user id, month, category name, total, count) rows for every month up to ``today``'s"""
+    this_month = rollups.month_start(today)
+    return db.session.query(
+        SpendRollup.user_id,
+        SpendRollup.period_start,
+        Category.name,
+        func.sum(SpendRollup.total),
+        func.sum(SpendRollup.count)
+    ).join(Category, Category.id == SpendRollup.category_id).filter(
+        SpendRollup.granularity == 'month',
+        SpendRollup.period_start.between(add_months(this_month, -history_months), this_month)
+    ).group_by(SpendRollup.user_id, SpendRollup.period_start, Category.name)
+
+
+def history_matrix(rows, through):
+    """
+    Pivot (month, category name, total) rows into (first month index,
+    category names, C x T array) with one column per calendar month from
+    the earliest row through the month index ``through``; months without
+    expenses are zero.
+    """
+    index_of = {period: month_index(rollups._as_date(period)) for period in {row[0] for row in rows}}
+    months = np.array([index_of[row[0]] for row in rows])
+    names = sorted({row[1] for row in rows})
+    positions = {name: i for i, name in enumerate(names)}
+    first = int(months.min())
+    history = np.zeros((len(names), through - first + 1))
+    np.add.at(history, ([positions[row[1]] for row in rows], months - first), [row[2] for row in rows])
+    return first, names, history
+
+
+def choose_method(method, months):
+    """``method``, or the next simpler one if ``months`` of history are too few for it"""
+    order = ['seasonal', 'linear', 'wma']
+    for candidate in order[0 if method == 'auto' else order.index(method):]:
+        if months >= MIN_MONTHS[candidate]:
+            return candidate
+    return 'wma'
+
+
+def fit(history, steps, method='auto', first_calendar_month=0):
+    """
+    Forecast every row of the C x T ``history`` (oldest column first)
+    ``steps`` months past its last column. ``first_calendar_month`` (0-11) is
+    the calendar month of column 0, for the seasonal method.
+    Returns (method used, C x H forecasts, C x H standard errors).
+    """
+    months = history.shape[1]
+    steps = np.asarray(steps)
+    method = choose_method(method, months)
+
+    if method == 'wma':
+        recent = min(len(WMA_WEIGHTS), months)
+        weights = WMA_WEIGHTS[-recent:] / WMA_WEIGHTS[-recent:].sum()
+        level = history[:, -recent:] @ weights
+        forecast = np.repeat(level[:, None], len(steps), axis=1)
+        window = history[:, -12:]
+        residuals = window - level[:, None]
+        dof = max(window.shape[1] - 1, 1)
+        spread = np.ones(len(steps))
+    else:
+        t = np.arange(months, dtype=float)
+        centred = t - t.mean()
+        sxx = centred @ centred
+        mean = history.mean(axis=1)
+        slope = history @ centred / sxx
+        future = months - 1 + steps - t.mean()
+        forecast = mean[:, None] + slope[:, None] * future
+        residuals = history - (mean[:, None] + slope[:, None] * centred)
+        dof = months - 2
+        if method == 'seasonal':
+            calendar = (first_calendar_month + np.arange(months)) % 12
+            one_hot = np.eye(12)[calendar]
+            seasonal = residuals @ one_hot / one_hot.sum(axis=0)
+            seasonal -= seasonal.mean(axis=1, keepdims=True)
+            residuals = residuals - seasonal[:, calendar]
+            forecast = forecast + seasonal[:, (first_calendar_month + months - 1 + steps) % 12]
+            dof -= 11
+        # Standard error of a new observation under a linear trend
+        spread = np.sqrt(1 + 1 / months + future ** 2 / sxx)
+
+    sigma = np.sqrt((residuals ** 2).sum(axis=1) / max(dof, 1))
+    return method, np.maximum(forecast, 0), sigma[:, None] * spread[None, :]
+
+
+def forecast_months(rows, today, months, method='auto'):
+    """
+    Forecasts for the ``months`` calendar months after ``today``'s, from one
+    user's (month, category name, total) history rows.
+    Returns (method, [month starts], category names, forecast, lower, upper)
+    with C x H arrays.
+    """
+    this_month = month_index(rollups.month_start(today))
+    first, names, history = history_matrix(rows, this_month)
+    if history.shape[1] > 1:
+        history = history[:, :-1]  # drop the month in progress
+    last = first + history.shape[1] - 1
+    steps = np.arange(this_month + 1, this_month + months + 1) - last
+
+    method, forecast, error = fit(history, steps, method, first % 12)
+    margin = Z_SCORE * error
+    future_months = [add_months(rollups.month_start(today), i) for i in range(1, months + 1)]
+    return method, future_months, names, forecast, np.maximum(forecast - margin, 0), forecast + margin
+
+
+def format_forecast(method, future_months, names, forecast, lower, upper):
+    """The /api/expenses/predict payload for one user's forecast arrays"""
+    totals = forecast.sum(axis=0)
+    # Category errors are treated as independent, so the total's band adds them in quadrature
+    total_margin = np.sqrt(((upper - forecast) ** 2).sum(axis=0))
+    # Round whole arrays at once and index plain lists; per-value round() dominates otherwise
+    amounts, lows, highs = (np.round(values, 2).T.tolist() for values in (forecast, lower, upper))
+    total_amounts, total_lows, total_highs = (
+        np.round(values, 2).tolist()
+        for values in (totals, np.maximum(totals - total_margin, 0), totals + total_margin)
+    )
+    by_month = {}
+    for h, month in enumerate(future_months):
+        shown = [i for i, amount in enumerate(amounts[h]) if amount > 0]
+        by_month[month.strftime('%Y-%m')] = {
+            'total': total_amounts[h],
+            'lower': total_lows[h],
+            'upper': total_highs[h],
+            'categories': {names[i]: amounts[h][i] for i in shown},
+            'ranges': {names[i]: [lows[h][i], highs[h][i]] for i in shown},
+        }
+    return {
+        'success': True,
+        'message': f"Expense predictions for the next {len(future_months)} months",
+        'method': method,
+        'confidence': CONFIDENCE,
+        'predictions': {
+            'by_month': by_month,
+            'total_predicted': round(float(totals.sum()), 2),
+        },
+    }
+
+
+def predict_from_rows(rows, today, months=3, method='auto'):
+    """The payload for one user's (month, category name, total, count) history rows"""
+    expense_count = sum(row[3] for row in rows)
+    if expense_count < MIN_EXPENSES:
+        return {
+            'success': False,
+            'message': f"Not enough expense data to make accurate predictions. You currently have "
+                       f"{expense_count} expenses in the last {HISTORY_MONTHS} months, but at least "
+                       f"{MIN_EXPENSES} are needed."
+        }
+    return format_forecast(*forecast_months(rows, today, months, method))
+
+
+def predict(user_id, months=3, method='auto', today=None):
+    """Forecast a user's spending by category for the next ``months`` months"""
+    today = today or date.today()
+    rows = history_query(today).filter(SpendRollup.user_id == user_id).all()
+    return predict_from_rows([row[1:] for row in rows], today, months, method)
+
+
+def first_months(payload, months):
+    """A stored STORED_MONTHS-month payload cut down to its first ``months`` months"""
+    if not payload.get('success'):
+        return payload
+    by_month = dict(list(payload['predictions']['by_month'].items())[:months])
+    return dict(
+        payload,
+        message=f"Expense predictions for the next {len(by_month)} months",
+        predictions={
+            'by_month': by_month,
+            'total_predicted': round(sum(month['total'] for month in by_month.values()), 2),
+        },
+    )
+
+
+def forecast_record(user_id, version, today, payload):
+    return {
+        'user_id': user_id,
+        'base_month': rollups.month_start(today),
+        'data_version': version,
+        'computed_at': datetime.now(),
+        'payload': json.dumps(payload, separators=(',', ':')),
+    }
+
+
+def store(records):
+    """Upsert forecast_record() dicts into expense_forecast in the session's transaction"""
+    if not records:
+        return
+    table = ExpenseForecast.__table__
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name in ('postgresql', 'sqlite'):
+        if dialect_name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={column: stmt.excluded[column] for column in ('base_month', 'data_version', 'computed_at', 'payload')},
+        )
+        db.session.execute(stmt, records)
+    else:
+        db.session.execute(table.delete().where(table.c.user_id.in_([r['user_id'] for r in records])))
+        db.session.execute(table.insert(), records)
+
+
+def stored_predict(user_id, months=3, today=None):
+    """
+    predict() with the default method, served from expense_forecast (filled
+    nightly by forecast_job.py) as long as the stored forecast was made this
+    month and the user's data version has not moved since. Otherwise the
+    forecast is computed now and stored for the next request.
+    """
+    today = today or date.today()
+    version = data_version.current(user_id)
+    stored = db.session.get(ExpenseForecast, user_id)
+    if stored and stored.data_version == version and stored.base_month == rollups.month_start(today):
+        payload = json.loads(stored.payload)
+    else:
+        payload = predict(user_id, STORED_MONTHS, 'auto', today)
+        store([forecast_record(user_id, version, today, payload)])
+        db.session.commit()
+    return first_months(payload, months)
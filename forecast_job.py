@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Nightly batch job: precompute every user's expense forecast.
+
+Every user's monthly category totals are read in one set-based pass over the
+spend rollups, together with their data versions. Users are split into shards
+of --shard-size and forecast on a pool of --processes worker processes; each
+shard's results are bulk-upserted into expense_forecast with a computed-at
+timestamp and committed as they come back. /api/expenses/predict then serves
+the stored forecast and only recomputes one inline when the user's data has
+changed since the job ran (or a new month has started).
+
+Usage:
+    python forecast_job.py [--processes N] [--shard-size N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import groupby
+import forecast
+
+
+def forecast_shard(shard, today):
+    """
+    Forecast a shard of (user id, data version, history rows) in a worker
+    process. Pure NumPy work: returns forecast_record() dicts and never
+    touches the database.
+    """
+    return [
+        forecast.forecast_record(
+            user_id, version, today, forecast.predict_from_rows(rows, today, forecast.STORED_MONTHS)
+        )
+        for user_id, version, rows in shard
+    ]
+
+
+def load_shards(today, shard_size):
+    """Every user's history rows and data version, in shards of ``shard_size`` users"""
+    from extensions import db
+    from models import DataVersion, SpendRollup
+
+    versions = dict(db.session.query(DataVersion.user_id, DataVersion.version))
+    rows = forecast.history_query(today).order_by(SpendRollup.user_id).all()
+    users = [
+        (user_id, versions.get(user_id, 0), [row[1:] for row in user_rows])
+        for user_id, user_rows in groupby(rows, key=lambda row: row[0])
+    ]
+    return [users[i:i + shard_size] for i in range(0, len(users), shard_size)]
+
+
+def run(processes, shard_size, today=None):
+    """Forecast and store every user; returns (users, seconds)"""
+    from extensions import db
+
+    today = today or date.today()
+    start = time.perf_counter()
+    shards = load_shards(today, shard_size)
+    loaded = time.perf_counter()
+    print(f"Loaded history for {sum(len(shard) for shard in shards):,} users "
+          f"in {loaded - start:.2f}s ({len(shards)} shards)")
+
+    users = 0
+    if processes > 1 and len(shards) > 1:
+        # spawn: workers import this module and forecast, which pulls in the models and
+        # helper modules but not app.py, so no app is created and no connection is opened
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = pool.map(forecast_shard, shards, [today] * len(shards))
+            for records in results:
+                forecast.store(records)
+                db.session.commit()
+                users += len(records)
+    else:
+        for shard in shards:
+            records = forecast_shard(shard, today)
+            forecast.store(records)
+            db.session.commit()
+            users += len(records)
+
+    elapsed = time.perf_counter() - start
+    print(f"Forecast {users:,} users in {elapsed:.2f}s ({users / elapsed if elapsed else 0:,.0f} users/s)")
+    return users, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute every user's expense forecast")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--shard-size', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    from app import app
+
+    with app.app_context():
+        run(args.processes, args.shard_size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
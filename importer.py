@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Bulk expense import from CSV or JSON Lines.
+
+The file is read as a stream and handled in chunks of CHUNK_SIZE rows: each
+chunk is validated, its category names are resolved in bulk (unknown names
+become user categories, created together), duplicates are dropped, and the
+rest is inserted with one executemany (COPY on PostgreSQL) and committed. The
+write lock is therefore only held for one chunk at a time, and an interrupted
+import can simply be re-run since rows already imported are skipped.
+
+A row is a duplicate when an expense with the same (user, date, amount,
+category, notes) fingerprint already exists or appeared earlier in the file.
+
+CSV files need a header row; column names are matched case-insensitively, so
+the output of /export_csv can be imported as it is. JSONL files hold one
+object per line with the same keys. Either may be gzip-compressed (.gz).
+
+    amount    required, greater than zero
+    date      required, dd-mm-yyyy or yyyy-mm-dd
+    category  required, category name
+    notes     optional, up to 200 characters
+    time      optional, HH:MM or HH:MM:SS
+
+Usage:
+    python importer.py USERNAME FILE [--format csv|jsonl]
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+from datetime import date, time as dtime
+from extensions import db
+from models import Expense
+import category_registry
+import data_version
+import rollups
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+MAX_NOTES_LENGTH = 200
+MAX_CATEGORY_LENGTH = 100
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+class ImportReport:
+    """Running totals for one import, plus the first MAX_REPORTED_ERRORS row errors"""
+
+    def __init__(self):
+        self.processed = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        return {
+            'processed': self.processed,
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def detect_format(filename):
+    """'csv' or 'jsonl' from a file name (ignoring a trailing .gz), else None"""
+    name = (filename or '').lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    for extension, file_format in FORMATS.items():
+        if name.endswith(extension):
+            return file_format
+    return None
+
+
+def open_text(binary, filename=''):
+    """Wrap a binary stream as text, decompressing it if the file name ends in .gz"""
+    if (filename or '').lower().endswith('.gz'):
+        binary = gzip.GzipFile(fileobj=binary)
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def read_records(text, file_format):
+    """Yield (line number, record dict) pairs; unparseable JSON lines yield (line, None)"""
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        if reader.fieldnames:
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+
+
+def parse_date(value):
+    """dd-mm-yyyy or yyyy-mm-dd; sliced by hand because strptime dominates import time"""
+    if len(value) == 10 and value[2] == '-' and value[5] == '-':
+        return date(int(value[6:]), int(value[3:5]), int(value[:2]))
+    return date.fromisoformat(value)
+
+
+def clean_amount(value):
+    try:
+        amount = round(float(value), 2)
+    except (TypeError, ValueError):
+        raise ValueError('Amount must be a number')
+    if not amount > 0:
+        raise ValueError('Amount must be greater than zero')
+    return amount
+
+
+def clean_date(value):
+    raw_date = str(value or '').strip()
+    if not raw_date:
+        raise ValueError('Date is required')
+    try:
+        return parse_date(raw_date)
+    except ValueError:
+        raise ValueError(f'Invalid date: {raw_date}')
+
+
+def clean_time(value):
+    raw_time = str(value or '').strip()
+    if not raw_time:
+        return None
+    try:
+        return dtime.fromisoformat(raw_time)
+    except ValueError:
+        raise ValueError(f'Invalid time: {raw_time}')
+
+
+def clean_category(value):
+    category = str(value or '').strip()
+    if not category:
+        raise ValueError('Category is required')
+    if len(category) > MAX_CATEGORY_LENGTH:
+        raise ValueError(f'Category name longer than {MAX_CATEGORY_LENGTH} characters')
+    return category
+
+
+def clean_notes(value):
+    notes = str(value or '').strip()
+    if len(notes) > MAX_NOTES_LENGTH:
+        raise ValueError(f'Notes longer than {MAX_NOTES_LENGTH} characters')
+    return notes
+
+
+def parse_record(record):
+    """
+    Validate one record. Returns (amount, date, time, category name, notes)
+    or raises ValueError with a message for the import report.
+    """
+    if record is None:
+        raise ValueError('Not a JSON object')
+    return (
+        clean_amount(record.get('amount')),
+        clean_date(record.get('date')),
+        clean_time(record.get('time')),
+        clean_category(record.get('category')),
+        clean_notes(record.get('notes')),
+    )
+
+
+def fingerprint(expense_date, amount, category_id, notes):
+    # Only ever compared within one import, so the built-in hash is stable enough
+    return hash((expense_date, round(amount, 2), category_id, (notes or '').strip()))
+
+
+def existing_fingerprints(user_id, page_size=50_000):
+    """
+    Fingerprints of every expense the user already has. Read in short keyset
+    pages rather than one long cursor, so no read holds SQLite's shared lock
+    (which stops other requests committing) for more than a moment.
+    """
+    fingerprints = set()
+    # Table columns keep this a plain Core select, without ORM row processing;
+    # pages follow (date, id) so each one is a range scan of ix_expense_user_date_id
+    expense = Expense.__table__.c
+    stmt = db.select(expense.date, expense.id, expense.amount, expense.category_id, expense.notes).where(
+        expense.user_id == user_id
+    ).order_by(expense.date, expense.id).limit(page_size)
+    page = stmt
+    while True:
+        rows = db.session.execute(page).all()
+        fingerprints.update(fingerprint(row[0], row[2], row[3], row[4]) for row in rows)
+        if len(rows) < page_size:
+            return fingerprints
+        last_date, last_id = rows[-1][0], rows[-1][1]
+        page = stmt.where(db.or_(
+            expense.date > last_date,
+            db.and_(expense.date == last_date, expense.id > last_id)
+        ))
+
+
+def _copy_rows(rows):
+    """Insert rows with PostgreSQL COPY on the session's connection"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row['amount'], row['date'].isoformat(),
+                         row['time'].isoformat() if row['time'] else None,
+                         row['notes'], row['category_id'], row['user_id']])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY expense (amount, date, time, notes, category_id, user_id) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _insert_rows(rows):
+    if db.engine.dialect.name == 'postgresql':
+        _copy_rows(rows)
+    else:
+        db.session.execute(Expense.__table__.insert(), rows)
+
+
+def _import_chunk(user_id, chunk, seen, report):
+    parsed = []
+    for line_number, record in chunk:
+        try:
+            parsed.append(parse_record(record))
+        except ValueError as e:
+            report.add_error(line_number, str(e))
+
+    category_ids = category_registry.get_or_create_many({row[3] for row in parsed}, user_id)
+    rows = []
+    deltas = rollups.new_deltas()
+    for amount, expense_date, expense_time, category, notes in parsed:
+        category_id = category_ids[category]
+        key = fingerprint(expense_date, amount, category_id, notes)
+        if key in seen:
+            report.duplicates += 1
+            continue
+        seen.add(key)
+        rows.append({'amount': amount, 'date': expense_date, 'time': expense_time, 'notes': notes or None,
+                     'category_id': category_id, 'user_id': user_id})
+        rollups.add_delta(deltas, user_id, expense_date, category_id, amount)
+
+    if rows:
+        # Core inserts bypass the ORM hooks, so rollups and the data version are updated here
+        _insert_rows(rows)
+        rollups.apply_deltas(db.session, deltas)
+        data_version.bump(db.session, [user_id])
+    db.session.commit()
+    report.imported += len(rows)
+    report.processed += len(chunk)
+
+
+def iter_import(user_id, text, file_format, chunk_size=CHUNK_SIZE):
+    """
+    Import every record in the text stream ``text`` for the user, committing
+    after each chunk and yielding the running ImportReport after each one.
+    """
+    report = ImportReport()
+    seen = existing_fingerprints(user_id)
+    chunk = []
+    try:
+        for item in read_records(text, file_format):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                _import_chunk(user_id, chunk, seen, report)
+                chunk = []
+                yield report
+        if chunk:
+            _import_chunk(user_id, chunk, seen, report)
+            yield report
+    except (csv.Error, UnicodeDecodeError, OSError, EOFError) as e:
+        # Malformed file (bad quoting, wrong encoding, corrupt gzip): keep the chunks already committed
+        db.session.rollback()
+        report.add_error(report.processed + len(chunk) + 1, f'Could not read file: {str(e)}')
+        yield report
+
+
+def import_expenses(user_id, text, file_format, chunk_size=CHUNK_SIZE, progress=None):
+    """Run a whole import, calling ``progress`` with the report after every chunk. Returns the report."""
+    report = ImportReport()
+    for report in iter_import(user_id, text, file_format, chunk_size):
+        if progress:
+            progress(report)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import expenses from a CSV or JSONL file")
+    parser.add_argument('username')
+    parser.add_argument('file')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: guessed from the file name")
+    args = parser.parse_args(argv)
+
+    file_format = args.format or detect_format(args.file)
+    if not file_format:
+        print("Could not tell the file format from its name; pass --format csv or --format jsonl")
+        return 1
+
+    from app import app
+    from models import User
+
+    with app.app_context():
+        user = User.query.filter_by(username=args.username).first()
+        if not user:
+            print(f"No such user: {args.username}")
+            return 1
+
+        def show_progress(report):
+            print(f"Processed {report.processed:,} rows: {report.imported:,} imported, "
+                  f"{report.duplicates:,} duplicates, {report.error_count:,} errors")
+
+        with open(args.file, 'rb') as binary:
+            report = import_expenses(user.id, open_text(binary, args.file), file_format, progress=show_progress)
+        for error in report.errors:
+            print(f"Line {error['line']}: {error['error']}")
+        if report.error_count > len(report.errors):
+            print(f"... and {report.error_count - len(report.errors)} more errors")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,41 +15,15 @@ load_dotenv(dotenv_path="key.env")
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import app, db
-from models import Category
+import migrations
 
 def init_database():
-    """Initialize the database with tables and default categories"""
+    """Initialize the database by applying all pending schema migrations"""
     try:
         with app.app_context():
-            print("Creating database tables...")
-            db.create_all()
-            print("Database tables created successfully!")
-            
-            # Check if global categories already exist
-            if Category.query.filter_by(user_id=None).count() == 0:
-                print("Creating default categories...")
-                # Create default global categories
-                default_categories = [
-                    "Food",
-                    "Transport",
-                    "Entertainment",
-                    "Bills",
-                    "Shopping",
-                    "Health",
-                    "Education",
-                    "Travel",
-                    "Housing",
-                    "Others"
-                ]
-                
-                for category_name in default_categories:
-                    category = Category(name=category_name, user_id=None)
-                    db.session.add(category)
-                
-                db.session.commit()
-                print(f"Added {len(default_categories)} default categories")
-            else:
-                print("Default categories already exist")
+            print("Applying schema migrations...")
+            applied = migrations.upgrade()
+            print(f"Applied {len(applied)} migration(s)")
             
             print("Database initialization completed successfully!")
             return True
@@ -1,15 +1,45 @@
-from extensions import db
-from app import app
-from models import User, Category, Expense
-
-with app.app_context():
-    db.create_all()
-    default_categories = [
-        Category(name='Food'),
-        Category(name='Transport'),
-        Category(name='Entertainment'),
-        Category(name='Bills'),
-        Category(name='Others')
-    ]
-    db.session.add_all(default_categories)
-    db.session.commit()
+#!/usr/bin/env python3
+"""
+Schema migration runner for the expense tracker.
+
+Usage:
+    python migrate.py              # apply pending migrations (same as "upgrade")
+    python migrate.py status       # list migrations and whether they are applied
+    python migrate.py reset --yes  # drop every table and rebuild from scratch
+"""
+
+import argparse
+import sys
+from app import app, db
+import migrations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations")
+    parser.add_argument('command', nargs='?', default='upgrade', choices=['upgrade', 'status', 'reset'])
+    parser.add_argument('--yes', action='store_true', help="Confirm destructive commands such as reset")
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        if args.command == 'status':
+            for version, description, applied in migrations.status():
+                print(f"[{'x' if applied else ' '}] {version:03d} {description}")
+            return 0
+
+        if args.command == 'reset':
+            if not args.yes:
+                print("Refusing to drop all tables without --yes")
+                return 1
+            db.drop_all()
+            print("Dropped all tables")
+
+        applied = migrations.upgrade()
+        if applied:
+            print(f"Applied {len(applied)} migration(s)")
+        else:
+            print("Database schema is already up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
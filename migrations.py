@@ -0,0 +1,230 @@
+"""
+Versioned schema migrations for the expense tracker.
+
+Each migration is a function registered with a unique, increasing version number.
+Applied versions are recorded in the ``schema_version`` table, so running
+``upgrade()`` on every start-up only executes what a database has not seen yet.
+Migrations must be idempotent (``IF NOT EXISTS`` and friends): two gunicorn
+workers can race on start-up, and a half-applied migration must be safe to re-run.
+"""
+
+from datetime import datetime
+from sqlalchemy import text
+from extensions import db
+from models import Category, Expense, SpendRollup, DataVersion, ExpenseForecast, AIJob, AIUsage, ChatState
+import data_version
+import rollups
+import search
+
+DEFAULT_CATEGORIES = [
+    "Food",
+    "Transport",
+    "Entertainment",
+    "Bills",
+    "Shopping",
+    "Health",
+    "Education",
+    "Travel",
+    "Housing",
+    "Others"
+]
+
+# Arbitrary key for pg_advisory_lock so concurrent workers apply migrations one at a time
+MIGRATION_LOCK_KEY = 73190417
+
+schema_version = db.Table(
+    'schema_version',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(200), nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a migration function under a version number"""
+    def register(func):
+        if any(existing[0] == version for existing in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+
+def create_index(name, table, columns, using=None, unique=False):
+    """
+    Create an index (a unique one with ``unique=True``) if it does not exist yet.
+
+    On PostgreSQL the index is built with CREATE INDEX CONCURRENTLY so writes to the
+    table are not blocked while it builds. That statement cannot run inside a
+    transaction, so it gets its own autocommit connection. A failed concurrent build
+    leaves an INVALID index behind which IF NOT EXISTS would happily skip, so any
+    invalid leftover is dropped first.
+    """
+    method = f' USING {using}' if using else ''
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            invalid = conn.execute(text(
+                "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ), {'name': name}).first()
+            if invalid:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+            conn.execute(text(f'CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table}{method} ({columns})'))
+    else:
+        with db.engine.begin() as conn:
+            conn.execute(text(f'CREATE {kind} IF NOT EXISTS {name} ON {table}{method} ({columns})'))
+
+
+def drop_index(name):
+    """Drop an index if it exists (concurrently on PostgreSQL)"""
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+    else:
+        with db.engine.begin() as conn:
+            conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+
+
+@migration(1, 'Create tables and default global categories')
+def create_tables():
+    db.create_all()
+    if Category.query.filter_by(user_id=None).count() == 0:
+        for category_name in DEFAULT_CATEGORIES:
+            db.session.add(Category(name=category_name, user_id=None))
+        db.session.commit()
+        print(f"Added {len(DEFAULT_CATEGORIES)} default categories")
+
+
+@migration(2, 'Composite indexes for per-user expense and category lookups')
+def add_lookup_indexes():
+    create_index('ix_expense_user_date', 'expense', 'user_id, date DESC')
+    create_index('ix_expense_user_category_date', 'expense', 'user_id, category_id, date')
+    create_index('ix_category_user_name', 'category', 'user_id, name')
+
+
+@migration(3, 'Spend rollup table, backfilled from existing expenses')
+def add_spend_rollups():
+    SpendRollup.__table__.create(db.engine, checkfirst=True)
+    rollups.rebuild()
+
+
+@migration(4, 'Per-user data version counters for response caching')
+def add_data_versions():
+    DataVersion.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(5, 'Extend the per-user date index with id for keyset pagination')
+def add_keyset_index():
+    # (user_id, date DESC, id DESC) serves everything the old index did, so it replaces it
+    create_index('ix_expense_user_date_id', 'expense', 'user_id, date DESC, id DESC')
+    drop_index('ix_expense_user_date')
+
+
+@migration(6, 'Full-text search index over expense notes and category names')
+def add_search_index():
+    search.install()
+    if db.engine.dialect.name == 'postgresql':
+        create_index('ix_expense_search_vector', 'expense', 'search_vector', using='GIN')
+
+
+@migration(7, 'Precomputed expense forecasts')
+def add_expense_forecasts():
+    ExpenseForecast.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(8, 'Background AI job queue')
+def add_ai_jobs():
+    # Creates the table together with its indexes
+    AIJob.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(9, 'Daily OpenAI usage and spend per user')
+def add_ai_usage():
+    AIUsage.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(10, 'Server-side FinMate conversation state')
+def add_chat_state():
+    # The old user.conversation_state and user.last_inputs columns are left in place but no longer used
+    ChatState.__table__.create(db.engine, checkfirst=True)
+
+
+
+@migration(11, 'Merge duplicate user categories and make (user_id, name) unique')
+def add_unique_category_names():
+    # Two workers could both create a user's category before the index existed; keep the oldest row
+    duplicates = db.session.execute(text(
+        "SELECT c.id, k.keep_id, c.user_id FROM category c JOIN ("
+        "  SELECT user_id, name, MIN(id) AS keep_id FROM category"
+        "  WHERE user_id IS NOT NULL GROUP BY user_id, name HAVING COUNT(*) > 1"
+        ") k ON c.user_id = k.user_id AND c.name = k.name AND c.id <> k.keep_id"
+    )).all()
+    users = {user_id for _, _, user_id in duplicates}
+    for duplicate_id, keep_id, _ in duplicates:
+        db.session.execute(
+            db.update(Expense).where(Expense.category_id == duplicate_id).values(category_id=keep_id)
+        )
+    data_version.bump(db.session, users)
+    db.session.commit()
+    for user_id in sorted(users):
+        rollups.rebuild(user_id)
+    if duplicates:
+        db.session.execute(db.delete(Category).where(Category.id.in_([row[0] for row in duplicates])))
+        db.session.commit()
+        print(f"Merged {len(duplicates)} duplicate categories of {len(users)} users")
+    create_index('uq_category_user_name', 'category', 'user_id, name', unique=True)
+    drop_index('ix_category_user_name')
+
+def applied_versions():
+    """Return the set of migration versions already recorded in the database"""
+    schema_version.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        return {row[0] for row in conn.execute(db.select(schema_version.c.version))}
+
+
+def pending_migrations():
+    applied = applied_versions()
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def _record(version, description):
+    with db.engine.begin() as conn:
+        exists = conn.execute(
+            db.select(schema_version.c.version).where(schema_version.c.version == version)
+        ).first()
+        if not exists:
+            conn.execute(schema_version.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+
+
+def upgrade():
+    """Apply all pending migrations in version order. Must run inside an app context."""
+    lock_conn = None
+    if db.engine.dialect.name == 'postgresql':
+        lock_conn = db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        lock_conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+
+    try:
+        applied = []
+        for version, description, func in pending_migrations():
+            print(f"Applying migration {version}: {description}")
+            func()
+            db.session.commit()
+            _record(version, description)
+            applied.append(version)
+        return applied
+    finally:
+        if lock_conn is not None:
+            lock_conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            lock_conn.close()
+
+
+def status():
+    """Return (version, description, applied) for every known migration"""
+    applied = applied_versions()
+    return [(version, description, version in applied) for version, description, _ in MIGRATIONS]
@@ -5,31 +5,11 @@ class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(100), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(200), nullable=False)
+    # Only the login view needs the hash; it undefers it (see user_identity.py)
+    password = db.deferred(db.Column(db.String(200), nullable=False))
     expenses = db.relationship('Expense', backref='user', lazy=True)
     categories = db.relationship('Category', backref='user', lazy=True)
 
-    conversation_state = db.Column(db.String(50), default='initial')
-    last_inputs = db.Column(db.PickleType, default=dict)
-
-    def get_conversation_state(self):
-        return self.conversation_state or "initial"
-
-    def update_conversation_state(self, state):
-        self.conversation_state = state
-        db.session.commit()
-
-    def get_last_input(self, key):
-        if self.last_inputs is None:
-            self.last_inputs = {}
-        return self.last_inputs.get(key)
-
-    def update_last_input(self, key, value):
-        if self.last_inputs is None:
-            self.last_inputs = {}
-        self.last_inputs[key] = value
-        db.session.commit()
-
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -45,3 +25,75 @@ class Expense(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     receipt_path = db.Column(db.String(255), nullable=True)
+
+class SpendRollup(db.Model):
+    """Per-user spend totals by day and by month, maintained on every Expense write (see rollups.py)"""
+    __tablename__ = 'spend_rollup'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    granularity = db.Column(db.String(5), primary_key=True)  # 'day' or 'month'
+    period_start = db.Column(db.Date, primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class DataVersion(db.Model):
+    """Per-user counter bumped on every expense write; response caches key on it (see data_version.py)"""
+    __tablename__ = 'user_data_version'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class ExpenseForecast(db.Model):
+    """A user's precomputed /api/expenses/predict payload (see forecast.py and forecast_job.py)"""
+    __tablename__ = 'expense_forecast'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    base_month = db.Column(db.Date, nullable=False)  # month the forecast was made in
+    data_version = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON, forecast.STORED_MONTHS months ahead
+
+class AIUsage(db.Model):
+    """A user's OpenAI calls, tokens and estimated cost for one (UTC) day (see ai_metering.py)"""
+    __tablename__ = 'ai_usage'
+    day = db.Column(db.Date, primary_key=True)  # first, so totals for a day are a prefix scan
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0 for calls outside a user's request
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cost = db.Column(db.Float, nullable=False, default=0)
+
+class AIJob(db.Model):
+    """A queued OpenAI request, run off the request path by ai_jobs.py and fetched by polling"""
+    __tablename__ = 'ai_job'
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)
+    params = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed, cancelled
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class ChatState(db.Model):
+    """Where a user is in the FinMate add-an-expense conversation (see chat_state.py)"""
+    __tablename__ = 'chat_state'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, autoincrement=False)
+    state = db.Column(db.String(30), nullable=False)
+    amount = db.Column(db.Float)
+    category = db.Column(db.String(100))
+    version = db.Column(db.Integer, nullable=False)  # bumped by every transition, for compare-and-set
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+# Every expense listing filters on user_id and then date (or orders by date), and
+# category filters add category_id in between. Keyset pagination orders by
+# (date DESC, id DESC), so id is the last key of the main index. Index names are kept in sync with
+# the migration that creates them on existing databases (see migrations.py).
+db.Index('ix_expense_user_date_id', Expense.user_id, Expense.date.desc(), Expense.id.desc())
+db.Index('ix_expense_user_category_date', Expense.user_id, Expense.category_id, Expense.date)
+# Unique so concurrent workers cannot create the same user category twice (global rows have NULL user_id)
+db.Index('uq_category_user_name', Category.user_id, Category.name, unique=True)
+db.Index('ix_ai_job_status_created', AIJob.status, AIJob.created_at)
+db.Index('ix_ai_job_user_status', AIJob.user_id, AIJob.status)
+db.Index('ix_chat_state_expires', ChatState.expires_at)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stub server for offline development and load tests.
+
+Answers POST /v1/chat/completions with a canned reply in the real response
+shape, including a ``usage`` block so metering sees token counts. It waits
+--latency seconds plus up to --jitter more before replying, and fails a
+fraction of requests: --error-rate of them with a 500, --rate-limit-rate
+with a 429 and --bad-request-rate with a 400, the way the real API does.
+GET /stats returns the request and error counters.
+
+Point the app (or a benchmark) at it with:
+    OPENAI_API_BASE=http://127.0.0.1:8089/v1 OPENAI_API_KEY=stub python app.py
+
+Usage:
+    python openai_stub.py [--port 8089] [--latency 1.0] [--jitter 0.5] [--error-rate 0.05]
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ("1. Set a weekly limit for your top category and track it. "
+         "2. Move recurring bills to the start of the month. "
+         "3. Cook at home two more nights a week. "
+         "4. Review subscriptions and cancel the ones you do not use. "
+         "5. Put a fixed amount into savings on payday.")
+
+
+def estimate_tokens(text):
+    """Roughly four characters per token, as for English text"""
+    return max(1, len(text) // 4)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = 'OpenAIStub/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            with self.server.lock:
+                self._reply(200, dict(self.server.counters))
+        elif self.path.rstrip('/').endswith('/models'):
+            self._reply(200, {'object': 'list', 'data': [{'id': 'gpt-3.5-turbo', 'object': 'model'}]})
+        else:
+            self._reply(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._reply(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        options = self.server.options
+        with self.server.lock:
+            self.server.counters['requests'] += 1
+        time.sleep(options.latency + random.uniform(0, options.jitter))
+
+        roll = random.random()
+        if roll < options.error_rate:
+            with self.server.lock:
+                self.server.counters['errors'] += 1
+            self._reply(500, {'error': {'message': 'Injected server error', 'type': 'server_error'}})
+            return
+        if roll < options.error_rate + options.rate_limit_rate:
+            with self.server.lock:
+                self.server.counters['rate_limited'] += 1
+            self._reply(429, {'error': {'message': 'Injected rate limit', 'type': 'requests'}})
+            return
+        if roll < options.error_rate + options.rate_limit_rate + options.bad_request_rate:
+            with self.server.lock:
+                self.server.counters['bad_requests'] += 1
+            self._reply(400, {'error': {'message': 'Injected bad request', 'type': 'invalid_request_error'}})
+            return
+
+        max_tokens = int(body.get('max_tokens') or 150)
+        content = REPLY[:max_tokens * 4]
+        prompt_tokens = sum(estimate_tokens(m.get('content', '')) + 4 for m in body.get('messages', []))
+        completion_tokens = estimate_tokens(content)
+        self._reply(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex[:24]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'gpt-3.5-turbo'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop' if len(content) == len(REPLY) else 'length',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        })
+        with self.server.lock:
+            self.server.counters['completed'] += 1
+
+
+def make_server(options, host='127.0.0.1'):
+    server = ThreadingHTTPServer((host, options.port), StubHandler)
+    server.daemon_threads = True
+    server.options = options
+    server.verbose = getattr(options, 'verbose', False)
+    server.lock = threading.Lock()
+    server.counters = {'requests': 0, 'completed': 0, 'errors': 0, 'rate_limited': 0, 'bad_requests': 0}
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Local OpenAI-compatible stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=1.0, help='seconds before every reply')
+    parser.add_argument('--jitter', type=float, default=0.5, help='up to this many extra seconds, uniformly')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction answered with a 429')
+    parser.add_argument('--bad-request-rate', type=float, default=0.0, help='fraction answered with a 400')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    server = make_server(options, options.host)
+    print(f"OpenAI stub listening on http://{options.host}:{options.port}/v1 "
+          f"(latency {options.latency}s + up to {options.jitter}s, "
+          f"errors {options.error_rate:.0%}, rate limits {options.rate_limit_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+Keyset (cursor) pagination for expense listings.
+
+Pages are ordered by (date DESC, id DESC). The cursor is an opaque, URL-safe
+token holding the (date, id) of the last row on the previous page; the next
+page starts strictly after it. With the (user_id, date DESC, id DESC) index
+every page is a bounded index range scan, however deep the client pages.
+"""
+
+import base64
+import json
+from datetime import date
+from extensions import db
+from models import Expense
+
+DEFAULT_MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(expense_date, expense_id):
+    raw = json.dumps([expense_date.isoformat(), expense_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        expense_date, expense_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return date.fromisoformat(expense_date), int(expense_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+
+
+def clamp_limit(limit, max_page_size=DEFAULT_MAX_PAGE_SIZE):
+    """Keep a requested page size between 1 and the server-side maximum"""
+    if limit is None or limit < 1:
+        return 1
+    return min(limit, max_page_size)
+
+
+def paginate(query, limit, cursor=None):
+    """
+    Apply keyset ordering and the cursor to an Expense query.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        query = query.filter(db.or_(
+            Expense.date < after_date,
+            db.and_(Expense.date == after_date, Expense.id < after_id)
+        ))
+    # One extra row tells us whether another page exists
+    rows = query.order_by(Expense.date.desc(), Expense.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].date, rows[-1].id)
@@ -0,0 +1,217 @@
+"""
+Multi-page PDF expense reports.
+
+The report is a platypus document: a title, per-category subtotals computed
+with one GROUP BY, then the expense rows as a series of page-sized LongTables
+with a repeated header row. Rows come from the streamed query in exports.py
+and tables are created only when the layout engine reaches them, so a report
+never holds more than a page or two of rows in memory (ReportLab itself
+keeps each finished page's drawing commands until the file is written). Rows
+have a fixed height (long notes are clipped) which keeps every table exactly
+one page. When matplotlib is installed, the summary also gets a pie chart
+rendered by chart.py.
+"""
+
+import io
+from datetime import date
+from xml.sax.saxutils import escape
+from sqlalchemy import func
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer, PageBreak, Image
+from extensions import db
+from models import Category, Expense
+import chart
+import exports
+
+MARGIN = 36
+FONT = 'Helvetica'
+FONT_SIZE = 8
+HEADER_HEIGHT = 18
+ROW_HEIGHT = 13
+FRAME_PADDING = 12  # platypus frames pad 6pt top and bottom
+COLUMN_WIDTHS = [70, 120, 70, 280]
+CHART_SIZE = (480, 300)  # points; rendered at one pixel per point
+DETAIL_HEADER = ['Date', 'Category', 'Amount', 'Notes']
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, 1), (-1, -1), FONT),
+    ('FONTSIZE', (0, 0), (-1, -1), FONT_SIZE),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('TOPPADDING', (0, 0), (-1, -1), 1),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+    ('ALIGN', (2, 0), (2, -1), 'RIGHT'),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.beige]),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+])
+
+
+class FlowableStream(list):
+    """
+    A list of flowables that refills itself from an iterator.
+
+    Platypus consumes its flowable list from the front (and pushes split
+    remainders back onto it), so keeping only a couple of items buffered lets
+    a document be laid out from a generator.
+    """
+
+    LOOKAHEAD = 2
+
+    def __init__(self, iterable):
+        super().__init__()
+        self._source = iter(iterable)
+
+    def _fill(self):
+        while self._source is not None and list.__len__(self) < self.LOOKAHEAD:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+
+
+def category_totals(user_id, start=None, end=None, category_id=None):
+    """Return [(category name, expense count, total)] largest total first"""
+    name = func.coalesce(Category.name, 'Uncategorized')
+    stmt = db.select(name, func.count(Expense.id), func.sum(Expense.amount)).outerjoin(
+        Category, Category.id == Expense.category_id
+    )
+    stmt = exports.filter_expenses(stmt, user_id, start, end, category_id)
+    return db.session.execute(stmt.group_by(name).order_by(func.sum(Expense.amount).desc())).all()
+
+
+def clip(text, width):
+    """Shorten ``text`` with an ellipsis so it fits in ``width`` points"""
+    text = ' '.join((text or '').split())
+    if len(text) * FONT_SIZE <= width:
+        return text  # no Helvetica glyph is wider than one em
+    if stringWidth(text, FONT, FONT_SIZE) <= width:
+        return text
+    # Nor narrower than about a fifth of an em, so anything past this can never fit
+    text = text[:int(width / (FONT_SIZE * 0.19))]
+    while text and stringWidth(text + '...', FONT, FONT_SIZE) > width:
+        text = text[:-1]
+    return text.rstrip() + '...'
+
+
+def rows_per_page(doc):
+    return int((doc.height - FRAME_PADDING - HEADER_HEIGHT) // ROW_HEIGHT)
+
+
+def detail_table(rows):
+    table = LongTable([DETAIL_HEADER] + rows, colWidths=COLUMN_WIDTHS,
+                      rowHeights=[HEADER_HEIGHT] + [ROW_HEIGHT] * len(rows), repeatRows=1)
+    table.setStyle(TABLE_STYLE)
+    return table
+
+
+def detail_tables(rows, first_page_size, page_size):
+    """Yield one table per page of expense rows"""
+    notes_width = COLUMN_WIDTHS[3] - 12
+    size = first_page_size
+    chunk = []
+    for amount, expense_date, category, notes, _ in rows:
+        chunk.append([
+            expense_date.strftime('%d-%m-%Y'),
+            clip(category or 'Uncategorized', COLUMN_WIDTHS[1] - 12),
+            f"{amount:.2f}",
+            clip(notes, notes_width)
+        ])
+        if len(chunk) == size:
+            yield detail_table(chunk)
+            chunk = []
+            size = page_size
+    if chunk:
+        yield detail_table(chunk)
+
+
+def summary_table(totals):
+    grand_total = sum(total for _, _, total in totals)
+    data = [['Category', 'Expenses', 'Total', 'Share']]
+    for name, count, total in totals:
+        share = total / grand_total * 100 if grand_total else 0
+        data.append([clip(name, 168), count, f"{total:.2f}", f"{share:.1f}%"])
+    data.append(['Total', sum(count for _, count, _ in totals), f"{grand_total:.2f}", '100.0%'])
+    table = LongTable(data, colWidths=[180, 80, 100, 80], repeatRows=1)
+    table.setStyle(TABLE_STYLE)
+    table.setStyle(TableStyle([
+        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+    ]))
+    return table
+
+
+def pie_chart(totals):
+    """The category totals as a pie chart image, from the chart PNG cache"""
+    by_name = {}
+    for name, _, total in totals:
+        by_name[name] = by_name.get(name, 0) + total
+    _, png = chart.render_png('pie', chart.pie_data(by_name), *CHART_SIZE)
+    return Image(io.BytesIO(png), width=CHART_SIZE[0], height=CHART_SIZE[1])
+
+
+def report_flowables(doc, user_id, start=None, end=None, category_id=None):
+    styles = getSampleStyleSheet()
+    yield Paragraph('Expense Report', styles['Title'])
+
+    period = f"{start:%d-%m-%Y} to {end:%d-%m-%Y}" if start and end else 'All dates'
+    category = 'All categories'
+    if category_id:
+        # Only the user's own or a global category; names are user input, so escape them for the markup
+        name = db.session.execute(
+            db.select(Category.name).where(
+                Category.id == category_id,
+                (Category.user_id == user_id) | (Category.user_id == None)
+            )
+        ).scalar()
+        category = name if name is not None else 'Unknown category'
+    scope = f"Period: {period} &nbsp;&nbsp; Category: {escape(category)}"
+    yield Paragraph(scope, styles['Normal'])
+    yield Spacer(1, 12)
+
+    totals = category_totals(user_id, start, end, category_id)
+    if not totals:
+        yield Paragraph('No expenses match this report.', styles['Normal'])
+        return
+    yield Paragraph('Spending by Category', styles['Heading2'])
+    yield summary_table(totals)
+    if chart.available():
+        yield Spacer(1, 12)
+        yield pie_chart(totals)
+
+    # Details start on a fresh page so each page-sized table fills exactly one page
+    yield PageBreak()
+    yield Paragraph('Expenses', styles['Heading2'])
+    rows = exports.expense_rows(user_id, start, end, category_id)
+    page_size = rows_per_page(doc)
+    yield from detail_tables(rows, page_size - 3, page_size)  # the heading takes about three rows
+
+
+def _page_footer(canvas, doc):
+    canvas.saveState()
+    canvas.setFont(FONT, FONT_SIZE)
+    canvas.drawString(MARGIN, MARGIN / 2, f"Generated on {date.today():%d-%m-%Y}")
+    canvas.drawRightString(doc.pagesize[0] - MARGIN, MARGIN / 2, f"Page {doc.page}")
+    canvas.restoreState()
+
+
+def build_report(output, user_id, start=None, end=None, category_id=None):
+    """Write the PDF report for a user's expenses to the file-like ``output``"""
+    doc = SimpleDocTemplate(output, pagesize=letter, title='Expense Report', pageCompression=1,
+                            leftMargin=MARGIN, rightMargin=MARGIN, topMargin=MARGIN, bottomMargin=MARGIN)
+    doc.build(FlowableStream(report_flowables(doc, user_id, start, end, category_id)),
+              onFirstPage=_page_footer, onLaterPages=_page_footer)
+    return output
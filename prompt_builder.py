@@ -0,0 +1,158 @@
+"""
+Prompt templates and token-budgeted prompt rendering for OpenAI requests.
+
+Each template owns its system prompt, instruction, output token limit and
+input token budget, and carries a version that is part of the ai_cache key,
+so bump it whenever the wording or the rendering below changes.
+
+Spending summaries are rendered as a compact pipe-separated table with a
+fixed column order and number format, so equal data always gives the same
+prompt (and the same cache key). When a rendering is over the template's
+input budget, detail is dropped in a fixed order until it fits: first the
+monthly trend is shortened and then removed, then the smallest categories
+are folded into an "Other" row, down to three.
+
+Token counts are estimated locally, with no tokenizer dependency.
+estimate_tokens() approximates the cl100k tokenizer used by the chat
+models, erring slightly high, which is what a budget needs.
+"""
+
+import re
+from collections import namedtuple
+
+MESSAGE_OVERHEAD = 4  # tokens the chat format adds around every message
+REPLY_OVERHEAD = 3  # tokens priming the assistant's reply
+MIN_CATEGORIES = 3
+MONTH_STEPS = (6, 3, 0)  # monthly-trend lengths tried, longest first
+
+_PIECES = re.compile(r'[A-Za-z]+|\d+|[^\sA-Za-z\d]')
+
+Template = namedtuple('Template', 'name version system instruction max_tokens input_budget')
+
+CHAT = Template(
+    name='chat',
+    version=2,
+    system="You are a helpful financial assistant that gives brief, concise advice.",
+    instruction=None,
+    max_tokens=150,
+    input_budget=400,
+)
+
+BUDGET_ADVICE = Template(
+    name='budget_advice',
+    version=2,
+    system="You are a financial advisor. Give personalized budget advice from the spending data.",
+    instruction="Give 3-5 specific, actionable tips to help this user spend less.",
+    max_tokens=300,
+    input_budget=200,
+)
+
+TEMPLATES = {template.name: template for template in (CHAT, BUDGET_ADVICE)}
+
+
+def estimate_tokens(text):
+    """
+    Approximate token count of ``text``: letter runs cost one token per
+    seven letters (rounded up), digit runs one per three digits (as cl100k
+    splits numbers), and other symbols one each. Whitespace is free.
+    """
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        if piece[0].isalpha():
+            tokens += (len(piece) + 6) // 7
+        elif piece[0].isdigit():
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += 1
+    return tokens
+
+
+def estimate_messages(messages):
+    """Approximate prompt tokens of a chat request, formatting overhead included"""
+    return sum(estimate_tokens(message['content']) + MESSAGE_OVERHEAD for message in messages) + REPLY_OVERHEAD
+
+
+def messages(template, content):
+    return [
+        {"role": "system", "content": template.system},
+        {"role": "user", "content": content},
+    ]
+
+
+def _amount(value):
+    return f"{value:.2f}"
+
+
+def _fold(categories, keep):
+    """The ``keep - 1`` largest categories plus an 'Other' row summing the rest"""
+    if len(categories) <= keep:
+        return categories
+    head, tail = categories[:keep - 1], categories[keep - 1:]
+    return head + [('Other', sum(total for _, total, _ in tail), sum(count for _, _, count in tail))]
+
+
+def render_summary(summary, max_categories=None, months=MONTH_STEPS[0]):
+    """
+    A spending summary as compact text. ``summary`` has 'first' and 'last'
+    (dates), 'total', 'count', 'categories' ([(name, total, count)], largest
+    first), 'months' ([(YYYY-MM, total)], oldest first) and optionally 'focus'
+    (the category the advice is about).
+    """
+    categories = summary['categories']
+    if max_categories is not None:
+        categories = _fold(categories, max_categories)
+    total = summary['total']
+    lines = [
+        f"Period: {summary['first'].isoformat()} to {summary['last'].isoformat()}",
+        f"Expenses: {summary['count']}, total {_amount(total)}, "
+        f"average {_amount(total / summary['count'] if summary['count'] else 0)}",
+    ]
+    if summary.get('focus'):
+        lines.append(f"Focus: {summary['focus']}")
+    lines.append("category|total|count|share%")
+    for name, amount, count in categories:
+        share = amount / total * 100 if total else 0
+        lines.append(f"{name}|{_amount(amount)}|{count}|{share:.1f}")
+    recent = summary['months'][-months:] if months else []
+    if recent:
+        lines.append("month|total")
+        lines.extend(f"{month}|{_amount(amount)}" for month, amount in recent)
+    return "\n".join(lines)
+
+
+def budget_advice(summary, template=BUDGET_ADVICE):
+    """
+    (messages, estimated prompt tokens) for budget advice on ``summary``
+    (see render_summary), trimmed to fit ``template.input_budget``. If even
+    the smallest rendering is over budget it is used anyway.
+    """
+    def build(max_categories, months):
+        content = f"{render_summary(summary, max_categories, months)}\n\n{template.instruction}"
+        built = messages(template, content)
+        return built, estimate_messages(built)
+
+    widest = len(summary['categories'])
+    for months in MONTH_STEPS:
+        built, tokens = build(widest, months)
+        if tokens <= template.input_budget:
+            return built, tokens
+    for keep in range(widest - 1, MIN_CATEGORIES - 1, -1):
+        built, tokens = build(keep, 0)
+        if tokens <= template.input_budget:
+            return built, tokens
+    return built, tokens
+
+
+def chat(prompt, template=CHAT):
+    """(messages, estimated prompt tokens) for a free-form question, cut to fit ``template.input_budget``"""
+    prompt = ' '.join(prompt.split())
+    built = messages(template, prompt)
+    tokens = estimate_messages(built)
+    while tokens > template.input_budget and prompt:
+        # Drop words from the end in proportion to the overshoot, then re-check
+        words = prompt.split(' ')
+        cut = max(1, len(words) * (tokens - template.input_budget) // tokens)
+        prompt = ' '.join(words[:-cut])
+        built = messages(template, prompt)
+        tokens = estimate_messages(built)
+    return built, tokens
@@ -0,0 +1,97 @@
+"""
+Per-request SQL statement counter with an N+1 detector.
+
+Enabled when the app is in testing mode or QUERY_COUNT_CHECK is set. Every
+statement executed during a request is counted by its SQL text; an N+1 pattern
+shows up as the same statement (a lazy load, a per-row lookup) repeating once
+per row, so a request where any single statement runs more than
+QUERY_REPEAT_LIMIT times is flagged. In testing mode that raises
+NPlusOneError, otherwise a warning is logged. The total is also reported in
+an X-Query-Count response header.
+
+``count_queries()`` gives scripts and benchmarks the same counter outside a request.
+"""
+
+import logging
+import os
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_REPEAT_LIMIT = 10
+
+log = logging.getLogger(__name__)
+
+_active_counters = []
+
+
+class NPlusOneError(AssertionError):
+    """Raised in testing mode when a request repeats the same statement per row"""
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = Counter()
+
+    @property
+    def total(self):
+        return sum(self.statements.values())
+
+    def most_repeated(self):
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if _active_counters:
+        for counter in _active_counters:
+            counter.statements[statement] += 1
+    if has_request_context():
+        counter = g.get('query_counter')
+        if counter is not None:
+            counter.statements[statement] += 1
+
+
+@contextmanager
+def count_queries():
+    """Count every statement executed inside the block"""
+    counter = QueryCounter()
+    _active_counters.append(counter)
+    try:
+        yield counter
+    finally:
+        _active_counters.remove(counter)
+
+
+def _enabled(app):
+    return app.testing or app.config.get('QUERY_COUNT_CHECK', os.getenv('QUERY_COUNT_CHECK') == '1')
+
+
+def init_app(app):
+    # The hooks are always installed and check the settings per request, so
+    # turning on TESTING after the app is created still enables the counter
+
+    @app.before_request
+    def _start_query_counter():
+        if _enabled(app):
+            g.query_counter = QueryCounter()
+
+    @app.after_request
+    def _check_query_counter(response):
+        counter = g.pop('query_counter', None)
+        if counter is None:
+            return response
+        response.headers['X-Query-Count'] = str(counter.total)
+        limit = app.config.get('QUERY_REPEAT_LIMIT', DEFAULT_REPEAT_LIMIT)
+        statement, repeats = counter.most_repeated()
+        if repeats > limit:
+            message = (f"Possible N+1 query: statement ran {repeats} times in one request "
+                       f"(limit {limit}): {statement[:200]}")
+            if app.testing:
+                raise NPlusOneError(message)
+            log.warning(message)
+        return response
@@ -0,0 +1,234 @@
+"""
+Incrementally maintained spend rollups.
+
+``spend_rollup`` holds one row per (user, granularity, period, category) with the
+sum and count of the matching expenses, for both days and calendar months. A
+session ``after_flush`` hook turns every Expense insert, update and delete into
+deltas and upserts them in the same transaction as the write, so the dashboard
+and analytics read O(categories) rows instead of every expense.
+
+Writes that bypass the ORM unit of work (Core bulk inserts, set-based UPDATE or
+DELETE) must report their changes with ``apply_deltas`` themselves.
+
+Usage:
+    python rollups.py rebuild [--user ID]   # recompute rollups from the expense table
+    python rollups.py check [--user ID]     # report rollups that disagree with expenses
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event, func, inspect, insert, delete
+from extensions import db
+from models import Expense, SpendRollup
+
+GRANULARITIES = ('day', 'month')
+
+# Amounts are floats; allow for rounding drift when comparing sums
+TOLERANCE = 0.005
+
+
+def month_start(value):
+    return value.replace(day=1)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    return value
+
+
+def add_delta(deltas, user_id, expense_date, category_id, amount, sign=1):
+    """Accumulate one expense (sign=1) or its removal (sign=-1) into ``deltas``"""
+    if user_id is None or expense_date is None or category_id is None or amount is None:
+        return
+    expense_date = _as_date(expense_date)
+    amount = float(amount) * sign
+    for granularity, period in (('day', expense_date), ('month', month_start(expense_date))):
+        entry = deltas[(user_id, granularity, period, category_id)]
+        entry[0] += amount
+        entry[1] += sign
+
+
+def new_deltas():
+    return defaultdict(lambda: [0.0, 0])
+
+
+def _upsert_statement(dialect_name):
+    table = SpendRollup.__table__
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    stmt = dialect_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.granularity, table.c.period_start, table.c.category_id],
+        set_={
+            'total': table.c.total + stmt.excluded.total,
+            'count': table.c.count + stmt.excluded.count,
+        },
+    )
+
+
+def apply_deltas(session, deltas):
+    """Upsert accumulated deltas into spend_rollup using the session's current transaction"""
+    rows = [
+        {'user_id': user_id, 'granularity': granularity, 'period_start': period,
+         'category_id': category_id, 'total': total, 'count': count}
+        for (user_id, granularity, period, category_id), (total, count) in deltas.items()
+        if count or abs(total) > 1e-9
+    ]
+    if not rows:
+        return
+
+    table = SpendRollup.__table__
+    stmt = _upsert_statement(session.get_bind().dialect.name)
+    if stmt is not None:
+        session.execute(stmt, rows)
+    else:
+        for row in rows:
+            result = session.execute(
+                table.update()
+                .where(table.c.user_id == row['user_id'], table.c.granularity == row['granularity'],
+                       table.c.period_start == row['period_start'], table.c.category_id == row['category_id'])
+                .values(total=table.c.total + row['total'], count=table.c.count + row['count'])
+            )
+            if result.rowcount == 0:
+                session.execute(table.insert().values(**row))
+
+    # Periods whose last expense went away carry no information
+    user_ids = {row['user_id'] for row in rows}
+    session.execute(delete(table).where(table.c.user_id.in_(user_ids), table.c.count <= 0))
+
+
+def _previous(state, key):
+    """Value an attribute had when it was loaded, ignoring unflushed changes"""
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return state.dict.get(key)
+
+
+TRACKED = ('user_id', 'date', 'category_id', 'amount')
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+# Without active history, assigning to an expired attribute (e.g. after a commit in
+# the middle of update_expense) does not load the old value, and the delta that
+# removes it from its previous period would be lost.
+for _key in TRACKED:
+    event.listen(getattr(Expense, _key), 'set', _load_old_value, active_history=True, retval=True)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_expense_changes(session, flush_context):
+    deltas = new_deltas()
+    for obj in session.new:
+        if isinstance(obj, Expense):
+            add_delta(deltas, obj.user_id, obj.date, obj.category_id, obj.amount)
+    for obj in session.deleted:
+        if isinstance(obj, Expense):
+            state = inspect(obj)
+            add_delta(deltas, *(_previous(state, key) for key in TRACKED), sign=-1)
+    for obj in session.dirty:
+        if isinstance(obj, Expense) and obj not in session.deleted:
+            state = inspect(obj)
+            if any(state.attrs[key].history.has_changes() for key in TRACKED):
+                add_delta(deltas, *(_previous(state, key) for key in TRACKED), sign=-1)
+                add_delta(deltas, obj.user_id, obj.date, obj.category_id, obj.amount)
+    if deltas:
+        apply_deltas(session, deltas)
+
+
+def _month_expr():
+    if db.engine.dialect.name == 'postgresql':
+        return func.cast(func.date_trunc('month', Expense.date), db.Date)
+    return func.date(Expense.date, 'start of month')
+
+
+def _grouped_expenses(granularity, user_id=None):
+    period = Expense.date if granularity == 'day' else _month_expr()
+    query = db.select(
+        Expense.user_id, db.literal(granularity), period, Expense.category_id,
+        func.sum(Expense.amount), func.count(Expense.id),
+    )
+    if user_id is not None:
+        query = query.where(Expense.user_id == user_id)
+    return query.group_by(Expense.user_id, period, Expense.category_id)
+
+
+def rebuild(user_id=None):
+    """Recompute rollups from the expense table for one user, or everyone"""
+    table = SpendRollup.__table__
+    wipe = delete(table)
+    if user_id is not None:
+        wipe = wipe.where(table.c.user_id == user_id)
+    db.session.execute(wipe)
+    columns = ['user_id', 'granularity', 'period_start', 'category_id', 'total', 'count']
+    for granularity in GRANULARITIES:
+        db.session.execute(insert(table).from_select(columns, _grouped_expenses(granularity, user_id)))
+    db.session.commit()
+
+
+def check(user_id=None):
+    """Return a list of (key, expected, actual) tuples where rollups disagree with expenses"""
+    mismatches = []
+    for granularity in GRANULARITIES:
+        expected = {}
+        for uid, _, period, category_id, total, count in db.session.execute(_grouped_expenses(granularity, user_id)):
+            expected[(uid, granularity, _as_date(period), category_id)] = (float(total), count)
+
+        query = SpendRollup.query.filter_by(granularity=granularity)
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        actual = {
+            (r.user_id, granularity, r.period_start, r.category_id): (r.total, r.count) for r in query
+        }
+
+        for key in expected.keys() | actual.keys():
+            want = expected.get(key, (0.0, 0))
+            got = actual.get(key, (0.0, 0))
+            if want[1] != got[1] or abs(want[0] - got[0]) > TOLERANCE:
+                mismatches.append((key, want, got))
+    return mismatches
+
+
+def period_total(user_id, granularity, period):
+    """Total spend for one day or month"""
+    total = db.session.query(func.sum(SpendRollup.total)).filter(
+        SpendRollup.user_id == user_id,
+        SpendRollup.granularity == granularity,
+        SpendRollup.period_start == period,
+    ).scalar()
+    return round(total or 0, 2)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Rebuild or verify spend rollups")
+    parser.add_argument('command', choices=['rebuild', 'check'])
+    parser.add_argument('--user', type=int, help="Limit to one user id")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'rebuild':
+            rebuild(args.user)
+            print("Rollups rebuilt")
+        else:
+            problems = check(args.user)
+            for key, want, got in problems[:50]:
+                print(f"Mismatch {key}: expected total={want[0]:.2f} count={want[1]}, "
+                      f"found total={got[0]:.2f} count={got[1]}")
+            print(f"{len(problems)} mismatched rollup row(s)")
+            sys.exit(1 if problems else 0)
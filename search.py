@@ -0,0 +1,177 @@
+"""
+Indexed keyword search over expense notes and category names.
+
+SQLite: an FTS5 shadow table ``expense_fts`` (rowid = expense.id) kept in sync
+by triggers on expense and category. Each row also carries an ``owner`` token
+so the per-user restriction is answered by the full-text index itself rather
+than by filtering every user's matches afterwards.
+
+PostgreSQL: a ``search_vector`` tsvector column on expense maintained by a
+trigger, with a GIN index (built concurrently by the migration).
+
+Keywords are split into words and every word must match as a prefix
+("gro" finds "groceries"). Matches are ranked with bm25 / ts_rank. If neither
+index is available (FTS5 not compiled in, another database) the search falls
+back to the old ILIKE scan.
+"""
+
+import re
+from sqlalchemy import text, func, literal_column, table
+from sqlalchemy.exc import OperationalError
+from extensions import db
+from models import Category, Expense
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+SQLITE_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS expense_fts USING fts5(notes, category, owner, tokenize='unicode61')",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_insert AFTER INSERT ON expense BEGIN
+        INSERT INTO expense_fts(rowid, notes, category, owner) VALUES (
+            NEW.id, COALESCE(NEW.notes, ''),
+            COALESCE((SELECT name FROM category WHERE id = NEW.category_id), ''),
+            'u' || NEW.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_delete AFTER DELETE ON expense BEGIN
+        DELETE FROM expense_fts WHERE rowid = OLD.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_update AFTER UPDATE OF notes, category_id, user_id ON expense BEGIN
+        DELETE FROM expense_fts WHERE rowid = OLD.id;
+        INSERT INTO expense_fts(rowid, notes, category, owner) VALUES (
+            NEW.id, COALESCE(NEW.notes, ''),
+            COALESCE((SELECT name FROM category WHERE id = NEW.category_id), ''),
+            'u' || NEW.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_category_rename AFTER UPDATE OF name ON category BEGIN
+        UPDATE expense_fts SET category = NEW.name
+        WHERE rowid IN (SELECT id FROM expense WHERE category_id = NEW.id);
+    END""",
+]
+
+SQLITE_BACKFILL = [
+    "DELETE FROM expense_fts",
+    """INSERT INTO expense_fts(rowid, notes, category, owner)
+       SELECT e.id, COALESCE(e.notes, ''), COALESCE(c.name, ''), 'u' || e.user_id
+       FROM expense e LEFT JOIN category c ON c.id = e.category_id""",
+]
+
+POSTGRES_SCHEMA = [
+    "ALTER TABLE expense ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    """CREATE OR REPLACE FUNCTION expense_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector('simple',
+            COALESCE(NEW.notes, '') || ' ' ||
+            COALESCE((SELECT name FROM category WHERE id = NEW.category_id), ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS expense_search_vector_trigger ON expense",
+    """CREATE TRIGGER expense_search_vector_trigger
+       BEFORE INSERT OR UPDATE OF notes, category_id ON expense
+       FOR EACH ROW EXECUTE FUNCTION expense_search_vector_update()""",
+    """CREATE OR REPLACE FUNCTION category_search_vector_refresh() RETURNS trigger AS $$
+    BEGIN
+        UPDATE expense SET category_id = category_id WHERE category_id = NEW.id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS category_search_vector_trigger ON category",
+    """CREATE TRIGGER category_search_vector_trigger
+       AFTER UPDATE OF name ON category
+       FOR EACH ROW EXECUTE FUNCTION category_search_vector_refresh()""",
+]
+
+POSTGRES_BACKFILL = [
+    """UPDATE expense e SET search_vector = to_tsvector('simple',
+           COALESCE(e.notes, '') || ' ' || COALESCE(c.name, ''))
+       FROM category c WHERE c.id = e.category_id AND e.search_vector IS NULL""",
+]
+
+_available = {}
+
+
+def install():
+    """Create the search index, its triggers, and index existing rows. Idempotent."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        try:
+            with db.engine.begin() as conn:
+                for statement in SQLITE_SCHEMA + SQLITE_BACKFILL:
+                    conn.execute(text(statement))
+        except OperationalError as e:
+            print(f"Warning: SQLite FTS5 unavailable, keyword search will scan rows: {str(e)}")
+            return False
+    elif dialect == 'postgresql':
+        with db.engine.begin() as conn:
+            for statement in POSTGRES_SCHEMA + POSTGRES_BACKFILL:
+                conn.execute(text(statement))
+    else:
+        return False
+    _available.pop(dialect, None)
+    return True
+
+
+def available():
+    """Whether the full-text index exists on the current database (checked once per worker)"""
+    dialect = db.engine.dialect.name
+    if dialect not in _available:
+        if dialect == 'sqlite':
+            found = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expense_fts'"
+            )).first()
+        elif dialect == 'postgresql':
+            found = db.session.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'expense' AND column_name = 'search_vector'"
+            )).first()
+        else:
+            found = None
+        _available[dialect] = found is not None
+    return _available[dialect]
+
+
+def words(keyword):
+    return WORD_RE.findall(keyword.lower())
+
+
+def apply_keyword(query, keyword, user_id, ranked=False):
+    """
+    Restrict an Expense query to rows matching ``keyword``.
+
+    Returns (query, rank). With ``ranked`` the rank is a column expression to
+    order by (descending, higher is more relevant); otherwise, and whenever the
+    LIKE fallback was used, it is None. Ranking scores every match, so callers
+    that order by date should leave it off.
+    """
+    terms = words(keyword)
+    if terms and available():
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            # Quoted terms cannot inject FTS5 syntax; the owner filter uses the index too
+            match = 'owner : "u{}" AND {{notes category}} : ({})'.format(
+                int(user_id), ' '.join(f'"{term}"*' for term in terms)
+            )
+            fts = literal_column('expense_fts')
+            rowid = literal_column('rowid')
+            if not ranked:
+                # An IN probe lets SQLite keep walking the (user_id, date, id) index
+                matches = db.select(rowid).select_from(table('expense_fts')).where(fts.op('MATCH')(match))
+                return query.filter(Expense.id.in_(matches)), None
+            matches = db.select(
+                rowid.label('expense_id'),
+                (-func.bm25(fts)).label('rank')
+            ).select_from(table('expense_fts')).where(fts.op('MATCH')(match)).subquery()
+            query = query.join(matches, matches.c.expense_id == Expense.id)
+            return query, matches.c.rank
+
+        vector = literal_column('expense.search_vector')
+        ts_query = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        query = query.filter(vector.op('@@')(ts_query))
+        return query, func.ts_rank(vector, ts_query) if ranked else None
+
+    query = query.join(Category, Category.id == Expense.category_id).filter(
+        db.or_(
+            Expense.notes.ilike(f'%{keyword}%'),
+            Category.name.ilike(f'%{keyword}%')
+        )
+    )
+    return query, None
@@ -610,6 +610,32 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
     
+    // AI tips are generated in the background: poll the queued job until it finishes and
+    // hand back its result in the same shape as an immediate response. Each poll answers at
+    // once (the web workers are sync, so the server never holds a request open), waiting
+    // 1 s between polls and backing off to 2 s
+    function awaitAiJob(data) {
+        if (!data.success || !data.data || !data.data.job) {
+            return data;
+        }
+        const pollUrl = data.data.poll_url;
+        const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+        const poll = delay => sleep(delay)
+            .then(() => fetch(pollUrl))
+            .then(response => response.json())
+            .then(jobData => {
+                if (!jobData.success) {
+                    return jobData;
+                }
+                const job = jobData.data;
+                if (job.status === 'queued' || job.status === 'running') {
+                    return poll(Math.min(delay * 1.5, 2000));
+                }
+                return job.status === 'done' ? { success: true, data: job.result } : { success: false };
+            });
+        return poll(1000);
+    }
+    
     // Get budget tips
     function getBudgetTips() {
         showTypingIndicator();
@@ -620,6 +646,7 @@ document.addEventListener('DOMContentLoaded', function() {
         // Fetch budget tips from our cost-optimized API
         fetch(`/api/budget/tips?use_ai=${useAI}`)
             .then(response => response.json())
+            .then(awaitAiJob)
             .then(data => {
                 removeTypingIndicator();
                 
@@ -696,6 +723,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         fetch(`/api/budget/tips?category=${category}&use_ai=${useAI}`)
             .then(response => response.json())
+            .then(awaitAiJob)
             .then(data => {
                 removeTypingIndicator();
                 
@@ -0,0 +1,79 @@
+"""
+Shared fixtures for the test suite.
+
+Tests never touch the development database: before app.py is imported its
+database URL and log file are pointed at a scratch directory. The ``app``
+fixture turns on testing mode after the import, as a test would.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_scratch = tempfile.mkdtemp(prefix='expense_tests_')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(_scratch, 'test.db')}"
+os.environ['LOG_FILE'] = os.path.join(_scratch, 'app.log')
+os.environ.setdefault('AI_JOB_WORKERS', '0')
+
+
+@pytest.fixture(scope='session')
+def app():
+    import app as app_module
+    app_module.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    yield app_module.app
+    shutil.rmtree(_scratch, ignore_errors=True)
+
+
+@pytest.fixture
+def user(app):
+    """A fresh user with one category of their own; returns (user id, category id)"""
+    from extensions import db
+    from models import User, Category
+    with app.app_context():
+        name = f'test_{uuid.uuid4().hex[:12]}'
+        account = User(username=name, email=f'{name}@example.com', password='x')
+        db.session.add(account)
+        db.session.flush()
+        category = Category(name='Food', user_id=account.id)
+        db.session.add(category)
+        db.session.commit()
+        return account.id, category.id
+
+
+@pytest.fixture
+def client(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user[0])
+        session['_fresh'] = True
+    return client
+
+
+def add_expenses(app, user, count, per_category=5):
+    """
+    Insert ``count`` expenses for ``user``, one per day going back from today,
+    with a new category for every ``per_category`` rows so that a per-row
+    category load shows up as extra queries.
+    """
+    from extensions import db
+    from models import Category, Expense
+    user_id = user[0]
+    today = date.today()
+    with app.app_context():
+        categories = [Category(name=f'Category {uuid.uuid4().hex[:8]}', user_id=user_id)
+                      for _ in range(-(-count // per_category))]
+        db.session.add_all(categories)
+        db.session.flush()
+        db.session.execute(db.insert(Expense), [
+            {'amount': 10.0 + i, 'date': today - timedelta(days=i), 'notes': f'row {i}',
+             'category_id': categories[i // per_category].id, 'user_id': user_id}
+            for i in range(count)
+        ])
+        db.session.commit()
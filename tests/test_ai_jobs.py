@@ -0,0 +1,52 @@
+"""
+Claiming jobs from the ai_job queue, including a claim that races another.
+"""
+
+from datetime import timedelta
+
+from sqlalchemy import event
+
+import ai_jobs
+from extensions import db
+from models import AIJob
+
+
+def running_jobs(user_id):
+    return AIJob.query.populate_existing().filter_by(user_id=user_id, status='running').count()
+
+
+def test_claim_runs_one_job_per_user_at_a_time(app, user):
+    with app.app_context():
+        first = ai_jobs.enqueue(user[0], 'budget_advice', {'category': 'Food'}).id
+        second = ai_jobs.enqueue(user[0], 'budget_advice', {'category': None}).id
+        assert ai_jobs.claim() == first
+        assert ai_jobs.claim() != second
+        assert running_jobs(user[0]) == 1
+
+
+def test_claim_rechecks_the_running_limit_in_the_update(app, user):
+    with app.app_context():
+        first = ai_jobs.enqueue(user[0], 'budget_advice', {'category': 'Food'}).id
+        second = ai_jobs.enqueue(user[0], 'budget_advice', {'category': None}).id
+
+        def other_worker_claims_first(conn, cursor, statement, parameters, context, executemany):
+            # Another worker starts the user's other job between claim()'s SELECT and its UPDATE
+            if statement.startswith('UPDATE ai_job SET status') and not started:
+                started.append(True)
+                conn.connection.cursor().execute(
+                    "UPDATE ai_job SET status = 'running' WHERE id = ?", (first,))
+
+        started = []
+        # Make the second job the oldest, so it is claim()'s candidate
+        jobs = {job.id: job for job in AIJob.query.filter(AIJob.id.in_([first, second]))}
+        jobs[second].created_at = jobs[first].created_at - timedelta(seconds=1)
+        db.session.commit()
+
+        event.listen(db.engine, 'before_cursor_execute', other_worker_claims_first)
+        try:
+            claimed = ai_jobs.claim()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', other_worker_claims_first)
+        assert started
+        assert claimed != second
+        assert running_jobs(user[0]) == 1
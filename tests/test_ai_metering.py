@@ -0,0 +1,45 @@
+"""
+The daily AI spend ceilings checked before every upstream call.
+"""
+
+import pytest
+
+import ai_metering
+import query_counter
+
+
+@pytest.fixture
+def spent(app, user):
+    """The user has spent $0.04 today"""
+    with app.app_context():
+        ai_metering._store(user[0], 0, 100, 50, 0.04)
+        return ai_metering.spent_today(user[0]), ai_metering.spent_today()
+
+
+def check(app, user_id):
+    with app.app_context(), query_counter.count_queries() as counter:
+        ai_metering.check_budget(user_id)
+    return counter.total
+
+
+def test_ceilings_off_cost_no_query(app, user, spent, monkeypatch):
+    monkeypatch.setattr(ai_metering, 'USER_DAILY_BUDGET', 0)
+    monkeypatch.setattr(ai_metering, 'DAILY_BUDGET', 0)
+    assert check(app, user[0]) == 0
+
+
+def test_both_ceilings_are_checked_in_one_query(app, user, spent, monkeypatch):
+    user_spent, all_spent = spent
+    assert user_spent == pytest.approx(0.04)
+    monkeypatch.setattr(ai_metering, 'USER_DAILY_BUDGET', 0.05)
+    monkeypatch.setattr(ai_metering, 'DAILY_BUDGET', all_spent + 1)
+    assert check(app, user[0]) == 1
+
+    monkeypatch.setattr(ai_metering, 'USER_DAILY_BUDGET', 0.04)
+    with pytest.raises(ai_metering.SpendLimitExceeded, match='for user'):
+        check(app, user[0])
+
+    monkeypatch.setattr(ai_metering, 'USER_DAILY_BUDGET', 0.05)
+    monkeypatch.setattr(ai_metering, 'DAILY_BUDGET', all_spent)
+    with pytest.raises(ai_metering.SpendLimitExceeded, match=r'reached$'):
+        check(app, user[0])
@@ -0,0 +1,138 @@
+"""
+The AI resilience layer against the fault-injecting openai_stub.py.
+
+The stub runs in a thread on a free port and the app's OpenAI calls are
+pointed at it. Each test sets the stub's faults and checks what the layer
+does: retries, the circuit breaker, the deadline and the static-tips
+fallback of budget_advice jobs.
+"""
+
+import threading
+import time
+import uuid
+
+import openai
+import pytest
+
+import ai_jobs
+import ai_metering
+import ai_resilience
+import budget_tips
+import openai_integration
+import openai_stub
+import rollups
+from conftest import add_expenses
+
+UNAVAILABLE = "I'm unable to provide AI assistance at the moment."
+
+
+@pytest.fixture(scope='module')
+def stub():
+    options = openai_stub.parse_args(['--port', '0', '--latency', '0', '--jitter', '0'])
+    server = openai_stub.make_server(options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    saved = openai.api_base, openai.api_key
+    openai.api_base = f'http://127.0.0.1:{server.server_address[1]}/v1'
+    openai.api_key = 'stub'
+    yield server
+    openai.api_base, openai.api_key = saved
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def upstream(stub, monkeypatch):
+    """The stub, healthy, with short deadlines and a fresh breaker for the test"""
+    stub.options.latency = 0
+    stub.options.error_rate = stub.options.rate_limit_rate = stub.options.bad_request_rate = 0
+    monkeypatch.setattr(ai_resilience, 'DEADLINE', 1.0)
+    monkeypatch.setattr(ai_resilience, 'ATTEMPT_TIMEOUT', 0.3)
+    monkeypatch.setattr(ai_resilience, 'BACKOFF_BASE', 0.01)
+    monkeypatch.setattr(ai_resilience, 'breaker', ai_resilience.CircuitBreaker(reset_timeout=60))
+    monkeypatch.setattr(ai_metering, 'USER_DAILY_BUDGET', 0)
+    monkeypatch.setattr(ai_metering, 'DAILY_BUDGET', 0)
+    return stub
+
+
+def ask(app, user_id):
+    """get_ai_response with a prompt never seen before, so ai_cache cannot answer it"""
+    with app.app_context():
+        return openai_integration.get_ai_response(f'Prompt {uuid.uuid4().hex}', user_id=user_id)
+
+
+def upstream_requests(stub):
+    with stub.lock:
+        return stub.counters['requests']
+
+
+def test_healthy_upstream_answers(app, user, upstream):
+    answer = ask(app, user[0])
+    assert answer and openai_stub.REPLY.startswith(answer)
+    assert ai_resilience.breaker.state()['state'] == 'closed'
+
+
+def test_breaker_opens_after_threshold_and_then_fails_fast(app, user, upstream):
+    upstream.options.error_rate = 1.0
+    for failed in range(1, ai_resilience.FAILURE_THRESHOLD + 1):
+        assert ai_resilience.breaker.state()['state'] == 'closed'
+        before = upstream_requests(upstream)
+        assert ask(app, user[0]) == UNAVAILABLE
+        # Every failing call used all of its retries
+        assert upstream_requests(upstream) - before == ai_resilience.MAX_RETRIES + 1
+        assert ai_resilience.breaker.state()['consecutive_failures'] == failed
+    assert ai_resilience.breaker.state()['state'] == 'open'
+
+    before = upstream_requests(upstream)
+    start = time.perf_counter()
+    for _ in range(10):
+        assert ask(app, user[0]) == UNAVAILABLE
+    assert time.perf_counter() - start < 0.5
+    assert upstream_requests(upstream) == before
+    assert ai_resilience.breaker.state()['short_circuited'] == 10
+
+
+def test_trial_call_closes_breaker_after_reset_timeout(app, user, upstream, monkeypatch):
+    monkeypatch.setattr(ai_resilience, 'breaker', ai_resilience.CircuitBreaker(reset_timeout=0.2))
+    upstream.options.error_rate = 1.0
+    for _ in range(ai_resilience.FAILURE_THRESHOLD):
+        ask(app, user[0])
+    assert ai_resilience.breaker.state()['state'] == 'open'
+
+    upstream.options.error_rate = 0
+    time.sleep(0.25)
+    assert ai_resilience.breaker.state()['state'] == 'half_open'
+    assert ask(app, user[0]) != UNAVAILABLE
+    assert ai_resilience.breaker.state()['state'] == 'closed'
+
+
+def test_non_retryable_errors_are_not_retried(app, user, upstream):
+    upstream.options.bad_request_rate = 1.0
+    before = upstream_requests(upstream)
+    answer = ask(app, user[0])
+    assert answer not in (UNAVAILABLE, openai_stub.REPLY)
+    assert upstream_requests(upstream) - before == 1
+    # A bad request says nothing about upstream health
+    assert ai_resilience.breaker.state()['consecutive_failures'] == 0
+
+
+def test_hung_upstream_gives_up_within_deadline(app, user, upstream):
+    upstream.options.latency = 5
+    start = time.perf_counter()
+    assert ask(app, user[0]) == UNAVAILABLE
+    assert time.perf_counter() - start < ai_resilience.DEADLINE + 0.3
+
+
+def test_budget_advice_job_falls_back_to_static_tips(app, user, upstream):
+    user_id = user[0]
+    add_expenses(app, user, 30)
+    with app.app_context():
+        rollups.rebuild(user_id)
+    for _ in range(ai_resilience.FAILURE_THRESHOLD):
+        ai_resilience.breaker.record_failure()
+    assert ai_resilience.breaker.state()['state'] == 'open'
+
+    before = upstream_requests(upstream)
+    with app.app_context():
+        result = ai_jobs.HANDLERS['budget_advice'](user_id, {'category': None})
+    assert result == dict(budget_tips.static_tips(None), ai_unavailable=True)
+    assert upstream_requests(upstream) == before
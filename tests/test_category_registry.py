@@ -0,0 +1,67 @@
+"""Creating categories when another worker may have created the same one."""
+
+from sqlalchemy import func
+
+import category_registry
+import migrations
+import rollups
+from conftest import add_expenses
+from extensions import db
+from models import Category, Expense, SpendRollup
+
+
+def rows_named(user_id, name):
+    return db.session.execute(
+        db.select(Category.id).where(Category.user_id == user_id, Category.name == name)
+    ).scalars().all()
+
+
+def create_elsewhere(name, user_id):
+    """Insert a category the way another gunicorn worker would: not through this session"""
+    with db.engine.begin() as conn:
+        return conn.execute(Category.__table__.insert().values(name=name, user_id=user_id)).inserted_primary_key[0]
+
+
+def test_get_or_create_uses_row_another_worker_created(app, user):
+    user_id = user[0]
+    with app.app_context():
+        assert category_registry.resolve('Gym', user_id) is None  # this worker has now cached the miss
+        other_id = create_elsewhere('Gym', user_id)
+        assert category_registry.get_or_create('Gym', user_id) == other_id
+        assert rows_named(user_id, 'Gym') == [other_id]
+
+
+def test_get_or_create_many_mixes_new_and_existing(app, user):
+    user_id = user[0]
+    with app.app_context():
+        category_registry.resolve('Gym', user_id)
+        other_id = create_elsewhere('Gym', user_id)
+        ids = category_registry.get_or_create_many(['Gym', 'Pets'], user_id)
+        db.session.commit()
+        assert ids['Gym'] == other_id
+        assert rows_named(user_id, 'Pets') == [ids['Pets']]
+        # The new category is visible from the cache straight away
+        assert category_registry.resolve('Pets', user_id) == ids['Pets']
+
+
+def test_migration_merges_existing_duplicates(app, user):
+    user_id, keep_id = user
+    add_expenses(app, user, 10)
+    with app.app_context():
+        migrations.drop_index('uq_category_user_name')
+        try:
+            duplicate_id = create_elsewhere('Food', user_id)
+            db.session.execute(db.update(Expense).where(Expense.user_id == user_id).values(category_id=duplicate_id))
+            db.session.commit()
+            rollups.rebuild(user_id)
+        finally:
+            migrations.add_unique_category_names()
+
+        assert rows_named(user_id, 'Food') == [keep_id]
+        assert db.session.execute(
+            db.select(func.count()).where(Expense.user_id == user_id, Expense.category_id == keep_id)
+        ).scalar() == 10
+        assert db.session.execute(
+            db.select(func.count()).where(SpendRollup.category_id == duplicate_id)
+        ).scalar() == 0
+        assert rollups.check(user_id) == []
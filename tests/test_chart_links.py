@@ -0,0 +1,61 @@
+"""Signed chart-image links, for emails: they work without a session and cannot be forged."""
+
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+import pytest
+from itsdangerous import BadSignature
+
+import chart
+import rollups
+from conftest import add_expenses
+
+pytestmark = pytest.mark.skipif(not chart.available(), reason='chart images need matplotlib')
+
+
+def add_charted_expenses(app, user, count):
+    # Charts are drawn from the rollups, which add_expenses' bulk insert does not maintain
+    add_expenses(app, user, count)
+    with app.app_context():
+        rollups.rebuild(user[0])
+
+
+def signed_path(app, user_id, kind='pie', **params):
+    import app as app_module
+    with app.test_request_context():
+        url = urlsplit(app_module.chart_image_url(user_id, kind, **params))
+    return f'{url.path}?{url.query}'
+
+
+def test_signed_link_loads_without_session_and_matches_logged_in_chart(app, user, client):
+    add_charted_expenses(app, user, 20)
+    path = signed_path(app, user[0])
+
+    anonymous = app.test_client().get(path)
+    assert anonymous.status_code == 200
+    assert anonymous.mimetype == 'image/png'
+    assert anonymous.get_data() == client.get('/charts/pie.png').get_data()
+
+
+def test_signed_link_carries_the_filter(app, user, client):
+    add_charted_expenses(app, user, 20)
+    start, end = (date.today() - timedelta(days=5)).strftime('%d-%m-%Y'), date.today().strftime('%d-%m-%Y')
+    path = signed_path(app, user[0], kind='pie', start_date=start, end_date=end)
+    signed = app.test_client().get(path)
+    assert signed.status_code == 200
+    assert signed.get_data() == client.get(f'/charts/pie.png?start_date={start}&end_date={end}').get_data()
+    assert signed.get_data() != client.get('/charts/pie.png').get_data()
+
+
+def test_tampered_or_expired_links_are_refused(app, user):
+    path = signed_path(app, user[0])
+    assert app.test_client().get(path[:-2] + 'xx').status_code == 403
+
+    token = chart.sign_params(app.config['SECRET_KEY'], user[0])
+    with pytest.raises(BadSignature):
+        chart.load_params(app.config['SECRET_KEY'], token, max_age=-1)
+
+
+def test_without_token_or_session_login_is_required(app):
+    response = app.test_client().get('/charts/pie.png')
+    assert response.status_code in (302, 401)
@@ -0,0 +1,73 @@
+"""FinMate expense parsing, on the benchmark corpus and end to end through /finmate."""
+
+import json
+import os
+from datetime import date
+
+import pytest
+
+import finmate_parser
+from extensions import db
+from models import Expense
+
+TODAY = date(2026, 3, 13)
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'benchmarks', 'finmate_corpus.jsonl')
+
+with open(CORPUS, encoding='utf-8') as corpus:
+    UTTERANCES = [json.loads(line) for line in corpus if line.strip()]
+
+
+def parsed(text):
+    return [[expense.amount, expense.category, expense.date and expense.date.isoformat()]
+            for expense in finmate_parser.parse(text, TODAY)]
+
+
+@pytest.mark.parametrize('utterance', UTTERANCES, ids=[u['text'] for u in UTTERANCES])
+def test_corpus(utterance):
+    assert parsed(utterance['text']) == utterance['expenses']
+
+
+@pytest.mark.parametrize('text, expenses', [
+    # Currency markers only outrank bare numbers within their own clause
+    ('₹200 food and 50 transport', [[200.0, 'Food', '2026-03-13'], [50.0, 'Transport', '2026-03-13']]),
+    ('₹600 dinner for 3 people', [[600.0, 'Food', '2026-03-13']]),
+    # The number after a price word is the price, not the quantity before it
+    ('lunch for 2 cost 400', [[400.0, 'Food', '2026-03-13']]),
+    ('lunch for 2 cost me 400', [[400.0, 'Food', '2026-03-13']]),
+    # Without an explicit amount, the last number after a weak price word, else the last number
+    ('bought 3 movie tickets for 600', [[600.0, 'Entertainment', '2026-03-13']]),
+    ('paid 350 for 2 movies', [[350.0, 'Entertainment', '2026-03-13']]),
+    ('dinner with 4 friends 2000', [[2000.0, 'Food', '2026-03-13']]),
+    # A date that does not exist is left for the chat to ask about, not replaced by today
+    ('spent 200 on food on 31-02-2026 and 50 on transport today',
+     [[200.0, 'Food', None], [50.0, 'Transport', '2026-03-13']]),
+    ('what did I spend on food?', []),
+])
+def test_clause_rules(text, expenses):
+    assert parsed(text) == expenses
+
+
+def test_finmate_stores_every_expense_in_the_message(app, user, client):
+    response = client.post('/finmate', json={'input': '₹200 food and 50 transport'})
+    assert response.status_code == 200
+    assert '₹50.0 Transport' in response.get_json()['response']
+    with app.app_context():
+        stored = db.session.execute(
+            db.select(Expense.amount).where(Expense.user_id == user[0]).order_by(Expense.amount)
+        ).scalars().all()
+    assert stored == [50.0, 200.0]
+
+
+def test_finmate_asks_for_a_date_that_does_not_exist(app, user, client):
+    response = client.post('/finmate', json={'input': 'spent 200 on food on 31-02-2026'})
+    assert "doesn't exist" in response.get_json()['response']
+    with app.app_context():
+        assert not db.session.execute(db.select(Expense.id).where(Expense.user_id == user[0])).first()
+
+    response = client.post('/finmate', json={'input': '28-02-2026'})
+    assert 'Expense added successfully' in response.get_json()['response']
+    with app.app_context():
+        stored = db.session.execute(
+            db.select(Expense.amount, Expense.date).where(Expense.user_id == user[0])).all()
+    assert stored == [(200.0, date(2026, 2, 28))]
@@ -0,0 +1,47 @@
+"""The PDF report header shows the requested category safely and only if the user may see it."""
+
+import io
+
+import pdf_report
+from extensions import db
+from models import Category, User
+
+
+def report_scope(app, user_id, category_id):
+    with app.app_context():
+        flowables = pdf_report.report_flowables(None, user_id, category_id=category_id)
+        next(flowables)  # title
+        return next(flowables).text
+
+
+def make_category(app, name, user_id):
+    with app.app_context():
+        category = Category(name=name, user_id=user_id)
+        db.session.add(category)
+        db.session.commit()
+        return category.id
+
+
+def test_category_name_is_escaped(app, user):
+    user_id = user[0]
+    category_id = make_category(app, 'a<b & c', user_id)
+    assert 'Category: a&lt;b &amp; c' in report_scope(app, user_id, category_id)
+
+    with app.app_context():
+        buffer = io.BytesIO()
+        pdf_report.build_report(buffer, user_id, category_id=category_id)
+    assert buffer.getvalue().startswith(b'%PDF')
+
+
+def test_other_users_category_is_not_shown(app, user):
+    with app.app_context():
+        other = User(username='pdf_other', email='pdf_other@example.com', password='x')
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+    private = make_category(app, 'Private medical', other_id)
+    shared = make_category(app, 'Shared', None)
+
+    assert 'Private medical' not in report_scope(app, user[0], private)
+    assert 'Unknown category' in report_scope(app, user[0], private)
+    assert 'Category: Shared' in report_scope(app, user[0], shared)
@@ -0,0 +1,144 @@
+"""
+Pinned token estimates for representative users.
+
+PROFILES are synthetic spending summaries. A change to the templates, the
+rendering or the estimator that moves a pinned number fails here: update
+PINNED and bump the template's version, so ai_cache does not serve answers
+given to the old prompts. benchmarks/bench_prompts.py compares the same
+profiles with the old dict-repr prompt.
+"""
+
+from datetime import date
+
+import pytest
+
+import prompt_builder
+
+
+def month_labels(count, last=(2026, 3)):
+    year, month = last
+    labels = []
+    for _ in range(count):
+        labels.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return labels[::-1]
+
+
+def profile(categories, months, focus=None):
+    total = sum(amount for _, amount, _ in categories)
+    return {
+        'first': date(2026 - (months - 1) // 12, 1, 3),
+        'last': date(2026, 3, 28),
+        'total': total,
+        'count': sum(count for _, _, count in categories),
+        'categories': sorted(categories, key=lambda item: (-item[1], item[0])),
+        'months': [(label, round(total / months * (0.8 + 0.05 * (i % 7)), 2))
+                   for i, label in enumerate(month_labels(min(months, 6)))],
+        'focus': focus,
+    }
+
+
+PROFILES = {
+    'new user': profile([('Food', 312.5, 8)], 1),
+    'typical': profile([('Food', 5000.0, 120), ('Transport', 3000.5, 80), ('Bills', 2000.0, 12),
+                        ('Shopping', 1345.18, 60), ('Health', 1000.0, 49)], 15),
+    'many categories': profile([(f'Category {i}', 9000.0 / (i + 1), 40 - i) for i in range(25)], 36),
+    'long names': profile([(f'Subscription services and memberships {i}', 2500.0 - 97 * i, 30 + i)
+                           for i in range(18)], 36),
+    'category focus': profile([('Food', 5000.0, 120)], 15, focus='Food'),
+}
+
+# Estimated prompt tokens of prompt_builder.budget_advice() per profile
+PINNED = {
+    'new user': 106,
+    'typical': 198,
+    'many categories': 195,
+    'long names': 192,
+    'category focus': 151,
+}
+
+
+def category_rows(content):
+    _, _, rest = content.partition('category|total|count|share%\n')
+    rows = rest.split('\n\n')[0].split('month|total')[0].strip().split('\n')
+    return [row.split('|')[0] for row in rows]
+
+
+@pytest.mark.parametrize('name', PROFILES)
+def test_budget_advice_estimates_are_pinned(name):
+    messages, tokens = prompt_builder.budget_advice(PROFILES[name])
+    assert tokens == PINNED[name]
+    assert tokens <= prompt_builder.BUDGET_ADVICE.input_budget
+    assert tokens == prompt_builder.estimate_messages(messages)
+
+
+@pytest.mark.parametrize('text, tokens', [
+    ('', 0),
+    ('Food|5000.00|120|31.2', 12),
+    ('Subscription services and memberships', 7),
+    ('2026-03-28', 6),
+    ('category|total|count|share%', 9),
+])
+def test_estimate_tokens_is_pinned(text, tokens):
+    assert prompt_builder.estimate_tokens(text) == tokens
+
+
+def test_rendering_is_stable():
+    summary = PROFILES['typical']
+    assert prompt_builder.budget_advice(summary) == prompt_builder.budget_advice(dict(summary))
+
+
+def test_small_summaries_keep_every_category_and_the_trend():
+    content = prompt_builder.budget_advice(PROFILES['typical'])[0][1]['content']
+    assert category_rows(content) == ['Food', 'Transport', 'Bills', 'Shopping', 'Health']
+    assert 'month|total' in content
+
+
+def test_large_summaries_drop_the_trend_then_fold_into_other():
+    summary = PROFILES['many categories']
+    content = prompt_builder.budget_advice(summary)[0][1]['content']
+    assert 'month|total' not in content
+    names = category_rows(content)
+    assert names == [f'Category {i}' for i in range(len(names) - 1)] + ['Other']
+
+    # The Other row carries everything that was folded, so totals still add up
+    kept = {name: total for name, total, _ in summary['categories']}
+    other = sum(total for name, total, _ in summary['categories'] if name not in names)
+    assert f"Other|{other:.2f}|" in content
+    assert sum(kept[name] for name in names[:-1]) + other == pytest.approx(summary['total'])
+
+
+def test_folding_stops_at_min_categories_even_over_budget():
+    template = prompt_builder.BUDGET_ADVICE._replace(input_budget=10)
+    messages, tokens = prompt_builder.budget_advice(PROFILES['long names'], template)
+    assert tokens > template.input_budget
+    assert len(category_rows(messages[1]['content'])) == prompt_builder.MIN_CATEGORIES
+
+
+def test_fold_keeps_largest_and_sums_the_rest():
+    categories = [('A', 50.0, 5), ('B', 30.0, 3), ('C', 15.0, 2), ('D', 5.0, 1)]
+    assert prompt_builder._fold(categories, 4) == categories
+    assert prompt_builder._fold(categories, 3) == [('A', 50.0, 5), ('B', 30.0, 3), ('Other', 20.0, 3)]
+
+
+def test_chat_keeps_short_prompts_whole():
+    messages, tokens = prompt_builder.chat("How do I  save\n on groceries?")
+    assert messages[1]['content'] == "How do I save on groceries?"
+    assert tokens == prompt_builder.estimate_messages(messages)
+
+
+def test_chat_truncates_long_prompts_to_budget():
+    words = [f'word{i}' for i in range(2000)]
+    messages, tokens = prompt_builder.chat(' '.join(words))
+    content = messages[1]['content']
+    assert tokens <= prompt_builder.CHAT.input_budget
+    assert tokens == prompt_builder.estimate_messages(messages)
+    assert ' '.join(words).startswith(content)
+    # Words are cut in proportion to the overshoot, so most of the budget is still used
+    assert tokens > 0.75 * prompt_builder.CHAT.input_budget
+
+
+def test_chat_with_tiny_budget_empties_the_prompt():
+    template = prompt_builder.CHAT._replace(input_budget=1)
+    messages, _ = prompt_builder.chat("a b c d e f g", template)
+    assert messages[1]['content'] == ''
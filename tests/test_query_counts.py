@@ -0,0 +1,58 @@
+"""Listing paths must run a fixed number of queries however many rows they return."""
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+import query_counter
+from conftest import add_expenses
+
+
+def export_queries(client):
+    # The CSV body streams after the response is returned, so count around reading it
+    with query_counter.count_queries() as counter:
+        response = client.get('/export_csv')
+        body = response.get_data()
+    assert response.status_code == 200
+    return counter.total, body.count(b'\n') - 1
+
+
+def api_queries(client):
+    response = client.get('/api/expenses?limit=100')
+    assert response.status_code == 200
+    return int(response.headers['X-Query-Count']), len(response.get_json()['data'])
+
+
+@pytest.mark.parametrize('measure, page', [(export_queries, 300), (api_queries, 100)])
+def test_query_count_does_not_grow_with_rows(app, user, client, measure, page):
+    add_expenses(app, user, 10)
+    measure(client)  # warm-up: the first request also loads the user
+    small, rows = measure(client)
+    assert rows == 10
+
+    add_expenses(app, user, 290)
+    large, rows = measure(client)
+    assert rows == page
+    assert large == small
+
+
+def test_counter_enabled_when_testing_is_turned_on_after_import(app, client):
+    assert app.testing
+    assert 'X-Query-Count' in client.get('/api/expenses').headers
+
+
+def test_repeated_statement_fails_in_testing_mode():
+    scratch = Flask('n_plus_one')
+    query_counter.init_app(scratch)
+    scratch.config['TESTING'] = True
+    engine = create_engine('sqlite://')
+
+    @scratch.route('/')
+    def per_row():
+        with engine.connect() as connection:
+            for _ in range(query_counter.DEFAULT_REPEAT_LIMIT + 1):
+                connection.execute(text('SELECT 1'))
+        return 'ok'
+
+    with pytest.raises(query_counter.NPlusOneError):
+        scratch.test_client().get('/')
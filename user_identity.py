@@ -0,0 +1,96 @@
+"""
+Lean user loading for Flask-Login.
+
+The login manager's user_loader runs on every authenticated request, and
+almost every request only needs ``current_user.id``. ``load()`` therefore
+reads just the id and username (no ORM entity, no identity map entry) and
+returns an Identity, a plain UserMixin. Flask-Login keeps it for the rest
+of the request, so the loader runs at most once per request. The User
+model defers its password column, so code that does load full User rows
+only reads the hash where it is checked (the login view undefers it).
+
+Identities are also cached per worker for USER_CACHE_TTL seconds (default
+30; 0 turns the cache off), in a bounded LRU. Updating or deleting a User
+through the ORM drops its entry, in this worker right away and in others
+within the TTL.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event
+from extensions import db
+from models import User
+
+CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 30))  # seconds
+MAX_CACHED_USERS = 4096
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # user_id -> (loaded_at, Identity)
+_generation = 0  # bumped by invalidate(), so a load racing an invalidation is not cached
+
+
+class Identity(UserMixin):
+    """The authenticated user as far as request handling needs it"""
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    def __repr__(self):
+        return f'<Identity {self.id} {self.username!r}>'
+
+
+def _fetch(user_id):
+    row = db.session.execute(
+        db.select(User.id, User.username).where(User.id == user_id)
+    ).first()
+    return Identity(row.id, row.username) if row else None
+
+
+def load(user_id):
+    """Identity for a user id from the session cookie, or None if there is no such user"""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    if CACHE_TTL <= 0:
+        return _fetch(user_id)
+
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry and now - entry[0] < CACHE_TTL:
+            _entries.move_to_end(user_id)
+            return entry[1]
+        generation = _generation
+
+    identity = _fetch(user_id)
+    with _lock:
+        # Unknown ids are not cached: the user may be about to be created
+        if identity is not None and generation == _generation:
+            _entries[user_id] = (now, identity)
+            _entries.move_to_end(user_id)
+            while len(_entries) > MAX_CACHED_USERS:
+                _entries.popitem(last=False)
+    return identity
+
+
+def invalidate(user_id=None):
+    """Drop the cached identity of one user, or of everyone"""
+    global _generation
+    with _lock:
+        _generation += 1
+        if user_id is None:
+            _entries.clear()
+        else:
+            _entries.pop(user_id, None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _drop_changed_users(session, flush_context):
+    for obj in session.dirty | session.deleted:
+        if isinstance(obj, User):
+            invalidate(obj.id)